@@ -237,6 +237,90 @@ CREATE TABLE fraudes_detectadas (
         REFERENCES administradores(id) ON DELETE SET NULL
 ) ENGINE=InnoDB;
 
+/* ================================================================
+   12.1) Totais por turno – acumulador incremental da regra #01
+   ================================================================ */
+CREATE TABLE totais_turno (
+    user_id       INT                 NOT NULL,
+    inicio_turno  DATETIME            NOT NULL,   -- 06:00 (dia) ou 23:00 (noite)
+    turno         ENUM('dia','noite') NOT NULL,
+    total         DECIMAL(15,2)       NOT NULL DEFAULT 0,
+    atualizado_em DATETIME            DEFAULT CURRENT_TIMESTAMP
+                                      ON UPDATE CURRENT_TIMESTAMP,
+
+    PRIMARY KEY (user_id, inicio_turno),
+    CONSTRAINT fk_tturno_user FOREIGN KEY (user_id)
+        REFERENCES usuarios(id) ON DELETE CASCADE
+) ENGINE=InnoDB;
+
+/* ================================================================
+   12.2) Posição do stream – high-water mark de stream_transacoes.py
+   ================================================================ */
+CREATE TABLE posicao_stream (
+    consumidor    VARCHAR(50) PRIMARY KEY,
+    ultimo_id     INT         NOT NULL DEFAULT 0,   -- maior transacoes.id já processado
+    atualizado_em DATETIME    DEFAULT CURRENT_TIMESTAMP
+                              ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB;
+
+/* Ids faltantes abaixo de uma posição (INSERT confirmado fora de ordem),
+   procurados de novo a cada volta por features_usuario.acompanhar */
+CREATE TABLE lacunas_stream (
+    consumidor    VARCHAR(50) NOT NULL,
+    id            INT         NOT NULL,
+    visto_em      DATETIME    NOT NULL,
+
+    PRIMARY KEY (consumidor, id)
+) ENGINE=InnoDB;
+
+/* ================================================================
+   12.3) Features por usuário – agregados mantidos por features_usuario.py
+   ================================================================ */
+CREATE TABLE features_usuario (
+    user_id           INT            PRIMARY KEY,
+    qtd_transacoes    INT            NOT NULL DEFAULT 0,
+    valor_transacoes  DECIMAL(15,2)  NOT NULL DEFAULT 0,
+    qtd_suspeitas     INT            NOT NULL DEFAULT 0,
+    valor_suspeitas   DECIMAL(15,2)  NOT NULL DEFAULT 0,
+    tentativas_limite INT            NOT NULL DEFAULT 0,
+    bloqueios         INT            NOT NULL DEFAULT 0,
+    desbloqueios      INT            NOT NULL DEFAULT 0,
+    edicoes_perfil    INT            NOT NULL DEFAULT 0,
+    alteracoes_senha  INT            NOT NULL DEFAULT 0,
+    total_compras     DECIMAL(15,2)  NOT NULL DEFAULT 0,
+    atualizado_em     DATETIME       DEFAULT CURRENT_TIMESTAMP
+                                     ON UPDATE CURRENT_TIMESTAMP,
+
+    CONSTRAINT fk_feat_user FOREIGN KEY (user_id)
+        REFERENCES usuarios(id) ON DELETE CASCADE
+) ENGINE=InnoDB;
+
+/* ================================================================
+   12.4) Chaves de idempotência – respostas do POST /transacoes/
+         (idempotencia.py, com FORSAKENSCAN_IDEMPOTENCIA_DB=1)
+   ================================================================ */
+CREATE TABLE chaves_idempotencia (
+    rota          VARCHAR(50)   NOT NULL,
+    chave         VARCHAR(255)  NOT NULL,   -- header Idempotency-Key
+    impressao     CHAR(64)      NOT NULL,   -- sha256 do corpo da requisição
+    resposta      TEXT          NULL,       -- JSON devolvido na primeira vez (NULL: em andamento)
+    reserva       CHAR(32)      NULL,       -- token do worker que processa a chave
+    criado_em     DATETIME      NOT NULL,
+
+    PRIMARY KEY (rota, chave),
+    INDEX idx_idem_criado (criado_em)
+) ENGINE=InnoDB;
+
+/* ================================================================
+   12.5) Versão dos limites – sinal entre processos para o cache de
+         limites do motor (fraude.publicar_limites)
+   ================================================================ */
+CREATE TABLE versao_limites (
+    id            TINYINT   PRIMARY KEY,    -- linha única: 1
+    versao        BIGINT    NOT NULL,       -- +1 a cada gravação em limites_usuario
+    atualizado_em DATETIME  NOT NULL
+) ENGINE=InnoDB;
+
 /* ================================================================
    13) SELECTS
    ================================================================ */
@@ -0,0 +1,182 @@
+"""
+auditoria.py – fila write-behind das escritas de auditoria do motor
+===================================================================
+
+`fraudes_detectadas` e `tentativas_limite` não precisam estar gravadas
+antes da resposta de POST /transacoes/. O motor apenas enfileira a linha
+(com o instante real do evento) e uma thread escritora grava em lote –
+um `executemany` por tabela e um único commit – quando junta LOTE_MAX
+linhas ou quando a mais antiga espera INTERVALO_SEG.
+
+A fila é limitada (TAMANHO_FILA): se estiver cheia, enfileirar() devolve
+False e quem chamou grava a linha na hora. No encerramento do processo
+(atexit) descarregar() grava tudo o que ainda estiver pendente.
+
+Quando o motor recebe a conexão de quem chamou (unidade de trabalho, ver
+fraude.avaliar_transacao(con=…)) as linhas não passam pela fila: gravar_em()
+as escreve na transação dessa conexão, confirmadas pelo commit dela.
+"""
+import atexit
+import queue
+from threading import Event, Lock, Thread
+from time import monotonic, sleep
+
+import metricas
+from db import get_pooled_conn
+
+TAMANHO_FILA = 10_000   # linhas pendentes, no máximo
+LOTE_MAX = 500          # linhas por gravação
+INTERVALO_SEG = 0.5     # espera máxima de uma linha na fila
+ESPERA_FILA_SEG = 0.05  # quanto enfileirar() espera por espaço na fila cheia
+TENTATIVAS = 3
+
+SQL = {
+    "tentativas_limite": """
+        INSERT INTO tentativas_limite
+        (user_id, valor_tentativa, limite, turno, data_hora)
+        VALUES (%s, %s, %s, %s, %s)
+    """,
+    "fraudes_detectadas": """
+        INSERT INTO fraudes_detectadas
+        (transacao_id, motivos, data_deteccao)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+        motivos = VALUES(motivos),
+        data_deteccao = VALUES(data_deteccao)
+    """,
+}
+
+# ------------------------------------------------------------------
+# Estado do processo
+# ------------------------------------------------------------------
+_fila = queue.Queue(maxsize=TAMANHO_FILA)
+_parar = Event()
+_escritor = None
+_escritor_lock = Lock()
+_contadores = {"gravadas": 0, "lotes": 0, "descartadas": 0}
+
+
+def _iniciar() -> None:
+    """Sobe a thread escritora na primeira escrita (ou após descarregar)"""
+    global _escritor
+    with _escritor_lock:
+        if _escritor is None or not _escritor.is_alive():
+            _parar.clear()
+            _escritor = Thread(target=_laco, name="auditoria", daemon=True)
+            _escritor.start()
+
+
+def enfileirar(tabela: str, linha: tuple, espera: float = ESPERA_FILA_SEG) -> bool:
+    """
+    Agenda a gravação de uma linha em `tabela` (chave de SQL).
+    Devolve False se a fila continuar cheia após `espera` segundos.
+    """
+    _iniciar()
+    try:
+        _fila.put((tabela, linha), timeout=espera)
+        return True
+    except queue.Full:
+        return False
+
+
+def gravar_em(con, itens: list) -> None:
+    """
+    Grava itens (tabela, linha) na conexão de quem chamou, sem commit: as
+    linhas entram na mesma transação da unidade de trabalho (ex.: requisição
+    do backend) e são confirmadas pelo commit dela.
+    """
+    por_tabela = {}
+    for tabela, linha in itens:
+        por_tabela.setdefault(tabela, []).append(linha)
+    cur = con.cursor()
+    try:
+        with metricas.medir_sql("auditoria_transacao"):
+            for tabela, linhas in por_tabela.items():
+                cur.executemany(SQL[tabela], linhas)
+    finally:
+        cur.close()
+
+
+def gravar(itens: list) -> None:
+    """
+    Grava itens (tabela, linha) com um executemany por tabela e um único
+    commit, em uma conexão do pool. Tenta TENTATIVAS vezes antes de descartar.
+    """
+    por_tabela = {}
+    for tabela, linha in itens:
+        por_tabela.setdefault(tabela, []).append(linha)
+
+    for tentativa in range(1, TENTATIVAS + 1):
+        con = None
+        try:
+            con = get_pooled_conn()
+            cur = con.cursor()
+            with metricas.medir_sql("auditoria_lote"):
+                for tabela, linhas in por_tabela.items():
+                    cur.executemany(SQL[tabela], linhas)
+                con.commit()
+            cur.close()
+            _contadores["gravadas"] += len(itens)
+            _contadores["lotes"] += 1
+            return
+        except Exception as e:
+            print(f"Erro ao gravar auditoria (tentativa {tentativa}): {str(e)}")
+            try:
+                if con is not None:
+                    con.rollback()
+            except Exception:
+                pass
+            sleep(0.1 * tentativa)
+        finally:
+            if con is not None:
+                con.close()
+
+    _contadores["descartadas"] += len(itens)
+    print(f"Erro ao gravar auditoria: {len(itens)} linhas descartadas")
+
+
+def _proximo(ate: float):
+    """Próximo item da fila até o instante `ate` (sem esperar se encerrando)"""
+    restante = ate - monotonic()
+    if _parar.is_set() or restante <= 0:
+        return _fila.get_nowait()
+    return _fila.get(timeout=restante)
+
+
+def _laco() -> None:
+    """Thread escritora: junta até LOTE_MAX linhas ou INTERVALO_SEG e grava"""
+    while not (_parar.is_set() and _fila.empty()):
+        try:
+            itens = [_fila.get(timeout=INTERVALO_SEG)]
+        except queue.Empty:
+            continue
+        ate = monotonic() + INTERVALO_SEG
+        while len(itens) < LOTE_MAX:
+            try:
+                itens.append(_proximo(ate))
+            except queue.Empty:
+                break
+        gravar(itens)
+
+
+def descarregar(timeout: float = 10.0) -> None:
+    """Grava tudo o que está pendente e encerra a thread escritora"""
+    _parar.set()
+    if _escritor is not None:
+        _escritor.join(timeout)
+    resto = []
+    while True:
+        try:
+            resto.append(_fila.get_nowait())
+        except queue.Empty:
+            break
+    if resto:
+        gravar(resto)
+
+
+def estatisticas() -> dict:
+    """Linhas pendentes, gravadas, lotes e descartadas"""
+    return {"pendentes": _fila.qsize(), **_contadores}
+
+
+atexit.register(descarregar)
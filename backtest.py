@@ -0,0 +1,368 @@
+"""
+backtest.py – reavaliação histórica vetorizada das regras de fraude
+===================================================================
+
+Carrega `transacoes`, `logs` e `fatos_usuarios` uma única vez e calcula,
+para cada transação histórica, se cada regra de fraude.py teria disparado –
+com operações de janela em pandas/NumPy em vez de chamar
+`avaliar_transacao` linha a linha. Serve para medir o efeito de mudar os
+limiares (config_regras / regras.json, ou --limiar) sobre meses de histórico.
+
+Cada transação é avaliada como no motor ao vivo: o "agora" é a sua própria
+data_hora e todas as transações anteriores (ordem data_hora, id) contam como
+já aceitas. Diferenças conhecidas em relação ao motor:
+  • limites por usuário: usa os valores atuais de limites_usuario;
+  • IP da regra #02: `transacoes` não guarda IP, então vale o IP do último
+    login do usuário até o instante da transação.
+
+A regra #08 (ciclos e fan-in/fan-out) depende da ordem em que as arestas
+chegam: as transferências passam, em ordem, por um grafo novo de
+grafo_transferencias – a única regra calculada linha a linha.
+
+Uso:
+    python backtest.py --inicio 2025-01-01 --fim 2025-04-01 \\
+                       --limiar tx_usuario_5min=6 --saida flags.csv
+"""
+import argparse
+from collections import Counter, deque
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import config_regras
+import score
+from db import get_conn
+from grafo_transferencias import TIPOS_DESTINO, TIPOS_ORIGEM, GrafoTransferencias
+from turnos import H_INI_DIA, H_INI_NOITE, TIPOS_TURNO
+from velocidade import TIPOS_VELOCIDADE
+
+REGRAS = [
+    "regra_01_limites_turno",
+    "regra_02_5_transacoes_5min",
+    "regra_03_tentativas_login",
+    "regra_04_alteracao_senha",
+    "regra_05_troca_dados_saque",
+    "regra_06_cashin_sem_historico",
+    "regra_07_deposito_saque_rapido",
+    "regra_08_rede_laranjas",
+]
+
+_MIN_MS = 60_000
+
+# ------------------------------------------------------------------
+# CARGA – uma consulta por tabela
+# ------------------------------------------------------------------
+def carregar_historico(inicio: datetime = None, fim: datetime = None, con=None) -> dict:
+    """
+    Lê de uma vez os dados necessários ao backtest do período [inicio, fim).
+    As tabelas de contexto (e as transações) incluem 7 dias antes de inicio,
+    para que as janelas das primeiras transações fiquem completas.
+    Retorna {"tx", "logs", "fatos", "limites", "inicio", "fim"}.
+    """
+    conn = con or get_conn()
+    desde = inicio - timedelta(days=7) if inicio else None
+
+    def _periodo(coluna: str, ate_fim: bool = True) -> tuple:
+        filtros, params = [], []
+        if desde:
+            filtros.append(f"{coluna} >= %s")
+            params.append(desde)
+        if fim and ate_fim:
+            filtros.append(f"{coluna} < %s")
+            params.append(fim)
+        return (" WHERE " + " AND ".join(filtros) if filtros else ""), tuple(params)
+
+    where, params = _periodo("data_hora")
+    tx = pd.read_sql(f"""
+        SELECT id, user_id, valor, tipo_transacao, codigo, data_hora, suspeita
+          FROM transacoes{where}
+    """, conn, params=params, parse_dates=["data_hora"])
+
+    logs = pd.read_sql(f"""
+        SELECT user_id, data_hora, resultado, ip
+          FROM logs{where}
+    """, conn, params=params, parse_dates=["data_hora"])
+
+    fatos = pd.read_sql(f"""
+        SELECT user_id, data_hora, acao, campo
+          FROM fatos_usuarios{where}
+    """, conn, params=params, parse_dates=["data_hora"])
+
+    limites = pd.read_sql(
+        "SELECT user_id, limite_dia, limite_noite FROM limites_usuario", conn)
+
+    return {"tx": tx, "logs": logs, "fatos": fatos, "limites": limites,
+            "inicio": inicio, "fim": fim}
+
+# ------------------------------------------------------------------
+# JANELAS – somas por grupo em janelas de tempo, via searchsorted
+# ------------------------------------------------------------------
+def _ms(serie: pd.Series) -> np.ndarray:
+    """Instantes em milissegundos (int64)"""
+    return serie.to_numpy(dtype="datetime64[ms]").astype(np.int64)
+
+def _soma_janela(ev_grupo, ev_t, ev_peso, q_grupo, q_t, janela_ms: int,
+                 inclui_fim: bool = True) -> np.ndarray:
+    """
+    Para cada consulta (q_grupo, q_t): soma de ev_peso dos eventos do mesmo
+    grupo com q_t - janela <= t <= q_t (t < q_t se inclui_fim=False).
+    Grupo e instante viram uma única chave int64 ordenável, então todas as
+    consultas saem de dois searchsorted sobre a soma acumulada.
+    """
+    if len(ev_t) == 0 or len(q_t) == 0:
+        return np.zeros(len(q_t))
+    codigos, _ = pd.factorize(np.concatenate([ev_grupo, q_grupo]))
+    t0 = min(ev_t.min(), q_t.min()) - janela_ms
+    base = max(ev_t.max(), q_t.max()) - t0 + 1
+    ev_k = codigos[:len(ev_t)].astype(np.int64) * base + (ev_t - t0)
+    q_k = codigos[len(ev_t):].astype(np.int64) * base + (q_t - t0)
+
+    ordem = np.argsort(ev_k, kind="stable")
+    ev_k = ev_k[ordem]
+    acumulado = np.concatenate([[0], np.cumsum(np.asarray(ev_peso, dtype=float)[ordem])])
+    hi = np.searchsorted(ev_k, q_k, side="right" if inclui_fim else "left")
+    lo = np.searchsorted(ev_k, q_k - janela_ms, side="left")
+    return acumulado[hi] - acumulado[lo]
+
+def _anteriores_janela(grupo, t, peso, janela_ms: int) -> np.ndarray:
+    """
+    Para linhas já na ordem de avaliação: soma de peso das linhas ANTERIORES
+    do mesmo grupo com t >= t_atual - janela.
+    """
+    if len(t) == 0:
+        return np.zeros(0)
+    codigos, _ = pd.factorize(grupo)
+    t0 = t.min() - janela_ms
+    base = t.max() - t0 + 1
+    chave = codigos.astype(np.int64) * base + (t - t0)
+
+    ordem = np.argsort(chave, kind="stable")      # estável: empates mantêm a ordem de avaliação
+    posicao = np.empty_like(ordem)
+    posicao[ordem] = np.arange(len(ordem))
+    acumulado = np.concatenate([[0], np.cumsum(np.asarray(peso, dtype=float)[ordem])])
+    lo = np.searchsorted(chave[ordem], chave - janela_ms, side="left")
+    return acumulado[posicao] - acumulado[lo]
+
+def _distintos_ip_anteriores(ip, user_id, t, conta, janela_ms: int) -> np.ndarray:
+    """
+    Usuários distintos com transação contada (conta=True) no mesmo IP nos
+    últimos janela_ms, antes de cada linha. Contagem de distintos em janela
+    não se reduz a somas acumuladas: é a única etapa com laço em Python,
+    O(n) com deque + Counter por IP (a mesma estrutura de velocidade.py).
+    """
+    resultado = np.zeros(len(t))
+    com_ip = np.flatnonzero(pd.notna(ip))
+    if not len(com_ip):
+        return resultado
+    ordem = com_ip[np.lexsort((t[com_ip], pd.factorize(ip[com_ip])[0]))]
+
+    ip_atual, janela, membros = None, deque(), Counter()
+    for i in ordem:
+        if ip[i] != ip_atual:
+            ip_atual, janela, membros = ip[i], deque(), Counter()
+        while janela and janela[0][0] < t[i] - janela_ms:
+            _, u = janela.popleft()
+            membros[u] -= 1
+            if not membros[u]:
+                del membros[u]
+        resultado[i] = len(membros)
+        if conta[i]:
+            janela.append((t[i], user_id[i]))
+            membros[user_id[i]] += 1
+    return resultado
+
+def _rede_laranjas(df: pd.DataFrame, lim: dict) -> np.ndarray:
+    """
+    Regra 08 para as linhas de df (já na ordem de avaliação): cada
+    transferência é medida e depois registrada num GrafoTransferencias.
+    A linha de quem paga leva o destino do seu par, como no Perfil (ver
+    GrafoTransferencias.aresta).
+    """
+    disparou = np.zeros(len(df), dtype=bool)
+    linhas = df[df["tipo_transacao"].isin(TIPOS_ORIGEM + TIPOS_DESTINO) & df["codigo"].notna()]
+    recebedor = (linhas[linhas["tipo_transacao"].isin(TIPOS_DESTINO)]
+                 .drop_duplicates("codigo").set_index("codigo")["user_id"])
+    destinos = linhas["codigo"].map(recebedor)
+    grafo = GrafoTransferencias()
+    for i, tx, destino in zip(linhas.index,
+                              linhas[["user_id", "valor", "tipo_transacao", "codigo", "data_hora"]]
+                              .to_dict("records"), destinos):
+        tx["data_hora"] = tx["data_hora"].to_pydatetime()
+        if tx["tipo_transacao"] in TIPOS_ORIGEM and pd.notna(destino):
+            tx["destino_id"] = int(destino)
+        m = grafo.medir(tx, tx["data_hora"])
+        disparou[i] = (bool(m["ciclo"]) or m["fan_in_1h"] >= lim["fan_in_1h"]
+                       or m["fan_out_1h"] >= lim["fan_out_1h"])
+        grafo.registrar(tx)
+    return disparou
+
+def _inicio_turno(dh: pd.Series) -> pd.Series:
+    """Início do turno (ver turnos.janela_turno) de cada instante, vetorizado"""
+    dia = dh.dt.normalize()
+    hora = dh - dia
+    ini_dia = pd.Timedelta(hours=H_INI_DIA.hour, minutes=H_INI_DIA.minute)
+    ini_noite = pd.Timedelta(hours=H_INI_NOITE.hour, minutes=H_INI_NOITE.minute)
+    return pd.Series(np.where((hora >= ini_dia) & (hora < ini_noite), dia + ini_dia,
+                     np.where(hora >= ini_noite, dia + ini_noite,
+                              dia - pd.Timedelta(days=1) + ini_noite)),
+                     index=dh.index)
+
+# ------------------------------------------------------------------
+# BACKTEST
+# ------------------------------------------------------------------
+def backtest(dados: dict = None, limiares: dict = None,
+             inicio: datetime = None, fim: datetime = None) -> pd.DataFrame:
+    """
+    Avalia todas as regras sobre o histórico.
+    dados: resultado de carregar_historico (carregado aqui se omitido) –
+           reaproveite-o para testar vários conjuntos de limiares.
+    limiares: sobrescreve valores da configuração em uso (config_regras).
+    Retorna um DataFrame com uma linha por transação do período, uma coluna
+    booleana por regra e `suspeita_backtest`, os componentes (score.FEATURES,
+    0–1) e o `score` de risco; `suspeita` é o valor gravado.
+    """
+    if dados is None:
+        dados = carregar_historico(inicio, fim)
+    lim = {**config_regras.atual(), **(limiares or {})}
+
+    df = dados["tx"].sort_values(["data_hora", "id"], kind="stable").reset_index(drop=True)
+    df["valor"] = df["valor"].astype(float)
+    t = _ms(df["data_hora"])
+    uid = df["user_id"].to_numpy()
+    tipo = df["tipo_transacao"]
+
+    # Regra 01 – total do turno antes da tx + a tx > limite do turno
+    limites = dados["limites"].set_index("user_id")
+    inicio_turno = _inicio_turno(df["data_hora"])
+    noite = inicio_turno.dt.hour == H_INI_NOITE.hour
+    limite = np.where(noite,
+                      df["user_id"].map(limites["limite_noite"]).astype(float).fillna(lim["limite_noite_padrao"]),
+                      df["user_id"].map(limites["limite_dia"]).astype(float).fillna(lim["limite_dia_padrao"]))
+    conta_turno = df["valor"].where(tipo.isin(TIPOS_TURNO), 0.0)
+    anterior_turno = conta_turno.groupby([df["user_id"], inicio_turno]).cumsum() - conta_turno
+    df["regra_01_limites_turno"] = anterior_turno + df["valor"] > limite
+
+    # Regra 02 – velocidade do usuário e usuários distintos por IP (5 min)
+    velocidade = tipo.isin(TIPOS_VELOCIDADE).to_numpy()
+    tx_5min = _anteriores_janela(uid, t, velocidade, 5 * _MIN_MS)
+    logins = dados["logs"].dropna(subset=["ip"]).sort_values("data_hora")
+    ip = pd.merge_asof(df[["data_hora", "user_id"]].reset_index(), logins[["data_hora", "user_id", "ip"]],
+                       on="data_hora", by="user_id", direction="backward"
+                       ).set_index("index")["ip"].reindex(df.index).to_numpy(dtype=object)
+    usuarios_ip = _distintos_ip_anteriores(ip, uid, t, velocidade, 5 * _MIN_MS)
+    df["regra_02_5_transacoes_5min"] = ((tx_5min >= lim["tx_usuario_5min"] - 1)
+                                        | (usuarios_ip >= lim["usuarios_ip_5min"]))
+
+    # Regra 03 – falhas de login nos 30 min anteriores
+    logs = dados["logs"]
+    falhas = logs[logs["resultado"] == "fail"]
+    n_falhas = _soma_janela(
+        falhas["user_id"].to_numpy(), _ms(falhas["data_hora"]), np.ones(len(falhas)),
+        uid, t, lim["falhas_login_janela_min"] * _MIN_MS)
+    df["regra_03_tentativas_login"] = n_falhas >= lim["falhas_login_30min"]
+
+    # Regras 04/05 – trocas de senha (7 dias) e edições sensíveis (1 h)
+    fatos = dados["fatos"]
+    senhas = fatos[fatos["acao"] == "Alterar senha"]
+    n_senhas = _soma_janela(
+        senhas["user_id"].to_numpy(), _ms(senhas["data_hora"]), np.ones(len(senhas)),
+        uid, t, 7 * 24 * 60 * _MIN_MS)
+    df["regra_04_alteracao_senha"] = n_senhas >= lim["senhas_7d"]
+    edicoes = fatos[(fatos["acao"] == "editar_perfil") & fatos["campo"].isin(["email", "telefone"])]
+    n_edicoes = _soma_janela(
+        edicoes["user_id"].to_numpy(), _ms(edicoes["data_hora"]), np.ones(len(edicoes)),
+        uid, t, 60 * _MIN_MS)
+    saque = tipo.isin(["Saque", "Transferência"])
+    df["regra_05_troca_dados_saque"] = (n_edicoes > 0) & saque
+
+    # Regra 06 – Cash-In alto sem transações nos 7 dias anteriores (data_hora
+    # estritamente menor, como no motor: as do mesmo instante não contam)
+    historico_7d = _soma_janela(uid, t, np.ones(len(df)), uid, t, 7 * 24 * 60 * _MIN_MS,
+                                inclui_fim=False)
+    df["regra_06_cashin_sem_historico"] = ((tipo == "Cash-In") & (historico_7d == 0)
+                                           & (df["valor"] > lim["cashin_sem_historico"]))
+
+    # Regra 07 – saque/transferência logo após um Cash-In de valor parecido
+    cashins = df.loc[tipo == "Cash-In", ["data_hora", "user_id", "valor"]]
+    ultimo = pd.merge_asof(
+        df.loc[saque, ["data_hora", "user_id"]].reset_index(),
+        cashins.rename(columns={"valor": "valor_cashin"}).assign(data_cashin=cashins["data_hora"]),
+        on="data_hora", by="user_id", direction="backward", tolerance=pd.Timedelta(hours=1),
+    ).set_index("index")
+    minutos = ((ultimo["data_hora"] - ultimo["data_cashin"]).dt.total_seconds() // 60)
+    rapido = ((minutos < lim["saque_minutos"])
+              & (df.loc[ultimo.index, "valor"] >= ultimo["valor_cashin"] * lim["saque_razao"]))
+    df["regra_07_deposito_saque_rapido"] = rapido.reindex(df.index, fill_value=False).astype(bool)
+
+    # Regra 08 – ciclos e fan-in/fan-out no grafo de transferências
+    df["regra_08_rede_laranjas"] = _rede_laranjas(df, lim)
+
+    df["suspeita_backtest"] = df[REGRAS].any(axis=1)
+
+    # Score de risco (ver score.py) com as mesmas features das regras
+    f = score.features(tx_5min, df["valor"], anterior_turno, limite, n_edicoes + n_senhas,
+                       n_falhas, minutos.reindex(df.index),
+                       ultimo["valor_cashin"].reindex(df.index), saque)
+    df[list(score.FEATURES)] = score.componentes(f)
+    df["score"] = score.pontuar(f)
+    periodo = pd.Series(True, index=df.index)
+    if dados.get("inicio"):
+        periodo &= df["data_hora"] >= dados["inicio"]
+    if dados.get("fim"):
+        periodo &= df["data_hora"] < dados["fim"]
+    return df[periodo].reset_index(drop=True)
+
+def resumo(df: pd.DataFrame) -> pd.DataFrame:
+    """Disparos e taxa por regra, mais a concordância com a flag gravada"""
+    linhas = [{"regra": r, "disparos": int(df[r].sum()), "taxa": df[r].mean()} for r in REGRAS]
+    gravada = df["suspeita"].astype(bool)
+    nova = df["suspeita_backtest"]
+    linhas.append({"regra": "suspeita_backtest", "disparos": int(nova.sum()), "taxa": nova.mean(),
+                   "tambem_gravada": int((nova & gravada).sum()),
+                   "so_backtest": int((nova & ~gravada).sum()),
+                   "so_gravada": int((~nova & gravada).sum())})
+    return pd.DataFrame(linhas).set_index("regra")
+
+def ranking_usuarios(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Usuários ordenados pelo maior score do período. Traz também o score
+    médio, o maior valor de cada componente e as transações gravadas como
+    suspeitas (quantidade e valor).
+    """
+    df = df.assign(valor_suspeita=df["valor"].where(df["suspeita"].astype(bool), 0.0))
+    por_usuario = df.groupby("user_id").agg(
+        score_max=("score", "max"),
+        score_medio=("score", "mean"),
+        qtd_suspeitas=("suspeita", "sum"),
+        valor_total_suspeitas=("valor_suspeita", "sum"),
+        **{f: (f, "max") for f in score.FEATURES},
+    )
+    return por_usuario.sort_values("score_max", ascending=False).reset_index()
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Backtest vetorizado das regras de fraude")
+    ap.add_argument("--inicio", type=datetime.fromisoformat)
+    ap.add_argument("--fim", type=datetime.fromisoformat)
+    ap.add_argument("--limiar", action="append", default=[], metavar="NOME=VALOR",
+                    help=f"sobrescreve um limiar ({', '.join(k for k in config_regras.PADRAO if k != 'versao')})")
+    ap.add_argument("--saida", help="grava as flags por transação neste CSV")
+    args = ap.parse_args()
+
+    limiares = {}
+    for item in args.limiar:
+        nome, valor = item.split("=", 1)
+        if nome not in config_regras.PADRAO or nome == "versao":
+            ap.error(f"limiar desconhecido: {nome}")
+        try:
+            limiares[nome] = config_regras.converter(nome, float(valor))
+        except ValueError as e:
+            ap.error(str(e))
+
+    df = backtest(limiares=limiares, inicio=args.inicio, fim=args.fim)
+    print(resumo(df).to_string())
+    if args.saida:
+        df.to_csv(args.saida, index=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+bench_sync_async.py – POST /transacoes/ síncrono × asyncio
+==========================================================
+
+Com --url (um uvicorn já em execução, ex.: http://localhost:8000) mede
+requisições/s das duas rotas, com até --concorrencia requisições em voo:
+  • sync  – POST /transacoes/: motor síncrono (fraude.avaliar_transacao)
+            no threadpool, na transação da sessão;
+  • async – POST /transacoes/async: motor asyncio (fraude_async) no event
+            loop, só a gravação no threadpool.
+As duas gravam as transações no banco do backend.
+
+Sem --url (ou com --motor) mede só o motor, no próprio processo e sem
+gravar nada: avaliações/s de fraude.avaliar_transacao, uma por vez, e de
+fraude_async.avaliar_transacao_async com --concorrencia em andamento.
+
+Uso:
+    python benchmarks/bench_sync_async.py --url http://localhost:8000 --n 2000 --concorrencia 64
+"""
+import argparse
+import asyncio
+import random
+import sys
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+TIPOS = ["Compra", "Pagamento", "Transferência", "PIX", "Cash-In", "Saque"]
+
+
+def _amostra(user_ids: list, n: int) -> list:
+    return [{
+        "user_id": random.choice(user_ids),
+        "valor": round(random.uniform(1, 3_000), 2),
+        "tipo_transacao": random.choice(TIPOS),
+        "ip": f"10.0.{random.randint(0, 3)}.{random.randint(1, 254)}",
+        "banco_origem": "Bench",
+        "banco_destino": "Bench",
+    } for _ in range(n)]
+
+
+def bench_sync(txs: list) -> float:
+    from fraude import avaliar_transacao
+    inicio = perf_counter()
+    for tx in txs:
+        avaliar_transacao({**tx, "data_hora": datetime.now()})
+    return len(txs) / (perf_counter() - inicio)
+
+
+async def bench_async(txs: list, concorrencia: int) -> float:
+    from fraude_async import avaliar_transacao_async, fechar_pool_async
+    sem = asyncio.Semaphore(concorrencia)
+
+    async def _uma(tx):
+        async with sem:
+            await avaliar_transacao_async({**tx, "data_hora": datetime.now()})
+
+    inicio = perf_counter()
+    await asyncio.gather(*(_uma(tx) for tx in txs))
+    vazao = len(txs) / (perf_counter() - inicio)
+    await fechar_pool_async()
+    return vazao
+
+
+async def bench_http(url: str, txs: list, concorrencia: int, rota: str = "/transacoes/") -> float:
+    """Requisições/s de POST `rota` com até `concorrencia` em voo"""
+    import httpx
+    sem = asyncio.Semaphore(concorrencia)
+    async with httpx.AsyncClient(base_url=url, timeout=60) as cliente:
+        async def _uma(tx):
+            async with sem:
+                r = await cliente.post(rota, json=tx)
+                r.raise_for_status()
+
+        inicio = perf_counter()
+        await asyncio.gather(*(_uma(tx) for tx in txs))
+        return len(txs) / (perf_counter() - inicio)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    ap.add_argument("--n", type=int, default=1_000, help="transações por cenário")
+    ap.add_argument("--concorrencia", type=int, default=32)
+    ap.add_argument("--url", help="base do backend para comparar POST /transacoes/ e /transacoes/async")
+    ap.add_argument("--motor", action="store_true",
+                    help="com --url, mede também o motor no próprio processo")
+    args = ap.parse_args()
+
+    from db import get_cursor
+    cur = get_cursor()
+    cur.execute("SELECT id FROM usuarios LIMIT 1000")
+    user_ids = [r[0] for r in cur.fetchall()]
+    if not user_ids:
+        sys.exit("Não há usuários na base – rode o gerador (04_Gerar_Dados) antes.")
+
+    txs = _amostra(user_ids, args.n)
+    if args.url:
+        sync = asyncio.run(bench_http(args.url, txs, args.concorrencia, "/transacoes/"))
+        assincrono = asyncio.run(bench_http(args.url, txs, args.concorrencia, "/transacoes/async"))
+        print(f"POST /transacoes/      : {sync:10.1f} req/s  (concorrência {args.concorrencia})")
+        print(f"POST /transacoes/async : {assincrono:10.1f} req/s")
+        print(f"ganho                  : {assincrono / sync:10.2f}x")
+    if not args.url or args.motor:
+        sync = bench_sync(txs)
+        assincrono = asyncio.run(bench_async(txs, args.concorrencia))
+        print(f"motor sync : {sync:10.1f} avaliações/s")
+        print(f"motor async: {assincrono:10.1f} avaliações/s  (concorrência {args.concorrencia})")
+        print(f"ganho      : {assincrono / sync:10.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+"""
+suite.py – benchmarks reproduzíveis do motor de fraude e de POST /transacoes/
+============================================================================
+
+Para cada tamanho de tabela (padrão 10k, 1M e 10M transações) a suíte:
+
+  1. semeia um banco SQLite (db_sqlite, mesmo esquema do MySQL) com dados
+     sintéticos nas proporções do gerador (04_Gerar_Dados): 3 000 usuários
+     com limites, transações dos últimos 90 dias com os mesmos tipos e
+     valores, logins e alterações de perfil. A semente é fixa e as datas
+     são relativas à meia-noite do dia da semeadura; o banco fica em
+     benchmarks/dados/bench_<n>_<AAAAMMDD>.db e é semeado de novo (e o
+     antigo apagado) quando o dia muda, para que as janelas das regras,
+     medidas contra o relógio atual, vejam sempre os mesmos dados;
+  2. mede, em um processo novo e sobre uma cópia do banco semeado:
+       • transacao – fraude.avaliar_transacao uma a uma: latência da
+         avaliação, de cada regra e de cada fonte SQL (p50/p95/p99, ver
+         metricas);
+       • lote      – fraude.avaliar_lote em lotes de --lote: transações/s;
+  3. com --http, sobe o backend (uvicorn, um worker) sobre outra cópia do
+     banco semeado (FORSAKENSCAN_DB=sqlite:<cópia>) e mede requisições/s
+     de POST /transacoes/ – a vazão HTTP de cada tamanho.
+
+Com --url, mede também um backend já em execução (que usa o banco dele,
+não o SQLite semeado; o número sai à parte, sem tamanho).
+
+O resultado vai para um JSON (benchmarks/resultados/AAAAMMDD-HHMMSS.json
+ou --saida). --comparar anterior.json mostra a variação dos números
+principais em relação a uma execução anterior.
+
+Uso:
+    python benchmarks/suite.py --tamanhos 10k,1m --n 2000
+    python benchmarks/suite.py --tamanhos 10k,1m --http --concorrencia 32
+    python benchmarks/suite.py --tamanhos 10k --comparar benchmarks/resultados/base.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+from datetime import date, datetime, time
+from pathlib import Path
+from time import perf_counter, sleep
+from urllib.error import URLError
+from urllib.request import urlopen
+
+import numpy as np
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+
+DADOS = Path(__file__).resolve().parent / "dados"
+RESULTADOS = Path(__file__).resolve().parent / "resultados"
+
+TAMANHOS_PADRAO = "10k,1m,10m"
+USUARIOS = 3_000
+SEMENTE = 42
+SUBIDA_SEG = 120  # espera pelo startup do backend em --http
+BLOCO = 100_000   # linhas por executemany na semeadura
+
+# Mesmas listas e faixas do gerador (pages/04_Gerar_Dados.py)
+TIPOS = ["Compra", "Pagamento", "Transferência", "PIX", "Recebimento", "Cash-In", "Saque"]
+BANCOS = ["Itaú", "Bradesco", "Nubank", "Inter", "Santander",
+          "Banco do Brasil", "Caixa", "C6 Bank", "BTG Pactual"]
+FORMAS_PG = ["Pix", "Transferência", "Cartão", "Boleto"]
+
+
+def _tamanho(texto: str) -> int:
+    """'10k' → 10 000, '1m' → 1 000 000"""
+    texto = texto.strip().lower()
+    multiplicador = {"k": 1_000, "m": 1_000_000}.get(texto[-1], 1)
+    return int(float(texto.rstrip("km")) * multiplicador)
+
+# ------------------------------------------------------------------
+# SEMEADURA
+# ------------------------------------------------------------------
+def _datas(rng, n: int, agora: datetime, dias: int = 90) -> list:
+    """n instantes uniformes nos últimos `dias` dias, como texto DATETIME"""
+    seg = rng.integers(0, dias * 86_400, n)
+    base = np.datetime64(agora.replace(microsecond=0)) - seg.astype("timedelta64[s]")
+    return np.char.replace(np.datetime_as_string(base, unit="s"), "T", " ").tolist()
+
+def _inserir(cur, sql: str, colunas: list) -> None:
+    cur.executemany(sql, list(zip(*colunas)))
+
+def semear(caminho: Path, n_tx: int, referencia: date, usuarios: int = USUARIOS,
+           semente: int = SEMENTE) -> None:
+    """Cria em `caminho` um banco SQLite com n_tx transações sintéticas
+    datadas nos 90 dias anteriores à meia-noite de `referencia`"""
+    from db_sqlite import ArmazenamentoSQLite
+
+    rng = np.random.default_rng(semente)
+    agora = datetime.combine(referencia, time())
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    temporario = caminho.with_suffix(".semeando")
+    temporario.unlink(missing_ok=True)
+    banco = ArmazenamentoSQLite(str(temporario))
+    con = banco.conexao()
+    cur = con.cursor()
+    cur.execute("PRAGMA journal_mode = OFF")
+    cur.execute("PRAGMA synchronous = OFF")
+
+    ids = np.arange(1, usuarios + 1)
+    renda = np.round(rng.uniform(1_200, 20_000, usuarios), 2)
+    _inserir(cur, """
+        INSERT INTO usuarios (id, nome, email, banco, username, senha, cpf, renda)
+        VALUES (%s,%s,%s,%s,%s,%s,%s,%s)
+    """, [ids.tolist(), [f"Usuário {i}" for i in ids], [f"u{i}@bench" for i in ids],
+          rng.choice(BANCOS, usuarios).tolist(), [f"bench{i}" for i in ids],
+          ["x"] * usuarios, [f"{i:011d}" for i in ids], renda.tolist()])
+    limite_dia = np.round(renda * rng.uniform(1.5, 4.0, usuarios), 2)
+    _inserir(cur, """
+        INSERT INTO limites_usuario (user_id, limite_pagamento, limite_dia, limite_noite)
+        VALUES (%s,%s,%s,%s)
+    """, [ids.tolist(), np.round(renda * 3, 2).tolist(), limite_dia.tolist(),
+          np.round(limite_dia / 2, 2).tolist()])
+
+    for inicio in range(0, n_tx, BLOCO):
+        n = min(BLOCO, n_tx - inicio)
+        tipo = rng.choice(TIPOS, n)
+        suspeita = rng.random(n) < 0.10
+        _inserir(cur, """
+            INSERT INTO transacoes
+                  (user_id, valor, tipo_transacao, forma_pagamento, codigo, data_hora,
+                   suspeita, motivo_suspeita)
+            VALUES (%s,%s,%s,%s,%s,%s,%s,%s)
+        """, [rng.integers(1, usuarios + 1, n).tolist(),
+              np.round(rng.uniform(1, 20_000, n), 2).tolist(),
+              tipo.tolist(),
+              np.where(np.isin(tipo, ["Recebimento", "Cash-In"]), "Interno",
+                       rng.choice(FORMAS_PG, n)).tolist(),
+              [f"{inicio + i:010x}" for i in range(n)],
+              _datas(rng, n, agora),
+              suspeita.astype(int).tolist(),
+              np.where(suspeita, "valor atípico", None).tolist()])
+
+        # Um login a cada 10 transações (20 % falhos) e uma alteração de perfil a cada 20
+        m = n // 10
+        _inserir(cur, """
+            INSERT INTO logs (user_id, resultado, ip, data_hora) VALUES (%s,%s,%s,%s)
+        """, [rng.integers(1, usuarios + 1, m).tolist(),
+              np.where(rng.random(m) < 0.2, "fail", "ok").tolist(),
+              [f"10.0.{a}.{b}" for a, b in zip(rng.integers(0, 4, m), rng.integers(1, 255, m))],
+              _datas(rng, m, agora)])
+        m = n // 20
+        acao = rng.choice(["Alterar senha", "editar_perfil"], m)
+        _inserir(cur, """
+            INSERT INTO fatos_usuarios (user_id, acao, campo, data_hora) VALUES (%s,%s,%s,%s)
+        """, [rng.integers(1, usuarios + 1, m).tolist(), acao.tolist(),
+              np.where(acao == "editar_perfil", rng.choice(["email", "telefone", "endereco"], m),
+                       None).tolist(),
+              _datas(rng, m, agora)])
+        con.commit()
+        print(f"  semeadas {inicio + n:,}/{n_tx:,} transações", flush=True)
+
+    cur.execute("ANALYZE")
+    con.commit()
+    banco.fechar()
+    temporario.replace(caminho)
+
+def banco_semeado(n_tx: int, referencia: date) -> Path:
+    """Caminho do banco semeado com n_tx transações na data `referencia`
+    (criado se não existir; os de outras datas são apagados)"""
+    caminho = DADOS / f"bench_{n_tx}_{referencia:%Y%m%d}.db"
+    if not caminho.exists():
+        for antigo in [*DADOS.glob(f"bench_{n_tx}_*.db"), DADOS / f"bench_{n_tx}.db"]:
+            antigo.unlink(missing_ok=True)
+        print(f"Semeando {caminho.name} …", flush=True)
+        semear(caminho, n_tx, referencia)
+    return caminho
+
+# ------------------------------------------------------------------
+# MEDIÇÕES – rodam no processo filho, com FORSAKENSCAN_DB apontando a cópia
+# ------------------------------------------------------------------
+def _amostra(n: int, semente: int = SEMENTE) -> list:
+    aleatorio = random.Random(semente)
+    return [{
+        "user_id": aleatorio.randint(1, USUARIOS),
+        "valor": round(aleatorio.uniform(1, 3_000), 2),
+        "tipo_transacao": aleatorio.choice(TIPOS),
+        "ip": f"10.0.{aleatorio.randint(0, 3)}.{aleatorio.randint(1, 254)}",
+    } for _ in range(n)]
+
+def _resumo_latencias(m: dict) -> dict:
+    campos = ("contagem", "media_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+    return {nome: {c: v[c] for c in campos} for nome, v in m.items()}
+
+def medir_transacao(txs: list) -> dict:
+    import fraude
+    import metricas
+    fraude.iniciar_janelas()
+    metricas.zerar()
+    inicio = perf_counter()
+    for tx in txs:
+        fraude.avaliar_transacao({**tx, "data_hora": datetime.now()})
+    segundos = perf_counter() - inicio
+    m = metricas.instantaneo()
+    return {
+        "transacoes_por_seg": len(txs) / segundos,
+        "avaliacao": _resumo_latencias(m["avaliacoes"]).get("transacao"),
+        "regras": _resumo_latencias(m["regras"]),
+        "sql": _resumo_latencias(m["sql"]),
+    }
+
+def medir_lote(txs: list, tamanho_lote: int) -> dict:
+    import fraude
+    import metricas
+    metricas.zerar()
+    inicio = perf_counter()
+    for i in range(0, len(txs), tamanho_lote):
+        agora = datetime.now()
+        fraude.avaliar_lote([{**tx, "data_hora": agora} for tx in txs[i:i + tamanho_lote]])
+    segundos = perf_counter() - inicio
+    return {
+        "tamanho_lote": tamanho_lote,
+        "transacoes_por_seg": len(txs) / segundos,
+        "sql": _resumo_latencias(metricas.instantaneo()["sql"]),
+    }
+
+def _medir_filho(n: int, tamanho_lote: int) -> None:
+    """Entrada do processo filho: imprime o JSON das medições"""
+    import auditoria
+    txs = _amostra(n)
+    resultado = {
+        "transacao": medir_transacao(txs),
+        "lote": medir_lote(_amostra(n, SEMENTE + 1), tamanho_lote),
+    }
+    auditoria.descarregar()
+    print(json.dumps(resultado))
+
+def medir_tamanho(n_tx: int, n: int, tamanho_lote: int, referencia: date) -> dict:
+    """Mede um tamanho de tabela em processo próprio sobre uma cópia do banco semeado"""
+    origem = banco_semeado(n_tx, referencia)
+    with tempfile.TemporaryDirectory() as tmp:
+        copia = Path(tmp) / origem.name
+        shutil.copyfile(origem, copia)
+        saida = subprocess.run(
+            [sys.executable, __file__, "--_filho", "--n", str(n), "--lote", str(tamanho_lote)],
+            env={**os.environ, "FORSAKENSCAN_DB": f"sqlite:{copia}"},
+            capture_output=True, text=True)
+    if saida.returncode:
+        sys.exit(f"Erro ao medir {n_tx:,} transações:\n{saida.stderr}")
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+def medir_http(url: str, n: int, concorrencia: int) -> dict:
+    from bench_sync_async import bench_http
+    txs = [{**tx, "banco_origem": "Bench", "banco_destino": "Bench"} for tx in _amostra(n)]
+    return {"url": url, "concorrencia": concorrencia,
+            "requisicoes_por_seg": asyncio.run(bench_http(url, txs, concorrencia))}
+
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _esperar_backend(url: str, servidor: subprocess.Popen) -> None:
+    """Bloqueia até o backend responder (o lifespan termina antes de aceitar requisições)"""
+    limite = perf_counter() + SUBIDA_SEG
+    while perf_counter() < limite:
+        if servidor.poll() is not None:
+            sys.exit(f"O backend terminou na subida (código {servidor.returncode})")
+        try:
+            urlopen(f"{url}/openapi.json", timeout=5).close()
+            return
+        except (URLError, OSError):
+            sleep(0.2)
+    sys.exit(f"O backend não respondeu em {SUBIDA_SEG} s")
+
+def medir_http_tamanho(n_tx: int, n: int, concorrencia: int, referencia: date) -> dict:
+    """Sobe o backend sobre uma cópia do banco semeado e mede POST /transacoes/"""
+    origem = banco_semeado(n_tx, referencia)
+    with tempfile.TemporaryDirectory() as tmp:
+        copia = Path(tmp) / origem.name
+        shutil.copyfile(origem, copia)
+        url = f"http://127.0.0.1:{_porta_livre()}"
+        servidor = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "backend:app", "--host", "127.0.0.1",
+             "--port", url.rsplit(":", 1)[1], "--log-level", "warning"],
+            cwd=RAIZ, env={**os.environ, "FORSAKENSCAN_DB": f"sqlite:{copia}"})
+        try:
+            _esperar_backend(url, servidor)
+            return medir_http(url, n, concorrencia)
+        finally:
+            servidor.terminate()
+            servidor.wait()
+
+# ------------------------------------------------------------------
+# RELATÓRIO
+# ------------------------------------------------------------------
+def _principais(resultado: dict) -> dict:
+    """Números comparados entre execuções: {(tamanho, métrica): valor}"""
+    linhas = {}
+    for tamanho, r in resultado["tamanhos"].items():
+        linhas[(tamanho, "transacao p99 ms")] = r["transacao"]["avaliacao"]["p99_ms"]
+        linhas[(tamanho, "transacao tx/s")] = r["transacao"]["transacoes_por_seg"]
+        linhas[(tamanho, "lote tx/s")] = r["lote"]["transacoes_por_seg"]
+        if r.get("http"):
+            linhas[(tamanho, "http req/s")] = r["http"]["requisicoes_por_seg"]
+    if resultado.get("http"):
+        linhas[("-", "http req/s")] = resultado["http"]["requisicoes_por_seg"]
+    return linhas
+
+def imprimir(resultado: dict, anterior: dict = None) -> None:
+    base = _principais(anterior) if anterior else {}
+    for (tamanho, metrica), valor in _principais(resultado).items():
+        linha = f"{tamanho:>10}  {metrica:<18} {valor:12.2f}"
+        if (tamanho, metrica) in base and base[(tamanho, metrica)]:
+            linha += f"  ({(valor / base[(tamanho, metrica)] - 1) * 100:+.1f}%)"
+        print(linha)
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return ""
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    ap.add_argument("--tamanhos", default=TAMANHOS_PADRAO,
+                    help="transações na tabela, separadas por vírgula (ex.: 10k,1m,10m)")
+    ap.add_argument("--n", type=int, default=2_000, help="transações avaliadas por cenário")
+    ap.add_argument("--lote", type=int, default=500, help="tamanho do lote em avaliar_lote")
+    ap.add_argument("--http", action="store_true",
+                    help="sobe o backend sobre cada banco semeado e mede POST /transacoes/")
+    ap.add_argument("--url", help="base de um backend já em execução para medir POST /transacoes/")
+    ap.add_argument("--concorrencia", type=int, default=32)
+    ap.add_argument("--saida", help="arquivo JSON do resultado")
+    ap.add_argument("--comparar", help="JSON de uma execução anterior")
+    ap.add_argument("--_filho", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args._filho:
+        _medir_filho(args.n, args.lote)
+        return
+
+    referencia = date.today()
+    resultado = {
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "parametros": {"n": args.n, "lote": args.lote, "usuarios": USUARIOS, "semente": SEMENTE,
+                       "semeado_em": referencia.isoformat(), "concorrencia": args.concorrencia},
+        "tamanhos": {},
+    }
+    for texto in args.tamanhos.split(","):
+        n_tx = _tamanho(texto)
+        print(f"Medindo com {n_tx:,} transações …", flush=True)
+        resultado["tamanhos"][str(n_tx)] = medir_tamanho(n_tx, args.n, args.lote, referencia)
+        if args.http:
+            resultado["tamanhos"][str(n_tx)]["http"] = medir_http_tamanho(
+                n_tx, args.n, args.concorrencia, referencia)
+    if args.url:
+        resultado["http"] = medir_http(args.url, args.n, args.concorrencia)
+
+    saida = Path(args.saida) if args.saida else RESULTADOS / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    saida.parent.mkdir(parents=True, exist_ok=True)
+    saida.write_text(json.dumps(resultado, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    anterior = json.loads(Path(args.comparar).read_text(encoding="utf-8")) if args.comparar else None
+    imprimir(resultado, anterior)
+    print(f"Resultado em {saida}")
+
+
+if __name__ == "__main__":
+    main()
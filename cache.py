@@ -0,0 +1,99 @@
+"""
+cache.py – cache LRU limitado com expiração (TTL)
+=================================================
+
+Usado pelo motor de fraude para dados que mudam raramente (ex.: limites
+por usuário). Entradas expiram após `ttl` segundos e, quando o cache
+atinge `tamanho_max`, a menos usada recentemente é descartada.
+Contadores de acerto/erro ficam disponíveis em `estatisticas()`.
+
+Com `versao` (função sem argumentos) o cache confere a versão da fonte a
+cada obter(): se ela mudou – ex.: outro processo alterou os dados –, todo
+o conteúdo é descartado. A função deve ser barata (ex.: lida do banco no
+máximo a cada N segundos) e devolver None quando não souber a versão.
+Código assíncrono passa conferir=False e chama conferir_versao() fora do
+event loop (ex.: asyncio.to_thread), já que a leitura pode bloquear.
+"""
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+
+class CacheTTL:
+    """Cache LRU thread-safe com TTL e contadores de acerto/erro"""
+
+    def __init__(self, tamanho_max: int = 10_000, ttl: float = 300.0, versao=None):
+        self.tamanho_max = tamanho_max
+        self.ttl = ttl
+        self._fonte_versao = versao
+        self._versao = None
+        self._dados: OrderedDict = OrderedDict()
+        self._lock = Lock()
+        self.acertos = 0
+        self.erros = 0
+        self.expirados = 0
+        self.invalidacoes = 0
+
+    def obter(self, chave, padrao=None, conferir: bool = True):
+        """
+        Devolve o valor da chave ou `padrao` se ausente/expirado;
+        conferir=False não consulta a versão (ver conferir_versao)
+        """
+        if conferir:
+            self.conferir_versao()
+        with self._lock:
+            item = self._dados.get(chave)
+            if item is not None:
+                valor, expira_em = item
+                if expira_em > monotonic():
+                    self._dados.move_to_end(chave)
+                    self.acertos += 1
+                    return valor
+                del self._dados[chave]
+                self.expirados += 1
+            self.erros += 1
+            return padrao
+
+    def conferir_versao(self) -> None:
+        """Descarta o conteúdo se a versão da fonte mudou"""
+        if self._fonte_versao is None:
+            return
+        versao = self._fonte_versao()
+        if versao is None:
+            return
+        with self._lock:
+            if versao == self._versao:
+                return
+            self._versao = versao
+            self._dados.clear()
+            self.invalidacoes += 1
+
+    def guardar(self, chave, valor) -> None:
+        with self._lock:
+            self._dados[chave] = (valor, monotonic() + self.ttl)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.tamanho_max:
+                self._dados.popitem(last=False)
+
+    def invalidar(self, chave=None) -> None:
+        """Remove uma chave ou, sem argumento, todo o conteúdo"""
+        with self._lock:
+            if chave is None:
+                self._dados.clear()
+            else:
+                self._dados.pop(chave, None)
+            self.invalidacoes += 1
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            consultas = self.acertos + self.erros
+            return {
+                "tamanho": len(self._dados),
+                "tamanho_max": self.tamanho_max,
+                "ttl_seg": self.ttl,
+                "acertos": self.acertos,
+                "erros": self.erros,
+                "expirados": self.expirados,
+                "invalidacoes": self.invalidacoes,
+                "taxa_acerto": self.acertos / consultas if consultas else 0.0,
+            }
@@ -0,0 +1,124 @@
+"""
+config_regras.py – limiares das regras de fraude, recarregados a quente
+======================================================================
+
+Os limiares ficam em um JSON versionado (regras.json ao lado deste
+arquivo, ou o caminho de FORSAKENSCAN_REGRAS):
+
+    {"versao": 2, "tx_usuario_5min": 6, "saque_razao": 0.85}
+
+Chaves ausentes valem PADRAO. O motor chama atual() a cada avaliação: no
+máximo uma vez a cada INTERVALO_SEG isso faz um os.stat() do arquivo e,
+se mtime/tamanho mudaram, relê, valida e troca a configuração inteira de
+uma vez (uma atribuição de referência – quem já pegou a anterior termina
+a avaliação com ela). Um arquivo inválido é ignorado e a versão em uso
+continua valendo. Assim dá para ajustar limiares durante um incidente sem
+reiniciar os workers uvicorn.
+
+ao_trocar(func) registra funções chamadas após cada troca (ex.: o motor
+descarta o cache de limites, que guarda os limites padrão).
+"""
+import json
+import os
+from pathlib import Path
+from threading import Lock
+from time import monotonic
+from types import MappingProxyType
+
+ARQUIVO = Path(os.environ.get("FORSAKENSCAN_REGRAS",
+                              Path(__file__).resolve().parent / "regras.json"))
+INTERVALO_SEG = 1.0   # intervalo mínimo entre verificações do arquivo
+
+PADRAO = {
+    "versao": 0,
+    "limite_dia_padrao": 10_000.0,   # regra 01 – usuários sem limites_usuario
+    "limite_noite_padrao": 5_000.0,
+    "tx_usuario_5min": 5,            # regra 02 – transações do usuário em 5 min (com a atual)
+    "usuarios_ip_5min": 5,           # regra 02 – usuários distintos no mesmo IP em 5 min
+    "falhas_login_30min": 3,         # regra 03 – logins falhos…
+    "falhas_login_janela_min": 30,   # regra 03 – …nesta janela (minutos)
+    "senhas_7d": 3,                  # regra 04
+    "cashin_sem_historico": 5000.0,  # regra 06 – Cash-In acima deste valor
+    "saque_minutos": 10,             # regra 07 – saque até N minutos após o depósito…
+    "saque_razao": 0.9,              # regra 07 – …de pelo menos esta fração do depósito
+    "fan_in_1h": 5,                  # regra 08 – contas distintas pagando o usuário em 1 h
+    "fan_out_1h": 5,                 # regra 08 – contas distintas recebendo do usuário em 1 h
+}
+
+_config = MappingProxyType(dict(PADRAO))
+_assinatura = None          # (mtime_ns, tamanho) do arquivo carregado
+_proxima_verificacao = 0.0
+_lock = Lock()
+_ouvintes = []
+
+
+def converter(chave: str, valor):
+    """valor no tipo de PADRAO[chave]; ValueError se negativo ou fracionário numa chave inteira"""
+    if isinstance(valor, bool) or not isinstance(valor, (int, float)) or valor < 0:
+        raise ValueError(f"{chave} deve ser um número não negativo")
+    if isinstance(PADRAO[chave], int) and not float(valor).is_integer():
+        raise ValueError(f"{chave} deve ser um número inteiro (recebido {valor})")
+    return type(PADRAO[chave])(valor)
+
+
+def _validar(bruto: dict) -> dict:
+    """PADRAO sobrescrito pelo arquivo; rejeita chaves desconhecidas e valores inválidos"""
+    if not isinstance(bruto, dict):
+        raise ValueError("o arquivo deve conter um objeto JSON")
+    desconhecidas = set(bruto) - set(PADRAO)
+    if desconhecidas:
+        raise ValueError(f"chaves desconhecidas: {', '.join(sorted(desconhecidas))}")
+    novo = dict(PADRAO)
+    for chave, valor in bruto.items():
+        novo[chave] = converter(chave, valor)
+    return novo
+
+
+def recarregar(forcar: bool = False) -> bool:
+    """Relê o arquivo se ele mudou (ou se forcar=True). Devolve True se trocou"""
+    global _config, _assinatura
+    with _lock:
+        try:
+            st = os.stat(ARQUIVO)
+            assinatura = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            assinatura = None
+        if assinatura == _assinatura and not forcar:
+            return False
+        try:
+            novo = PADRAO if assinatura is None else _validar(
+                json.loads(Path(ARQUIVO).read_text(encoding="utf-8")))
+        except Exception as e:
+            print(f"Erro ao carregar {ARQUIVO} (mantida a versão {_config['versao']}): {str(e)}")
+            _assinatura = assinatura   # não tenta de novo até o arquivo mudar
+            return False
+        _assinatura = assinatura
+        if dict(novo) == dict(_config):
+            return False
+        _config = MappingProxyType(dict(novo))
+    print(f"Regras de fraude: versão {_config['versao']} carregada")
+    for func in _ouvintes:
+        try:
+            func(_config)
+        except Exception as e:
+            print(f"Erro ao aplicar nova configuração de regras: {str(e)}")
+    return True
+
+
+def atual():
+    """Configuração em uso (somente leitura), verificando o arquivo se já passou INTERVALO_SEG"""
+    global _proxima_verificacao
+    agora = monotonic()
+    if agora >= _proxima_verificacao:
+        _proxima_verificacao = agora + INTERVALO_SEG
+        recarregar()
+    return _config
+
+
+def versao() -> int:
+    return _config["versao"]
+
+
+def ao_trocar(func) -> None:
+    """Registra func(config), chamada após cada troca de configuração"""
+    _ouvintes.append(func)
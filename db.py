@@ -5,9 +5,28 @@ Use get_conn() sempre que precisar de um objeto de conexão
 e get_cursor() quando precisar apenas do cursor.
 Se a conexão tiver expirado (timeout) ela será recriada
 automaticamente sem derrubar a aplicação.
+
+get_pooled_conn() entrega uma conexão exclusiva de um pool, para código
+que roda em várias threads ao mesmo tempo (a conexão global não pode ser
+compartilhada entre threads). Devolva-a ao pool com .close().
+
+Armazenamento plugável: as funções acima delegam ao backend ativo – MySQL
+por padrão ou SQLite/memória (db_sqlite.py, mesmo esquema de
+analises_transacoes.sql) para testes e benchmarks sem servidor. Escolha com
+a variável de ambiente FORSAKENSCAN_DB ("sqlite" = memória,
+"sqlite:/caminho/arquivo.db") ou em código com usar_armazenamento().
+
+O pool do motor é configurável por FORSAKENSCAN_POOL_MOTOR_TAMANHO e
+FORSAKENSCAN_POOL_MOTOR_ESPERA_SEG; cada processo (worker do uvicorn, shard)
+tem o seu – some todos ao dimensionar contra o max_connections do MySQL.
 """
-import mysql.connector
-from mysql.connector import Error
+import os
+import re
+from abc import ABC, abstractmethod
+from threading import Lock
+from time import monotonic, sleep
+
+import metricas
 
 # 🔧  Ajuste estes parâmetros ao seu ambiente.
 _DB_CFG = {
@@ -19,28 +38,159 @@ _DB_CFG = {
     "collation": "utf8mb4_unicode_ci",
 }
 
-_conn = None   # cache da conexão viva
+# conexões do pool usado pelas threads do motor de fraude
+POOL_TAMANHO = int(os.environ.get("FORSAKENSCAN_POOL_MOTOR_TAMANHO", 8))
+# tempo máximo esperando uma conexão livre
+POOL_ESPERA_SEG = float(os.environ.get("FORSAKENSCAN_POOL_MOTOR_ESPERA_SEG", 10.0))
+
+
+class Armazenamento(ABC):
+    """
+    Interface dos backends. As conexões devolvidas seguem a API do
+    mysql-connector usada no projeto: cursor(dictionary=, buffered=),
+    commit(), rollback(), close(), is_connected(); os cursores aceitam
+    SQL com marcadores %s / %(nome)s.
+    """
+    nome = ""
+
+    @abstractmethod
+    def conexao(self):
+        """Conexão do processo (thread principal), reconectando se preciso"""
+
+    @abstractmethod
+    def conexao_pool(self):
+        """Conexão exclusiva para uma thread, com transação própria; .close() a devolve"""
+
+    def estatisticas_pool(self) -> dict:
+        """Tamanho e ocupação do pool (vazio se o backend não usa pool)"""
+        return {}
+
+
+class ArmazenamentoMySQL(Armazenamento):
+    """Servidor MySQL de _DB_CFG (driver mysql-connector importado sob demanda)"""
+    nome = "mysql"
+
+    def __init__(self, cfg: dict = None):
+        self.cfg = cfg or _DB_CFG
+        self._conn = None   # cache da conexão viva
+        self._pool = None
+        self._pool_lock = Lock()
+
+    def _connect(self):
+        """Cria uma nova conexão MySQL."""
+        import mysql.connector
+        return mysql.connector.connect(**self.cfg)
+
+    def conexao(self):
+        """
+        Devolve conexão ativa. Se ela estiver fechada por timeout
+        ou nunca tiver sido criada, reconecta automaticamente.
+        """
+        from mysql.connector import Error
+        try:
+            if self._conn is None or not self._conn.is_connected():
+                self._conn = self._connect()
+        except Error:
+            self._conn = self._connect()
+        return self._conn
+
+    def pool(self):
+        """Pool de conexões criado sob demanda (uma vez por processo)."""
+        from mysql.connector import pooling
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = pooling.MySQLConnectionPool(
+                    pool_name="forsakenscan",
+                    pool_size=POOL_TAMANHO,
+                    **self.cfg,
+                )
+        return self._pool
+
+    def conexao_pool(self):
+        """
+        Conexão exclusiva retirada do pool; reconecta se tiver expirado.
+        Se o pool estiver esgotado espera até POOL_ESPERA_SEG segundos.
+        """
+        from mysql.connector.errors import PoolError
+        pool = self.pool()
+        espera_ate = monotonic() + POOL_ESPERA_SEG
+        with metricas.medir_espera_pool("motor"):
+            while True:
+                try:
+                    con = pool.get_connection()
+                    break
+                except PoolError:
+                    # pool esgotado: espera alguém devolver uma conexão
+                    if monotonic() >= espera_ate:
+                        raise
+                    sleep(0.005)
+        if not con.is_connected():
+            con.reconnect(attempts=2, delay=0)
+        return con
 
+    def estatisticas_pool(self) -> dict:
+        if self._pool is None:
+            return {"tamanho": POOL_TAMANHO, "em_uso": 0, "livres": 0}
+        # o mysql-connector não expõe a ocupação; a fila interna guarda as livres
+        livres = self._pool._cnx_queue.qsize()
+        return {"tamanho": POOL_TAMANHO, "em_uso": POOL_TAMANHO - livres, "livres": livres}
 
-def _connect():
-    """Cria uma nova conexão MySQL."""
-    return mysql.connector.connect(**_DB_CFG)
+
+def _armazenamento_do_ambiente() -> Armazenamento:
+    escolha = os.environ.get("FORSAKENSCAN_DB", "mysql")
+    if escolha.startswith("sqlite"):
+        from db_sqlite import ArmazenamentoSQLite
+        return ArmazenamentoSQLite(escolha.partition(":")[2] or ":memory:")
+    return ArmazenamentoMySQL()
+
+
+_armazenamento = None
+_armazenamento_lock = Lock()
+
+
+def armazenamento() -> Armazenamento:
+    """Backend ativo (criado no primeiro uso a partir de FORSAKENSCAN_DB)"""
+    global _armazenamento
+    with _armazenamento_lock:
+        if _armazenamento is None:
+            _armazenamento = _armazenamento_do_ambiente()
+    return _armazenamento
+
+
+def usar_armazenamento(novo: Armazenamento) -> Armazenamento:
+    """Troca o backend do processo (ex.: ArmazenamentoSQLite() em testes)"""
+    global _armazenamento
+    with _armazenamento_lock:
+        _armazenamento = novo
+    return novo
 
 
 def get_conn():
-    """
-    Devolve conexão ativa. Se ela estiver fechada por timeout
-    ou nunca tiver sido criada, reconecta automaticamente.
-    """
-    global _conn
-    try:
-        if _conn is None or not _conn.is_connected():
-            _conn = _connect()
-    except Error:
-        _conn = _connect()
-    return _conn
+    """Conexão ativa do backend em uso."""
+    return armazenamento().conexao()
 
 
 def get_cursor(dictionary: bool = False, buffered: bool = False):
     """Retorna cursor já garantido com conexão ativa."""
     return get_conn().cursor(dictionary=dictionary, buffered=buffered)
+
+
+def com_orcamento(sql: str, ms: float) -> str:
+    """Limita o SELECT no servidor (MySQL); em outros bancos é só um comentário"""
+    if ms is None:
+        return sql
+    return re.sub(r"\bSELECT\b", f"SELECT /*+ MAX_EXECUTION_TIME({max(int(ms), 1)}) */",
+                  sql, count=1)
+
+
+def get_pool():
+    """Pool de conexões MySQL (só existe no backend MySQL)."""
+    return armazenamento().pool()
+
+
+def get_pooled_conn():
+    """
+    Conexão exclusiva para código que roda em threads.
+    Chame .close() para devolvê-la ao pool.
+    """
+    return armazenamento().conexao_pool()
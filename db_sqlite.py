@@ -0,0 +1,235 @@
+"""
+db_sqlite.py – backend SQLite/memória com o esquema de analises_transacoes.sql
+=============================================================================
+
+Implementa db.Armazenamento sobre o sqlite3 da biblioteca padrão, para
+rodar o motor de fraude, testes e benchmarks sem servidor MySQL:
+
+    from db import usar_armazenamento
+    from db_sqlite import ArmazenamentoSQLite
+    usar_armazenamento(ArmazenamentoSQLite())          # ":memory:"
+
+ou FORSAKENSCAN_DB=sqlite (memória) / FORSAKENSCAN_DB=sqlite:/tmp/x.db.
+
+O esquema não é duplicado: os CREATE TABLE / ALTER TABLE ADD INDEX de
+"Banco de Dados/analises_transacoes.sql" são traduzidos na criação do banco.
+As conexões imitam a API do mysql-connector usada no projeto e traduzem o
+SQL do motor (marcadores %s e %(nome)s, ON DUPLICATE KEY UPDATE, NOW()).
+
+Obs.: conexao() é uma conexão sqlite3 do processo, compartilhada entre
+threads por um lock. conexao_pool() abre uma conexão sqlite3 própria por
+chamada (transação separada, fechada no .close()); num banco ":memory:",
+que só existe dentro da sua conexão, devolve a compartilhada com o lock
+preso até o .close() – as threads se revezam no banco em vez de intercalar
+comandos, mas a transação é a mesma da conexão do processo.
+"""
+import re
+import sqlite3
+from datetime import date, datetime
+from pathlib import Path
+from threading import RLock
+
+from db import Armazenamento
+
+ESQUEMA_MYSQL = Path(__file__).resolve().parent / "Banco de Dados" / "analises_transacoes.sql"
+
+# ------------------------------------------------------------------
+# ESQUEMA – tradução da DDL MySQL
+# ------------------------------------------------------------------
+def _sem_comentarios(sql: str) -> str:
+    sql = re.sub(r"/\*.*?\*/", "", sql, flags=re.S)
+    return re.sub(r"--[^\n]*", "", sql)
+
+def _partes(corpo: str) -> list:
+    """Separa as definições de um CREATE TABLE pelas vírgulas de nível zero"""
+    partes, nivel, atual = [], 0, []
+    for c in corpo:
+        if c == "(":
+            nivel += 1
+        elif c == ")":
+            nivel -= 1
+        if c == "," and nivel == 0:
+            partes.append("".join(atual).strip())
+            atual = []
+        else:
+            atual.append(c)
+    partes.append("".join(atual).strip())
+    return [p for p in partes if p]
+
+def _coluna(definicao: str) -> str:
+    d = re.sub(r"\s+", " ", definicao)
+    d = re.sub(r"\bINT AUTO_INCREMENT PRIMARY KEY\b", "INTEGER PRIMARY KEY AUTOINCREMENT", d, flags=re.I)
+    d = re.sub(r"\bENUM\s*\([^)]*\)", "TEXT", d, flags=re.I)
+    d = re.sub(r"\bON UPDATE CURRENT_TIMESTAMP\b", "", d, flags=re.I)
+    d = re.sub(r"\bDEFAULT CURRENT_TIMESTAMP\b", "DEFAULT (datetime('now','localtime'))", d, flags=re.I)
+    d = re.sub(r"^UNIQUE KEY \w+ ", "UNIQUE ", d, flags=re.I)
+    return d.strip()
+
+def traduzir_esquema(sql_mysql: str) -> list:
+    """Comandos SQLite equivalentes às tabelas e índices do script MySQL"""
+    sql = _sem_comentarios(sql_mysql)
+    comandos = []
+    for tabela, corpo in re.findall(
+            r"^CREATE TABLE (\w+) \((.*?)\n\)\s*ENGINE\s*=\s*\w+\s*;", sql, flags=re.S | re.M):
+        colunas, indices = [], []
+        for parte in _partes(corpo):
+            m = re.match(r"(?:KEY|INDEX) (\w+)\s*\(([^)]*)\)", parte, flags=re.I)
+            if m:
+                indices.append(f"CREATE INDEX IF NOT EXISTS {m[1]} ON {tabela} ({m[2]})")
+            else:
+                colunas.append(_coluna(parte))
+        comandos.append(f"CREATE TABLE IF NOT EXISTS {tabela} (\n    "
+                        + ",\n    ".join(colunas) + "\n)")
+        comandos.extend(indices)
+    for tabela, indice, colunas in re.findall(
+            r"ALTER TABLE (\w+)\s+ADD (?:INDEX|KEY) (\w+)\s*\(([^)]*)\)\s*;", sql, flags=re.I):
+        comandos.append(f"CREATE INDEX IF NOT EXISTS {indice} ON {tabela} ({colunas})")
+    return comandos
+
+# ------------------------------------------------------------------
+# DML – tradução do dialeto usado pelo motor
+# ------------------------------------------------------------------
+_cache_sql: dict = {}
+
+def traduzir_sql(sql: str) -> str:
+    """%s → ?, %(nome)s → :nome, ON DUPLICATE KEY UPDATE → ON CONFLICT DO UPDATE"""
+    traduzido = _cache_sql.get(sql)
+    if traduzido is None:
+        t = re.sub(r"%\((\w+)\)s", r":\1", sql)
+        t = t.replace("%s", "?")
+        t = re.sub(r"\bON DUPLICATE KEY UPDATE\b", "ON CONFLICT DO UPDATE SET", t, flags=re.I)
+        t = re.sub(r"\bVALUES\((\w+)\)", r"excluded.\1", t, flags=re.I)
+        t = re.sub(r"\bNOW\(\)", "datetime('now','localtime')", t, flags=re.I)
+        traduzido = _cache_sql[sql] = t
+    return traduzido
+
+_DATA_HORA = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(\.\d{1,6})?$")
+_DATA = re.compile(r"\d{4}-\d{2}-\d{2}$")
+
+def _valor(v):
+    """Textos de data/hora voltam como datetime/date, como no mysql-connector"""
+    if isinstance(v, str) and len(v) >= 10 and v[4] == "-":
+        if _DATA_HORA.match(v):
+            return datetime.fromisoformat(v)
+        if _DATA.match(v):
+            return date.fromisoformat(v)
+    return v
+
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(sep=" "))
+sqlite3.register_adapter(date, lambda d: d.isoformat())
+
+
+class _Cursor:
+    def __init__(self, cur, lock, dicionario: bool):
+        self._cur, self._lock, self._dicionario = cur, lock, dicionario
+
+    def execute(self, sql: str, params=()):
+        with self._lock:
+            self._cur.execute(traduzir_sql(sql), params or ())
+        return self
+
+    def executemany(self, sql: str, linhas):
+        with self._lock:
+            self._cur.executemany(traduzir_sql(sql), linhas)
+        return self
+
+    def _linha(self, r):
+        if r is None:
+            return None
+        valores = [_valor(v) for v in r]
+        if self._dicionario:
+            return dict(zip((c[0] for c in self._cur.description), valores))
+        return tuple(valores)
+
+    def fetchall(self) -> list:
+        with self._lock:
+            linhas = self._cur.fetchall()
+        return [self._linha(r) for r in linhas]
+
+    def fetchone(self):
+        with self._lock:
+            return self._linha(self._cur.fetchone())
+
+    @property
+    def description(self):
+        return self._cur.description
+
+    @property
+    def rowcount(self) -> int:
+        return self._cur.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cur.lastrowid
+
+    def close(self) -> None:
+        self._cur.close()
+
+
+class _Conexao:
+    """
+    Conexão no formato do mysql-connector sobre uma conexão sqlite3;
+    `devolver` é chamada (uma vez) no .close()
+    """
+
+    def __init__(self, con: sqlite3.Connection, lock, devolver=None):
+        self._con, self._lock, self._devolver = con, lock, devolver
+
+    def cursor(self, dictionary: bool = False, buffered: bool = False):
+        with self._lock:
+            return _Cursor(self._con.cursor(), self._lock, dictionary)
+
+    def commit(self) -> None:
+        with self._lock:
+            self._con.commit()
+
+    def rollback(self) -> None:
+        with self._lock:
+            self._con.rollback()
+
+    def is_connected(self) -> bool:
+        return True
+
+    def reconnect(self, *args, **kwargs) -> None:
+        pass
+
+    def close(self) -> None:
+        """Devolve a conexão (a do processo continua aberta)"""
+        devolver, self._devolver = self._devolver, None
+        if devolver is not None:
+            devolver()
+
+
+def envolver(con: sqlite3.Connection) -> _Conexao:
+    """Conexão sqlite3 aberta fora daqui (ex.: pelo engine da API) na API do mysql-connector"""
+    return _Conexao(con, RLock())
+
+
+class ArmazenamentoSQLite(Armazenamento):
+    """Banco SQLite (":memory:" por padrão) criado com o esquema do projeto"""
+    nome = "sqlite"
+
+    def __init__(self, caminho: str = ":memory:", esquema: Path = ESQUEMA_MYSQL):
+        self.caminho = caminho
+        self._lock = RLock()
+        self._sqlite = sqlite3.connect(caminho, check_same_thread=False)
+        with self._lock:
+            for comando in traduzir_esquema(Path(esquema).read_text(encoding="utf-8")):
+                self._sqlite.execute(comando)
+            self._sqlite.commit()
+        self._conexao = _Conexao(self._sqlite, self._lock)
+
+    def conexao(self):
+        return self._conexao
+
+    def conexao_pool(self):
+        if self.caminho == ":memory:":
+            self._lock.acquire()
+            return _Conexao(self._sqlite, self._lock, devolver=self._lock.release)
+        con = sqlite3.connect(self.caminho, check_same_thread=False)
+        return _Conexao(con, RLock(), devolver=con.close)
+
+    def fechar(self) -> None:
+        """Fecha o banco (um ":memory:" é descartado)"""
+        with self._lock:
+            self._sqlite.close()
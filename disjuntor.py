@@ -0,0 +1,100 @@
+"""
+disjuntor.py – circuit breakers das fontes de dados das regras
+==============================================================
+
+Cada regra que depende do banco tem um orçamento de tempo (orcamento_ms em
+fraude.metadados) para a consulta do seu contexto. Uma consulta que falha –
+inclusive por estourar o orçamento, que o MySQL aplica com
+MAX_EXECUTION_TIME – ou que termina depois dele conta como falha da regra.
+
+Após FALHAS_PARA_ABRIR falhas seguidas o disjuntor da regra abre: durante
+ABERTO_SEG a regra é pulada sem consulta (avaliação degradada, informada no
+veredicto). Depois disso uma avaliação de teste passa (meio-aberto): se a
+consulta couber no orçamento o disjuntor fecha, senão abre de novo.
+"""
+from threading import Lock
+from time import monotonic
+
+FALHAS_PARA_ABRIR = 3
+ABERTO_SEG = 30.0
+
+FECHADO, ABERTO, MEIO_ABERTO = "fechado", "aberto", "meio_aberto"
+
+
+class Disjuntor:
+    """Circuit breaker thread-safe com contadores de falhas e pulos"""
+
+    def __init__(self, nome: str, falhas_para_abrir: int = FALHAS_PARA_ABRIR,
+                 aberto_seg: float = ABERTO_SEG):
+        self.nome = nome
+        self.falhas_para_abrir = falhas_para_abrir
+        self.aberto_seg = aberto_seg
+        self.estado = FECHADO
+        self._falhas_seguidas = 0
+        self._aberto_ate = 0.0
+        self._lock = Lock()
+        self.falhas = 0
+        self.pulos = 0
+        self.aberturas = 0
+
+    def permite(self) -> bool:
+        """False enquanto aberto; deixa passar uma tentativa após aberto_seg"""
+        with self._lock:
+            if self.estado == FECHADO:
+                return True
+            if self.estado == ABERTO and monotonic() >= self._aberto_ate:
+                self.estado = MEIO_ABERTO
+                return True
+            self.pulos += 1
+            return False
+
+    def sucesso(self) -> None:
+        with self._lock:
+            self.estado = FECHADO
+            self._falhas_seguidas = 0
+
+    def falha(self) -> None:
+        with self._lock:
+            self.falhas += 1
+            self._falhas_seguidas += 1
+            if self.estado == MEIO_ABERTO or self._falhas_seguidas >= self.falhas_para_abrir:
+                if self.estado != ABERTO:
+                    self.aberturas += 1
+                self.estado = ABERTO
+                self._aberto_ate = monotonic() + self.aberto_seg
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {
+                "estado": self.estado,
+                "falhas": self.falhas,
+                "falhas_seguidas": self._falhas_seguidas,
+                "pulos": self.pulos,
+                "aberturas": self.aberturas,
+            }
+
+
+_disjuntores = {}
+_lock = Lock()
+
+
+def de(nome: str) -> Disjuntor:
+    """Disjuntor do nome (criado no primeiro uso)"""
+    with _lock:
+        if nome not in _disjuntores:
+            _disjuntores[nome] = Disjuntor(nome)
+        return _disjuntores[nome]
+
+
+def estatisticas() -> dict:
+    """Estado e contadores de todos os disjuntores"""
+    with _lock:
+        disjuntores = dict(_disjuntores)
+    return {nome: d.estatisticas() for nome, d in disjuntores.items()}
+
+
+def rearmar() -> None:
+    """Fecha todos os disjuntores (ex.: após resolver o incidente)"""
+    with _lock:
+        for d in _disjuntores.values():
+            d.sucesso()
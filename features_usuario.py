@@ -0,0 +1,285 @@
+"""
+features_usuario.py – agregados por usuário materializados em features_usuario
+==============================================================================
+
+O Dashboard (radar de risco) e o Mestre (Contas de Risco) recalculavam os
+mesmos agregados por usuário a partir das tabelas brutas: transações e
+valor suspeitos, tentativas de exceder limite, bloqueios, edições de perfil,
+trocas de senha e total de compras. Eles agora leem uma linha por usuário de
+`features_usuario`, mantida de forma incremental:
+
+  - transacoes: o stream_transacoes.py soma cada micro-lote já com os
+    veredictos, no mesmo commit em que grava o veredicto e a posição (as
+    linhas que aparecem nas suas lacunas entram em um lote seguinte);
+  - tentativas_limite, historico_bloqueios, fatos_usuarios, compras_online:
+    seguidas pelo `id` (posições "features:<tabela>" em posicao_stream) a
+    cada volta do stream (ver acompanhar).
+
+Cada atualização é um agregado das linhas lidas, pelos seus ids (chave
+primária), e um INSERT … ON DUPLICATE KEY UPDATE col = col + incremento.
+Um INSERT confirmado depois de outro com id maior deixa um buraco abaixo
+da posição: os ids faltantes vão para lacunas_stream e são procurados de
+novo a cada volta, por até LACUNA_SEG (depois disso, foram rollback) – ver
+gravar_lacunas e recuperar_lacunas, usadas também pelo stream.
+
+Quem lê a tabela confere atualizada(): com o stream parado ou atrasado os
+agregados ficam defasados e devem ser calculados das tabelas de origem.
+
+Na primeira execução – ou com `python features_usuario.py --reconstruir` –
+a tabela é recalculada do zero (ver reconstruir).
+
+Obs.: os agregados são de todo o histórico; as regras do motor continuam
+lendo as janelas curtas (5 min, 1 h, 7 dias) do contexto de risco.
+"""
+import argparse
+from datetime import datetime, timedelta
+
+from db import get_conn
+
+PREFIXO = "features:"
+LACUNA_SEG = 300           # por quanto tempo um id faltante abaixo da posição é procurado
+LACUNAS_MAX = 10_000       # ids faltantes guardados por volta (mais que isso: rollback em massa)
+DEFASAGEM_MAX_SEG = 60     # posição parada há mais que isso com linhas novas = defasada
+
+# Incrementos por usuário das linhas de cada tabela de origem que atendem {filtro}
+FONTES = {
+    "transacoes": """
+        SELECT user_id,
+               COUNT(*)                                          AS qtd_transacoes,
+               SUM(valor)                                        AS valor_transacoes,
+               SUM(CASE WHEN suspeita = 1 THEN 1 ELSE 0 END)     AS qtd_suspeitas,
+               SUM(CASE WHEN suspeita = 1 THEN valor ELSE 0 END) AS valor_suspeitas
+        FROM transacoes
+        WHERE {filtro}
+        GROUP BY user_id
+    """,
+    "tentativas_limite": """
+        SELECT user_id, COUNT(*) AS tentativas_limite
+        FROM tentativas_limite
+        WHERE {filtro}
+        GROUP BY user_id
+    """,
+    "historico_bloqueios": """
+        SELECT user_id,
+               SUM(CASE WHEN acao = 'BLOQUEIO' THEN 1 ELSE 0 END)    AS bloqueios,
+               SUM(CASE WHEN acao = 'DESBLOQUEIO' THEN 1 ELSE 0 END) AS desbloqueios
+        FROM historico_bloqueios
+        WHERE {filtro}
+        GROUP BY user_id
+    """,
+    "fatos_usuarios": """
+        SELECT user_id,
+               SUM(CASE WHEN acao = 'editar_perfil' THEN 1 ELSE 0 END) AS edicoes_perfil,
+               SUM(CASE WHEN acao = 'Alterar senha' THEN 1 ELSE 0 END) AS alteracoes_senha
+        FROM fatos_usuarios
+        WHERE {filtro}
+        GROUP BY user_id
+    """,
+    "compras_online": """
+        SELECT user_id,
+               SUM(COALESCE(valor_total, valor_unit * COALESCE(qtd, 1))) AS total_compras
+        FROM compras_online
+        WHERE {filtro}
+        GROUP BY user_id
+    """,
+}
+# Seguidas por acompanhar(); as transações vêm do stream_transacoes.py
+AUDITORIA = ("tentativas_limite", "historico_bloqueios", "fatos_usuarios", "compras_online")
+
+
+def _somar(cur, fonte: str, filtro: str, params: tuple) -> int:
+    cur.execute(FONTES[fonte].format(filtro=filtro), params)
+    linhas = cur.fetchall()
+    if not linhas:
+        return 0
+    colunas = [c for c in linhas[0] if c != "user_id"]
+    cur.executemany(f"""
+        INSERT INTO features_usuario (user_id, {", ".join(colunas)})
+        VALUES ({", ".join(["%s"] * (len(colunas) + 1))})
+        ON DUPLICATE KEY UPDATE
+            {", ".join(f"{c} = {c} + VALUES({c})" for c in colunas)}
+    """, [(r["user_id"], *(r[c] or 0 for c in colunas)) for r in linhas])
+    return len(linhas)
+
+
+def somar(cur, fonte: str, de_id: int, ate_id: int) -> int:
+    """
+    Soma em features_usuario as linhas de `fonte` com id em (de_id, ate_id].
+    Não faz commit: roda na transação de quem chamou. `cur` deve ser um
+    cursor dictionary=True. Retorna a quantidade de usuários atualizados.
+    """
+    if ate_id <= de_id:
+        return 0
+    return _somar(cur, fonte, "id > %s AND id <= %s", (de_id, ate_id))
+
+
+def somar_ids(cur, fonte: str, ids: list) -> int:
+    """Como somar, para as linhas de `fonte` com os ids informados"""
+    if not ids:
+        return 0
+    return _somar(cur, fonte, f"id IN ({','.join(['%s'] * len(ids))})", tuple(ids))
+
+
+def _posicao(cur, fonte: str):
+    cur.execute("SELECT ultimo_id FROM posicao_stream WHERE consumidor = %s", (PREFIXO + fonte,))
+    r = cur.fetchone()
+    return r["ultimo_id"] if r else None
+
+
+def _maior_id(cur, tabela: str) -> int:
+    cur.execute(f"SELECT COALESCE(MAX(id), 0) AS ultimo FROM {tabela}")
+    return cur.fetchone()["ultimo"]
+
+
+def _gravar_posicao(cur, fonte: str, ultimo: int) -> None:
+    cur.execute("""
+        INSERT INTO posicao_stream (consumidor, ultimo_id, atualizado_em) VALUES (%s, %s, NOW())
+        ON DUPLICATE KEY UPDATE ultimo_id = VALUES(ultimo_id), atualizado_em = NOW()
+    """, (PREFIXO + fonte, ultimo))
+
+
+def recuperar_lacunas(cur, consumidor: str, tabela: str) -> list:
+    """
+    Ids faltantes de `consumidor` que já apareceram em `tabela`; esquece
+    as lacunas mais antigas que LACUNA_SEG. Quem processa as linhas chama
+    esquecer_lacunas na mesma transação.
+    """
+    cur.execute("DELETE FROM lacunas_stream WHERE consumidor = %s AND visto_em < %s",
+                (consumidor, datetime.now() - timedelta(seconds=LACUNA_SEG)))
+    cur.execute(f"""
+        SELECT l.id
+        FROM lacunas_stream l
+        JOIN {tabela} t ON t.id = l.id
+        WHERE l.consumidor = %s
+        ORDER BY l.id
+    """, (consumidor,))
+    return [r["id"] for r in cur.fetchall()]
+
+
+def esquecer_lacunas(cur, consumidor: str, ids: list) -> None:
+    if ids:
+        cur.execute(f"""
+            DELETE FROM lacunas_stream
+            WHERE consumidor = %s AND id IN ({",".join(["%s"] * len(ids))})
+        """, (consumidor, *ids))
+
+
+def gravar_lacunas(cur, consumidor: str, de_id: int, ate_id: int, lidos: list) -> None:
+    """Guarda os ids em (de_id, ate_id] que não estavam entre os lidos"""
+    faltantes = sorted(set(range(de_id + 1, ate_id + 1)) - set(lidos))
+    if len(faltantes) > LACUNAS_MAX:
+        print(f"{consumidor}: {len(faltantes)} ids faltantes; "
+              f"guardados só os {LACUNAS_MAX} maiores")
+        faltantes = faltantes[-LACUNAS_MAX:]
+    if faltantes:
+        agora = datetime.now()
+        cur.executemany("""
+            INSERT INTO lacunas_stream (consumidor, id, visto_em) VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE visto_em = visto_em
+        """, [(consumidor, i, agora) for i in faltantes])
+
+
+def _recuperar_lacunas(cur, fonte: str) -> int:
+    """Soma as linhas que apareceram nos ids faltantes de `fonte`. Retorna as linhas somadas."""
+    ids = recuperar_lacunas(cur, PREFIXO + fonte, fonte)
+    somar_ids(cur, fonte, ids)
+    esquecer_lacunas(cur, PREFIXO + fonte, ids)
+    return len(ids)
+
+
+def acompanhar(cur) -> int:
+    """
+    Soma as linhas novas das tabelas de AUDITORIA (e as que apareceram em
+    lacunas) e avança as posições, tudo em um commit. Retorna a quantidade
+    de linhas processadas.
+    """
+    total = 0
+    for fonte in AUDITORIA:
+        total += _recuperar_lacunas(cur, fonte)
+        de_id = _posicao(cur, fonte) or 0
+        cur.execute(f"SELECT id FROM {fonte} WHERE id > %s ORDER BY id", (de_id,))
+        ids = [r["id"] for r in cur.fetchall()]
+        if ids:
+            somar_ids(cur, fonte, ids)
+            gravar_lacunas(cur, PREFIXO + fonte, de_id, ids[-1], ids)
+            _gravar_posicao(cur, fonte, ids[-1])
+            total += len(ids)
+    get_conn().commit()
+    return total
+
+
+def atualizada(cur, defasagem_max: float = DEFASAGEM_MAX_SEG) -> bool:
+    """
+    False se há linhas de origem ainda não somadas e a posição delas (o
+    stream_transacoes.py, para transacoes; acompanhar, para as demais) não
+    anda há mais de defasagem_max segundos – ex.: stream parado. Quem lê
+    features_usuario calcula das tabelas de origem nesse caso.
+    """
+    from stream_transacoes import CONSUMIDOR
+
+    limite = datetime.now() - timedelta(seconds=defasagem_max)
+    for fonte, consumidor in [("transacoes", CONSUMIDOR)] + [(f, PREFIXO + f) for f in AUDITORIA]:
+        cur.execute("SELECT ultimo_id, atualizado_em FROM posicao_stream WHERE consumidor = %s",
+                    (consumidor,))
+        r = cur.fetchone()
+        if r is None:
+            return False
+        if _maior_id(cur, fonte) > r["ultimo_id"] and (r["atualizado_em"] is None
+                                                       or r["atualizado_em"] < limite):
+            return False
+    return True
+
+
+def reconstruir(cur, ate_transacao: int) -> None:
+    """
+    Recalcula features_usuario do zero em um commit: transações até
+    ate_transacao (a posição do stream, que soma as seguintes e as que
+    aparecerem nas suas lacunas) e as tabelas de AUDITORIA inteiras, cujas
+    posições passam a ser o maior id atual.
+    """
+    from stream_transacoes import CONSUMIDOR
+
+    cur.execute("DELETE FROM features_usuario")
+    cur.execute("DELETE FROM lacunas_stream WHERE consumidor LIKE %s", (PREFIXO + "%",))
+    _somar(cur, "transacoes",
+           "id <= %s AND id NOT IN (SELECT id FROM lacunas_stream WHERE consumidor = %s)",
+           (ate_transacao, CONSUMIDOR))
+    for fonte in AUDITORIA:
+        ultimo = _maior_id(cur, fonte)
+        somar(cur, fonte, 0, ultimo)
+        _gravar_posicao(cur, fonte, ultimo)
+    get_conn().commit()
+
+
+def garantir(cur, ate_transacao: int) -> None:
+    """Reconstrói a tabela se ela ainda não foi preenchida (sem posições gravadas)"""
+    if _posicao(cur, AUDITORIA[0]) is None:
+        print("features_usuario: reconstruindo a partir das tabelas de origem")
+        reconstruir(cur, ate_transacao)
+
+
+def main() -> None:
+    from stream_transacoes import CONSUMIDOR
+
+    ap = argparse.ArgumentParser(description="Manutenção da tabela features_usuario")
+    ap.add_argument("--reconstruir", action="store_true",
+                    help="recalcula a tabela a partir das tabelas de origem")
+    args = ap.parse_args()
+
+    cur = get_conn().cursor(dictionary=True, buffered=True)
+    try:
+        if args.reconstruir:
+            cur.execute("SELECT ultimo_id FROM posicao_stream WHERE consumidor = %s", (CONSUMIDOR,))
+            r = cur.fetchone()
+            reconstruir(cur, r["ultimo_id"] if r else _maior_id(cur, "transacoes"))
+        else:
+            print(f"{acompanhar(cur)} linhas novas somadas")
+    except Exception as e:
+        print(f"Erro ao atualizar features_usuario: {str(e)}")
+        get_conn().rollback()
+    finally:
+        cur.close()
+
+
+if __name__ == "__main__":
+    main()
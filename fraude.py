@@ -3,232 +3,940 @@ fraude.py – motor de regras de detecção de fraude
 ================================================
 
 Implementa todas as regras de detecção de fraude para o sistema bancário.
-Cada regra devolve (flag: bool, motivo: str). A função pública
-`avaliar_transacao(tx_dict)` percorre todas e retorna (suspeita, motivos).
+Cada regra é uma função pura de (tx, ctx) e devolve (flag: bool, motivo: str),
+onde ctx é o contexto de risco do usuário já carregado do banco – nenhuma
+regra consulta o banco por conta própria (ver contexto_risco).
+
+A função pública `avaliar_transacao(tx_dict)` avalia uma transação e
+`avaliar_lote(txs)` avalia várias de uma vez, carregando o contexto de
+todos os usuários envolvidos com poucas consultas agregadas (set-based).
+Ambas retornam (suspeita, motivos) por transação; avaliar_lote_com_score
+devolve também o score numérico de risco de cada uma (ver score).
+
+Nenhuma conexão é aberta na importação: o banco vem do backend ativo de
+`db` (MySQL ou SQLite/memória, ver db_sqlite) no primeiro uso, quando as
+janelas de velocidade também são reconstruídas (ver iniciar_janelas).
+
+Tempo por regra e por consulta, disparos e erros ficam em `metricas`
+(ver metricas_motor e GET /metricas/ no backend).
 """
 
 # fraude.py  –  motor de regras de detecção de fraude
-from datetime import datetime, time, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Lock, RLock
+from time import perf_counter
+
+import auditoria
+from cache import CacheTTL
+import config_regras
+import disjuntor
+import grafo_transferencias
+from db import POOL_TAMANHO, armazenamento, com_orcamento, get_conn, get_cursor, get_pool, get_pooled_conn
+import metricas
+import score
+import turnos
+import velocidade
+
+# ------------------------------------------------------------------
+# JANELAS EM MEMÓRIA – velocidade e grafo de transferências, reconstruídos
+# do banco na primeira avaliação
+# ------------------------------------------------------------------
+_janelas_prontas = False
+_janelas_lock = RLock()
+
+def iniciar_janelas(ate_id: int = None, shard: tuple = None):
+    """
+    Reconstrói as janelas de velocidade e o grafo de transferências a partir
+    de `transacoes` (só até ate_id, se informado). Chamada sob demanda pela primeira avaliação;
+    o stream chama antes de começar, limitada à sua posição.
+    shard=(i, n): processo shard i de n (ver shards) – só a janela por
+    usuário dos usuários do shard; a por IP e o grafo ficam no roteador.
+    """
+    global _janelas_prontas
+    with _janelas_lock:
+        cur = get_cursor(dictionary=True, buffered=True)
+        try:
+            if shard is None:
+                velocidade.reconstruir(cur, ate_id)
+                grafo_transferencias.reconstruir(cur, ate_id)
+            else:
+                i, n = shard
+                velocidade.reconstruir(cur, ate_id, do_usuario=lambda uid: hash(uid) % n == i,
+                                       por_ip=False)
+        except Exception as e:
+            print(f"Erro ao reconstruir janelas em memória: {str(e)}")
+            get_conn().rollback()
+        finally:
+            cur.close()
+        _janelas_prontas = True
+
+def _garantir_janelas():
+    if not _janelas_prontas:
+        with _janelas_lock:
+            if _janelas_prontas:
+                return
+            iniciar_janelas()
 
-from db import get_conn, get_cursor      # ← NOVO
-conn   = get_conn()                      # ← NOVO
-cursor = get_cursor(dictionary=True, buffered=True)   # ← NOVO
+# ------------------------------------------------------------------
+# METADADOS DAS REGRAS – severidade, custo e tipos de transação
+# ------------------------------------------------------------------
+SEVERIDADE_CRITICA, SEVERIDADE_ALTA, SEVERIDADE_MEDIA = 3, 2, 1
+SEVERIDADE_BLOQUEIO = SEVERIDADE_ALTA   # disparo a partir daqui bloqueia a transação
+
+def metadados(severidade: int, custo: int, tipos: tuple = None, orcamento_ms: float = None):
+    """
+    Anota uma regra com metadados estáticos usados pelo motor:
+      severidade   – ordena os motivos e define os disparos bloqueantes
+      custo        – 0 = só contexto em memória; maior = mais consultas ao banco
+      tipos        – tipo_transacao aos quais a regra se aplica (None = todos)
+      orcamento_ms – tempo máximo da consulta do contexto da regra em
+                     avaliar_transacao (None = sem orçamento, ver disjuntor)
+    """
+    def anotar(regra):
+        regra.severidade, regra.custo, regra.tipos = severidade, custo, tipos
+        regra.orcamento_ms = orcamento_ms
+        return regra
+    return anotar
+
+def _aplica(regra, tipo) -> bool:
+    return regra.tipos is None or tipo in regra.tipos
 
 # ------------------------------------------------------------------
 # REGRA #01 – LIMITE POR TURNO (VERSÃO MELHORADA)
 # ------------------------------------------------------------------
-H_INI_DIA, H_FIM_DIA = time(6, 0), time(22,59,59)
-H_INI_NOITE, H_FIM_NOITE = time(23, 0), time(5,59,59)
-
-def _obter_limites_usuario(user_id: int) -> tuple:
-    """Obtém limites personalizados ou retorna padrão se não existir"""
-    cursor.execute("""
-        SELECT limite_dia, limite_noite 
-        FROM limites_usuario
-        WHERE user_id = %s
-    """, (user_id,))
-    result = cursor.fetchone()
-    return (result["limite_dia"], result["limite_noite"]) if result else (10_000, 5_000)
-
-def _turno(dt: datetime) -> str:
-    """Determina se é turno dia ou noite"""
-    return "dia" if H_INI_DIA <= dt.time() <= H_FIM_DIA else "noite"
-
-def _total_turno(user_id: int, turno: str) -> float:
-    """Calcula o total gasto no turno atual, considerando apenas transações relevantes"""
-    tipos_considerados = ("Compra", "Pagamento", "Transferência", "Saque", "PIX")
-    
-    if turno == "dia":
-        cursor.execute("""
-            SELECT COALESCE(SUM(valor),0) AS total
-            FROM transacoes
-            WHERE user_id = %s
-              AND DATE(data_hora)=CURDATE()
-              AND TIME(data_hora) BETWEEN %s AND %s
-              AND tipo_transacao IN %s
-        """, (user_id, H_INI_DIA, H_FIM_DIA, tipos_considerados))
-    else:
-        cursor.execute("""
-            SELECT COALESCE(SUM(valor),0) AS total
-            FROM transacoes
-            WHERE user_id = %s
-              AND (
-                    (DATE(data_hora)=CURDATE() AND TIME(data_hora)>=%s)
-                 OR (DATE(data_hora)=DATE_SUB(CURDATE(),INTERVAL 1 DAY)
-                    AND TIME(data_hora)<=%s
-              )
-              AND tipo_transacao IN %s
-        """, (user_id, H_INI_NOITE, H_FIM_NOITE, tipos_considerados))
-    
-    return float(cursor.fetchone()["total"])
-
-def _registrar_tentativa_limite(user_id: int, valor: float, limite: float, turno: str):
-    """Registra tentativa de exceder limite para auditoria"""
-    cursor.execute("""
-        INSERT INTO tentativas_limite 
-        (user_id, valor_tentativa, limite, turno, data_hora) 
-        VALUES (%s, %s, %s, %s, NOW())
-    """, (user_id, valor, limite, turno))
-    conn.commit()
-
-def regra_01_limites_turno(tx: dict):
-    """Versão melhorada da regra de limites por turno"""
+TIPOS_VELOCIDADE = velocidade.TIPOS_VELOCIDADE
+_janela_turno = turnos.janela_turno
+
+# Limites mudam raramente (form "Configurar Limites por Usuário" do Mestre
+# e gerador): ficam em cache LRU com TTL. Quem grava em limites_usuario
+# chama publicar_limites() na mesma transação e, após o commit,
+# invalidar_limites() no próprio processo; os demais processos veem a nova
+# versão em versao_limites em até LIMITES_VERIFICACAO_SEG e descartam o cache.
+LIMITES_VERIFICACAO_SEG = 1.0   # intervalo mínimo entre leituras de versao_limites
+
+_versao_limites = None
+_proxima_verificacao_limites = 0.0
+
+def _versao_limites_banco():
+    """versao_limites.versao, relida no máximo a cada LIMITES_VERIFICACAO_SEG; None se não der"""
+    global _versao_limites, _proxima_verificacao_limites
+    agora = perf_counter()
+    if agora < _proxima_verificacao_limites:
+        return _versao_limites
+    _proxima_verificacao_limites = agora + LIMITES_VERIFICACAO_SEG
+
+    def _ler(con):
+        cur = con.cursor(dictionary=True, buffered=True)
+        try:
+            cur.execute("SELECT versao FROM versao_limites WHERE id = 1")
+            r = cur.fetchone()
+            return r["versao"] if r else 0
+        finally:
+            cur.close()
     try:
-        # Obter limites personalizados para o usuário
-        limite_dia, limite_noite = _obter_limites_usuario(tx["user_id"])
-        
-        # Determinar turno e limite aplicável
-        turno_tx = _turno(tx["data_hora"])
-        limite = limite_dia if turno_tx == "dia" else limite_noite
-        
-        # Calcular soma das transações no turno
-        soma = _total_turno(tx["user_id"], turno_tx) + float(tx["valor"])
-        
-        if soma > limite:
-            # Registrar tentativa e retornar alerta
-            _registrar_tentativa_limite(tx["user_id"], soma, limite, turno_tx)
-            return True, f"Limite {turno_tx} excedido (R$ {soma:,.2f} > {limite:,.2f})"
-        
-        return False, ""
-    
+        _versao_limites = _com_conexao_do_pool(_ler)
     except Exception as e:
-        print(f"Erro na regra de limites: {str(e)}")
-        conn.rollback()
-        return False, ""
+        print(f"Erro ao ler versão dos limites: {str(e)}")
+    return _versao_limites
+
+def _versao_limites_vencida() -> bool:
+    """True se a próxima leitura de versao_limites vai ao banco"""
+    return perf_counter() >= _proxima_verificacao_limites
+
+_cache_limites = CacheTTL(tamanho_max=10_000, ttl=300, versao=_versao_limites_banco)
+
+def invalidar_limites(user_id: int = None):
+    """Descarta do cache os limites de um usuário (ou de todos)"""
+    _cache_limites.invalidar(user_id)
+
+def publicar_limites(cur):
+    """
+    Avisa os outros processos que limites_usuario mudou: incrementa
+    versao_limites na transação de cur (sem commit – vale junto com a
+    gravação dos limites).
+    """
+    cur.execute("""
+        INSERT INTO versao_limites (id, versao, atualizado_em)
+        VALUES (1, 1, NOW())
+        ON DUPLICATE KEY UPDATE versao = versao + 1, atualizado_em = NOW()
+    """)
+
+def limites_padrao() -> tuple:
+    """(dia, noite) de quem não tem linha em limites_usuario – ver config_regras"""
+    cfg = config_regras.atual()
+    return cfg["limite_dia_padrao"], cfg["limite_noite_padrao"]
+
+# O cache também guarda os limites padrão: uma nova configuração o descarta
+config_regras.ao_trocar(lambda cfg: invalidar_limites())
+
+def estatisticas_cache_limites() -> dict:
+    """Acertos, erros, tamanho e taxa de acerto do cache de limites"""
+    return _cache_limites.estatisticas()
+
+def metricas_motor() -> dict:
+    """Tempos, disparos e erros do motor, cache de limites, fila de auditoria, versão das regras e disjuntores"""
+    return {**metricas.instantaneo(), "cache_limites": estatisticas_cache_limites(),
+            "auditoria": auditoria.estatisticas(), "regras_versao": config_regras.versao(),
+            "disjuntores": disjuntor.estatisticas()}
+
+def _registrar_tentativa_limite(user_id: int, valor: float, limite: float, turno: str, con=None):
+    """
+    Registra tentativa de exceder limite para auditoria (gravada em lote, ver
+    auditoria); com con, na transação da unidade de trabalho
+    """
+    _gravar_tentativas([(user_id, valor, limite, turno, datetime.now())], con)
+
+def _gravar_tentativas(linhas: list, con=None):
+    """Linhas de tentativas_limite: com con na transação dela, senão pela fila de auditoria"""
+    itens = [("tentativas_limite", linha) for linha in linhas]
+    if not itens:
+        return
+    if con is not None:
+        auditoria.gravar_em(con, itens)
+        return
+    for i, (tabela, linha) in enumerate(itens):
+        if not auditoria.enfileirar(tabela, linha):
+            auditoria.gravar(itens[i:])
+            break
 
-# [MANTENHA O RESTO DO ARQUIVO INALTERADO A PARTIR DAQUI...]
-# [AS OUTRAS REGRAS (02-07) PERMANECEM EXATAMENTE COMO ESTÃO NO SEU ARQUIVO ORIGINAL]
+def _excesso_turno(tx: dict, ctx: dict) -> tuple:
+    """Devolve (soma, limite, turno) do turno da transação, já somando a atual"""
+    turno_tx = ctx["turno"]
+    limite = ctx["limite_dia"] if turno_tx == "dia" else ctx["limite_noite"]
+    return ctx["total_turno"] + float(tx["valor"]), limite, turno_tx
+
+@metadados(severidade=SEVERIDADE_CRITICA, custo=0)
+def regra_01_limites_turno(tx: dict, ctx: dict):
+    """Versão melhorada da regra de limites por turno"""
+    soma, limite, turno_tx = _excesso_turno(tx, ctx)
+    if soma > limite:
+        return True, f"Limite {turno_tx} excedido (R$ {soma:,.2f} > {limite:,.2f})"
+    return False, ""
 
 # ------------------------------------------------------------------
 # REGRA #02 – 5+ transações em 5 minutos (mesmo CPF ou vários CPFs)
 # ------------------------------------------------------------------
-def regra_02_5_transacoes_5min(tx: dict):
+@metadados(severidade=SEVERIDADE_ALTA, custo=0)
+def regra_02_5_transacoes_5min(tx: dict, ctx: dict):
+    cfg = ctx["regras"]
     # Verificação para o mesmo usuário
-    cursor.execute("""
-        SELECT COUNT(*) AS c
-        FROM transacoes
-        WHERE user_id = %s
-          AND tipo_transacao IN ('Compra','Pagamento','Transferência')
-          AND data_hora >= NOW() - INTERVAL 5 MINUTE
-    """, (tx["user_id"],))
-    mesmo_usuario = cursor.fetchone()["c"] >= 4  # Já conta com a atual
-    
+    mesmo_usuario = ctx["tx_5min"] >= cfg["tx_usuario_5min"] - 1  # Já conta com a atual
+
     # Verificação para vários CPFs (mesmo IP)
-    ip = tx.get("ip")
-    if ip:
-        cursor.execute("""
-            SELECT COUNT(DISTINCT t.user_id) AS usuarios_distintos
-            FROM transacoes t
-            JOIN logs l ON l.user_id = t.user_id
-            WHERE t.data_hora >= NOW() - INTERVAL 5 MINUTE
-              AND t.tipo_transacao IN ('Compra','Pagamento','Transferência')
-              AND l.ip = %s
-              AND l.data_hora >= NOW() - INTERVAL 5 MINUTE
-        """, (ip,))
-        varios_usuarios = cursor.fetchone()["usuarios_distintos"] >= 5
-    else:
-        varios_usuarios = False
-    
+    varios_usuarios = ctx["usuarios_ip_5min"] >= cfg["usuarios_ip_5min"]
+
     if mesmo_usuario:
-        return True, "5+ transações do mesmo usuário em 5 minutos"
+        return True, f"{cfg['tx_usuario_5min']}+ transações do mesmo usuário em 5 minutos"
     if varios_usuarios:
-        return True, "5+ transações de diferentes usuários (mesmo IP) em 5 minutos"
+        return True, f"{cfg['usuarios_ip_5min']}+ transações de diferentes usuários (mesmo IP) em 5 minutos"
     return False, ""
 
 # ------------------------------------------------------------------
 # REGRA #03 – 3 tentativas de login falhas
 # ------------------------------------------------------------------
-def regra_03_tentativas_login(tx: dict):
-    cursor.execute("""
-        SELECT COUNT(*) AS tentativas
-        FROM logs
-        WHERE user_id = %s
-          AND resultado = 'fail'
-          AND data_hora >= NOW() - INTERVAL 30 MINUTE
-        ORDER BY data_hora DESC
-        LIMIT 3
-    """, (tx["user_id"],))
-    tentativas = cursor.fetchone()["tentativas"]
-    if tentativas >= 3:
-        return True, "3+ tentativas de login falhas em 30 minutos"
+@metadados(severidade=SEVERIDADE_MEDIA, custo=1, orcamento_ms=50)
+def regra_03_tentativas_login(tx: dict, ctx: dict):
+    cfg = ctx["regras"]
+    if ctx["falhas_login_30min"] >= cfg["falhas_login_30min"]:
+        return True, (f"{cfg['falhas_login_30min']}+ tentativas de login falhas "
+                      f"em {cfg['falhas_login_janela_min']} minutos")
     return False, ""
 
 # ------------------------------------------------------------------
 # REGRA #04 – Alteração múltipla de senha
 # ------------------------------------------------------------------
-def regra_04_alteracao_senha(tx: dict):
-    cursor.execute("""
-        SELECT COUNT(*) AS alteracoes
-        FROM fatos_usuarios
-        WHERE user_id = %s
-          AND acao = 'Alterar senha'
-          AND data_hora >= NOW() - INTERVAL 7 DAY
-    """, (tx["user_id"],))
-    alteracoes = cursor.fetchone()["alteracoes"]
-    if alteracoes >= 3:
+@metadados(severidade=SEVERIDADE_MEDIA, custo=1, orcamento_ms=50)
+def regra_04_alteracao_senha(tx: dict, ctx: dict):
+    alteracoes = ctx["senhas_7d"]
+    if alteracoes >= ctx["regras"]["senhas_7d"]:
         return True, f"{alteracoes} alterações de senha em 7 dias"
     return False, ""
 
 # ------------------------------------------------------------------
 # REGRA #05 – Troca de dados sensíveis + saque
 # ------------------------------------------------------------------
-def regra_05_troca_dados_saque(tx: dict):
+@metadados(severidade=SEVERIDADE_MEDIA, custo=1, tipos=("Saque", "Transferência"),
+           orcamento_ms=50)
+def regra_05_troca_dados_saque(tx: dict, ctx: dict):
     # Verifica se houve alteração de e-mail ou telefone recente
-    cursor.execute("""
-        SELECT COUNT(*) AS alteracoes
-        FROM fatos_usuarios
-        WHERE user_id = %s
-          AND acao = 'editar_perfil'
-          AND campo IN ('email', 'telefone')
-          AND data_hora >= NOW() - INTERVAL 1 HOUR
-    """, (tx["user_id"],))
-    alteracoes = cursor.fetchone()["alteracoes"]
-    
-    if alteracoes > 0 and tx["tipo_transacao"] in ('Saque', 'Transferência'):
+    if ctx["edicoes_sensiveis_1h"] > 0 and tx.get("tipo_transacao") in ('Saque', 'Transferência'):
         return True, "Alteração de dados sensíveis seguida de saque"
     return False, ""
 
 # ------------------------------------------------------------------
 # REGRA #06 – Cash In sem histórico (conta nova)
 # ------------------------------------------------------------------
-def regra_06_cashin_sem_historico(tx: dict):
-    if tx["tipo_transacao"] == "Cash-In":
-        cursor.execute("""
-            SELECT COUNT(*) AS transacoes_anteriores
-            FROM transacoes
-            WHERE user_id = %s
-              AND data_hora < %s
-              AND data_hora >= DATE_SUB(%s, INTERVAL 7 DAY)
-        """, (tx["user_id"], tx["data_hora"], tx["data_hora"]))
-        historico = cursor.fetchone()["transacoes_anteriores"]
-        
-        if historico == 0 and float(tx["valor"]) > 5000:
+@metadados(severidade=SEVERIDADE_MEDIA, custo=2, tipos=("Cash-In",), orcamento_ms=100)
+def regra_06_cashin_sem_historico(tx: dict, ctx: dict):
+    if tx.get("tipo_transacao") == "Cash-In":
+        if ctx["historico_7d"] == 0 and float(tx["valor"]) > ctx["regras"]["cashin_sem_historico"]:
             return True, "Cash-In alto em conta sem histórico"
     return False, ""
 
 # ------------------------------------------------------------------
 # REGRA #07 – Depósitos e saques rápidos (lavagem de dinheiro)
 # ------------------------------------------------------------------
-def regra_07_deposito_saque_rapido(tx: dict):
-    if tx["tipo_transacao"] in ("Saque", "Transferência"):
-        cursor.execute("""
-            SELECT valor, TIMESTAMPDIFF(MINUTE, data_hora, %s) as minutos
-            FROM transacoes
-            WHERE user_id = %s
-              AND tipo_transacao = 'Cash-In'
-              AND data_hora >= DATE_SUB(%s, INTERVAL 1 HOUR)
-            ORDER BY data_hora DESC
-            LIMIT 1
-        """, (tx["data_hora"], tx["user_id"], tx["data_hora"]))
-        deposito = cursor.fetchone()
-        
-        if deposito and deposito["minutos"] < 10 and float(tx["valor"]) >= deposito["valor"] * 0.9:
+@metadados(severidade=SEVERIDADE_MEDIA, custo=2, tipos=("Saque", "Transferência"),
+           orcamento_ms=100)
+def regra_07_deposito_saque_rapido(tx: dict, ctx: dict):
+    if tx.get("tipo_transacao") in ("Saque", "Transferência"):
+        cfg = ctx["regras"]
+        deposito = ctx["ultimo_cashin"]
+
+        if (deposito and deposito["minutos"] < cfg["saque_minutos"]
+                and float(tx["valor"]) >= deposito["valor"] * cfg["saque_razao"]):
             return True, f"Saque de {tx['valor']} após depósito há {deposito['minutos']} minutos"
     return False, ""
 
+# ------------------------------------------------------------------
+# REGRA #08 – Rede de contas laranja (grafo de transferências)
+# ------------------------------------------------------------------
+@metadados(severidade=SEVERIDADE_ALTA, custo=0,
+           tipos=grafo_transferencias.TIPOS_ORIGEM + grafo_transferencias.TIPOS_DESTINO)
+def regra_08_rede_laranjas(tx: dict, ctx: dict):
+    cfg = ctx["regras"]
+    if ctx["ciclo"]:
+        trajeto = " → ".join(str(u) for u in ctx["ciclo"])
+        return True, f"Ciclo de transferências entre contas ({trajeto}) – R$ {ctx['volume_par_24h']:.2f} em 24 h"
+    if ctx["fan_in_1h"] >= cfg["fan_in_1h"]:
+        return True, f"Recebimentos de {ctx['fan_in_1h']} contas diferentes em 1 hora"
+    if ctx["fan_out_1h"] >= cfg["fan_out_1h"]:
+        return True, f"Transferências para {ctx['fan_out_1h']} contas diferentes em 1 hora"
+    return False, ""
+
+# ------------------------------------------------------------------
+# CONTEXTO – carga set-based dos dados de risco dos usuários
+# ------------------------------------------------------------------
+def _marcadores(valores) -> str:
+    """Gera '%s,%s,…' para cláusulas IN com a quantidade de valores"""
+    return ",".join(["%s"] * len(valores))
+
+def _consultar(sql: str, params, con=None, fonte: str = "contexto") -> list:
+    """
+    Executa uma consulta de contexto; em caso de erro registra e devolve [].
+    con: conexão exclusiva (modo paralelo); por padrão usa a conexão global.
+    fonte: rótulo do tempo da consulta em metricas.
+    """
+    c = get_conn() if con is None else con
+    cur = c.cursor(dictionary=True, buffered=True)
+    try:
+        with metricas.medir_sql(fonte):
+            cur.execute(sql, params)
+            return cur.fetchall()
+    except Exception as e:
+        print(f"Erro ao carregar contexto: {str(e)}")
+        if con is None:   # conexões do pool e da unidade de trabalho ficam com o dono
+            c.rollback()
+        return []
+    finally:
+        cur.close()
+
+# ------------------------------------------------------------------
+# ORÇAMENTO DE TEMPO – consultas do contexto de avaliar_transacao
+# ------------------------------------------------------------------
+ORCAMENTO_LIMITES_MS = 50   # limites do usuário (regra None): sem disjuntor, na falha a regra 01 é pulada
+ORCAMENTO_TURNO_MS = 50     # total do turno fora da memória: sem disjuntor, na falha a regra 01 é pulada
+
+def _orcamento_ms(regras) -> float:
+    """Soma dos orçamentos das regras de uma consulta (None se nenhuma tem)"""
+    orcamentos = [ORCAMENTO_LIMITES_MS if r is None else r.orcamento_ms for r in regras]
+    orcamentos = [o for o in orcamentos if o]
+    return sum(orcamentos) if orcamentos else None
+
+def _apurar(regras, ok: bool, segundos: float, degradadas: list):
+    """
+    Registra no disjuntor de cada regra o resultado da consulta do seu
+    contexto: falha se deu erro (ou timeout) ou se passou do orçamento.
+    Sem dados (erro), a regra entra em degradadas – sem os limites do
+    usuário (regra None), a regra 01.
+    """
+    ms = _orcamento_ms(regras)
+    for regra in regras:
+        if regra is None:
+            if not ok and regra_01_limites_turno.__name__ not in degradadas:
+                degradadas.append(regra_01_limites_turno.__name__)
+            continue
+        if not regra.orcamento_ms:
+            continue
+        d = disjuntor.de(regra.__name__)
+        if ok and segundos * 1000 <= ms:
+            d.sucesso()
+        else:
+            d.falha()
+        if not ok:
+            degradadas.append(regra.__name__)
+
+def _grupos_liberados(grupos: list) -> tuple:
+    """Separa os grupos de contexto das regras com disjuntor aberto (puladas)"""
+    liberados, degradadas = [], []
+    for regra, campos in grupos:
+        if regra is None or not regra.orcamento_ms or disjuntor.de(regra.__name__).permite():
+            liberados.append((regra, campos))
+        else:
+            degradadas.append(regra.__name__)
+    return liberados, degradadas
+
+def _select_unico(grupos: list) -> tuple:
+    """
+    (sql, regras) do contexto em um só SELECT: as subconsultas de todos os
+    grupos, com a soma dos orçamentos das suas regras.
+    """
+    regras = [regra for regra, _ in grupos]
+    campos = [campo for _, campos in grupos for campo in campos]
+    return com_orcamento("SELECT " + ",\n       ".join(campos), _orcamento_ms(regras)), regras
+
+def _selects_orcados(grupos: list) -> list:
+    """
+    [(sql, regras)] das consultas do contexto: um SELECT por grupo, com o
+    orçamento só da sua regra – uma fonte lenta ou fora do ar conta como
+    falha apenas no disjuntor da regra que depende dela. Usados no modo
+    paralelo e quando o SELECT único falha ou estoura (ver _unico_ok).
+    """
+    return [(com_orcamento("SELECT " + ",\n       ".join(campos), _orcamento_ms([regra])), [regra])
+            for regra, campos in grupos]
+
+def _unico_ok(regras: list, linhas, segundos: float, degradadas: list) -> bool:
+    """
+    Apura o SELECT único: dentro do orçamento é sucesso para todas as
+    regras (True). Se falhou ou estourou nada é apurado (False) – quem
+    chamou refaz as consultas um SELECT por grupo, que apontam a regra
+    culpada no disjuntor.
+    """
+    ms = _orcamento_ms(regras)
+    if linhas is None or (ms is not None and segundos * 1000 > ms):
+        return False
+    _apurar(regras, True, segundos, degradadas)
+    return True
+
+def _consultar_orcado(sql: str, params, regras: list, degradadas: list, con=None) -> list:
+    """_consultar com apuração do orçamento das regras; None se falhou"""
+    linhas, segundos = _consultar_medido(sql, params, con)
+    _apurar(regras, linhas is not None, segundos, degradadas)
+    return linhas
+
+def _consultar_medido(sql: str, params, con=None) -> tuple:
+    """(linhas ou None se falhou, segundos) de uma consulta do contexto"""
+    c = get_conn() if con is None else con
+    cur = c.cursor(dictionary=True, buffered=True)
+    inicio = perf_counter()
+    try:
+        with metricas.medir_sql("contexto"):
+            cur.execute(sql, params)
+            linhas = cur.fetchall()
+    except Exception as e:
+        print(f"Erro ao carregar contexto: {str(e)}")
+        if con is None:
+            c.rollback()
+        linhas = None
+    finally:
+        cur.close()
+    return linhas, perf_counter() - inicio
+
+# ------------------------------------------------------------------
+# EXECUÇÃO PARALELA – cada tarefa em uma thread com conexão própria
+# ------------------------------------------------------------------
+_executor = None
+_executor_lock = Lock()
+
+def _pool_threads() -> ThreadPoolExecutor:
+    """Pool de threads do motor, do mesmo tamanho do pool de conexões"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=POOL_TAMANHO,
+                                           thread_name_prefix="fraude")
+    return _executor
+
+def aquecer() -> None:
+    """
+    Prepara o processo para a primeira avaliação (startup da API, workers
+    novos): carrega as regras, reconstrói as janelas em memória e abre o
+    pool de threads e o pool de conexões do motor – que o mysql-connector
+    já cria com todas as conexões abertas.
+    """
+    config_regras.atual()
+    _garantir_janelas()
+    _pool_threads()
+    if armazenamento().nome == "mysql":
+        get_pool()
+
+def _com_conexao_do_pool(tarefa):
+    con = get_pooled_conn()
+    try:
+        return tarefa(con)
+    finally:
+        con.close()
+
+def _executar_tarefas(tarefas: list, paralelo: bool, con=None) -> list:
+    """
+    Executa funções tarefa(con) que só dependem do banco.
+    Sequencial: todas na conexão global (con=None), uma após a outra.
+    Paralelo: todas ao mesmo tempo, cada uma com a sua conexão do pool –
+    a latência total passa a ser a da consulta mais lenta.
+    Com con (unidade de trabalho): todas em con, uma após a outra.
+    """
+    if con is not None or not paralelo or len(tarefas) < 2:
+        return [tarefa(con) for tarefa in tarefas]
+    return list(_pool_threads().map(_com_conexao_do_pool, tarefas))
+
+def _carregar_dados_lote(txs: list, agora: datetime, paralelo: bool = False, con=None) -> dict:
+    """
+    Carrega, com uma consulta agregada por fonte, os dados de risco de todos
+    os user_id presentes em txs. Os totais por turno (regra 01) vêm de
+    `turnos` e a velocidade (regra 02) de `velocidade`, com as contagens do
+    banco como mínimo (outros processos). As fontes são
+    independentes e podem ser carregadas em paralelo.
+    Transações de txs que já estão gravadas (com "id") ficam fora das
+    consultas a `transacoes` – entram pela acumulação do lote, na ordem.
+    Com con, tudo roda na transação dessa conexão, sem commit.
+    Retorna {user_id: dados}.
+    """
+    cfg = config_regras.atual()
+    padrao = limites_padrao()
+    user_ids = sorted({tx["user_id"] for tx in txs})
+    gravadas = sorted(tx["id"] for tx in txs if tx.get("id") is not None)
+    sem_gravadas = f"AND id NOT IN ({_marcadores(gravadas)})" if gravadas else ""
+    ips_5min = {}   # ip -> usuários distintos gravados em 5 min (compartilhado pelos usuários)
+    dados = {uid: {"limites": _cache_limites.obter(uid), "historico": [],
+                   "cashins": [], "falhas_login_30min": 0, "senhas_7d": 0,
+                   "edicoes_sensiveis_1h": 0, "tx_5min_banco": 0, "ips_5min_banco": ips_5min}
+             for uid in user_ids}
+    ids = _marcadores(user_ids)
+    tarefas = []
+
+    # Limites personalizados – só os que não estão no cache
+    sem_limite = [uid for uid in user_ids if dados[uid]["limites"] is None]
+    def _limites(con):
+        c = get_conn() if con is None else con
+        cur = c.cursor(dictionary=True, buffered=True)
+        try:
+            with metricas.medir_sql("limites_usuario"):
+                cur.execute(f"""
+                    SELECT user_id, limite_dia, limite_noite
+                    FROM limites_usuario
+                    WHERE user_id IN ({_marcadores(sem_limite)})
+                """, tuple(sem_limite))
+                linhas = cur.fetchall()
+            encontrados = {r["user_id"]: (float(r["limite_dia"]), float(r["limite_noite"]))
+                           for r in linhas}
+        except Exception as e:
+            # sem os limites a regra 01 desses usuários é pulada (ver _contexto_tx)
+            print(f"Erro ao carregar contexto: {str(e)}")
+            if con is None:
+                c.rollback()
+            return
+        finally:
+            cur.close()
+        for uid in sem_limite:
+            dados[uid]["limites"] = encontrados.get(uid, padrao)
+            _cache_limites.guardar(uid, dados[uid]["limites"])
+    if sem_limite:
+        tarefas.append(_limites)
+
+    # Totais por turno (regra 01) – só os que ainda não estão em memória
+    def _totais_turno(c):
+        try:
+            turnos.carregar({(tx["user_id"], _janela_turno(tx["data_hora"])[1]) for tx in txs},
+                            c, gravadas, confirmar=con is None)
+        except Exception as e:
+            print(f"Erro ao carregar totais por turno: {str(e)}")
+            if con is None:
+                (get_conn() if c is None else c).rollback()
+    tarefas.append(_totais_turno)
+
+    # Velocidade (regra 02) gravada por qualquer processo – ver velocidade.
+    # Um lote já gravado (stream) conta só pela janela, que segue a posição.
+    tipos_velocidade = _marcadores(TIPOS_VELOCIDADE)
+    def _velocidade(con):
+        for r in _consultar(f"""
+            SELECT user_id, COUNT(*) AS c
+            FROM transacoes
+            WHERE user_id IN ({ids})
+              AND tipo_transacao IN ({tipos_velocidade})
+              AND data_hora >= %s
+            GROUP BY user_id
+        """, (*user_ids, *TIPOS_VELOCIDADE, agora - velocidade.JANELA), con, "velocidade_5min"):
+            dados[r["user_id"]]["tx_5min_banco"] = int(r["c"])
+        ips = sorted({tx["ip"] for tx in txs if tx.get("ip")})
+        if not ips:
+            return
+        for r in _consultar(f"""
+            SELECT l.ip, COUNT(DISTINCT t.user_id) AS usuarios
+            FROM transacoes t
+            JOIN logs l ON l.user_id = t.user_id
+            WHERE t.data_hora >= %s
+              AND t.tipo_transacao IN ({tipos_velocidade})
+              AND l.ip IN ({_marcadores(ips)})
+              AND l.data_hora >= %s
+            GROUP BY l.ip
+        """, (agora - velocidade.JANELA, *TIPOS_VELOCIDADE, *ips, agora - velocidade.JANELA),
+                            con, "velocidade_ip_5min"):
+            ips_5min[r["ip"]] = int(r["usuarios"])
+    if not gravadas:
+        tarefas.append(_velocidade)
+
+    # Falhas de login na janela configurada (30 minutos por padrão)
+    def _falhas_login(con):
+        for r in _consultar(f"""
+            SELECT user_id, COUNT(*) AS tentativas
+            FROM logs
+            WHERE user_id IN ({ids})
+              AND resultado = 'fail'
+              AND data_hora >= %s
+            GROUP BY user_id
+        """, (*user_ids, agora - timedelta(minutes=cfg["falhas_login_janela_min"])), con,
+                               "logs_falhas"):
+            dados[r["user_id"]]["falhas_login_30min"] = int(r["tentativas"])
+    tarefas.append(_falhas_login)
+
+    # Trocas de senha (7 dias) e edições de e-mail/telefone (1 hora)
+    def _fatos(con):
+        for r in _consultar(f"""
+            SELECT user_id,
+                   SUM(CASE WHEN acao = 'Alterar senha' THEN 1 ELSE 0 END) AS senhas,
+                   SUM(CASE WHEN acao = 'editar_perfil'
+                             AND campo IN ('email', 'telefone')
+                             AND data_hora >= %s THEN 1 ELSE 0 END) AS edicoes
+            FROM fatos_usuarios
+            WHERE user_id IN ({ids})
+              AND data_hora >= %s
+            GROUP BY user_id
+        """, (agora - timedelta(hours=1), *user_ids, agora - timedelta(days=7)), con,
+                            "fatos_usuarios"):
+            dados[r["user_id"]]["senhas_7d"] = int(r["senhas"] or 0)
+            dados[r["user_id"]]["edicoes_sensiveis_1h"] = int(r["edicoes"] or 0)
+    tarefas.append(_fatos)
+
+    # Histórico de 7 dias – só para quem tem Cash-In no lote (regra 06)
+    cashin = [tx for tx in txs if _aplica(regra_06_cashin_sem_historico, tx.get("tipo_transacao"))]
+    def _historico(con):
+        uids = sorted({tx["user_id"] for tx in cashin})
+        for r in _consultar(f"""
+            SELECT user_id, data_hora
+            FROM transacoes
+            WHERE user_id IN ({_marcadores(uids)})
+              AND data_hora >= %s
+              AND data_hora < %s
+              {sem_gravadas}
+        """, (*uids, min(tx["data_hora"] for tx in cashin) - timedelta(days=7),
+              max(tx["data_hora"] for tx in cashin), *gravadas), con, "historico_7d"):
+            dados[r["user_id"]]["historico"].append(r["data_hora"])
+    if cashin:
+        tarefas.append(_historico)
+
+    # Cash-Ins da última hora – só para quem tem saque no lote (regra 07)
+    saques = [tx for tx in txs if _aplica(regra_07_deposito_saque_rapido, tx.get("tipo_transacao"))]
+    def _cashins(con):
+        uids = sorted({tx["user_id"] for tx in saques})
+        for r in _consultar(f"""
+            SELECT user_id, valor, data_hora
+            FROM transacoes
+            WHERE user_id IN ({_marcadores(uids)})
+              AND tipo_transacao = 'Cash-In'
+              AND data_hora >= %s
+              {sem_gravadas}
+        """, (*uids, min(tx["data_hora"] for tx in saques) - timedelta(hours=1), *gravadas),
+                            con, "cashins_1h"):
+            dados[r["user_id"]]["cashins"].append((r["data_hora"], float(r["valor"])))
+    if saques:
+        tarefas.append(_cashins)
+
+    _executar_tarefas(tarefas, paralelo, con)
+    return dados
+
+def _contexto_tx(tx: dict, dados: dict, agora: datetime, con=None, lote=None) -> dict:
+    """
+    Deriva o contexto de risco de uma transação a partir dos dados do usuário
+    (lote: transações anteriores do lote ainda não gravadas, ver _Lote)
+    """
+    dt = tx["data_hora"]
+    turno, inicio, _ = _janela_turno(dt)
+    limite_dia, limite_noite = dados["limites"] or (None, None)
+
+    cashins = [(d, v) for d, v in dados["cashins"] if dt - timedelta(hours=1) <= d <= dt]
+    ultimo_cashin = None
+    if cashins:
+        d, v = max(cashins)
+        ultimo_cashin = {"valor": v, "minutos": int((dt - d).total_seconds() / 60)}
+
+    total_turno = _total_turno(tx["user_id"], dt, con)
+    if total_turno is not None and lote is not None:
+        total_turno += lote.turnos.get((tx["user_id"], inicio), 0.0)
+    return {
+        "limite_dia": limite_dia,
+        "limite_noite": limite_noite,
+        "turno": turno,
+        "total_turno": total_turno or 0.0,
+        "tx_5min": velocidade.tx_usuario(tx["user_id"], agora, lote and lote.velocidade,
+                                         dados["tx_5min_banco"]),
+        "usuarios_ip_5min": _usuarios_ip(tx, agora, lote, dados["ips_5min_banco"].get(tx.get("ip"), 0)),
+        **_grafo(tx, agora, lote),
+        "falhas_login_30min": dados["falhas_login_30min"],
+        "senhas_7d": dados["senhas_7d"],
+        "edicoes_sensiveis_1h": dados["edicoes_sensiveis_1h"],
+        "historico_7d": sum(1 for d in dados["historico"] if dt - timedelta(days=7) <= d < dt),
+        "ultimo_cashin": ultimo_cashin,
+        "degradadas": ([] if total_turno is not None and dados["limites"] is not None
+                       else [regra_01_limites_turno.__name__]),
+    }
+
+def _usuarios_ip(tx: dict, agora: datetime, lote=None, banco: int = 0) -> int:
+    """
+    Usuários distintos no IP da tx em 5 min (banco: como em
+    velocidade.usuarios_ip). No modo shards a janela por IP fica no processo
+    roteador, que manda a contagem pronta na tx (ver shards).
+    """
+    if "usuarios_ip_5min" in tx:
+        return tx["usuarios_ip_5min"]
+    return velocidade.usuarios_ip(tx.get("ip"), agora, lote and lote.velocidade, banco)
+
+def _grafo(tx: dict, agora: datetime, lote=None) -> dict:
+    """Métricas do grafo de transferências; no modo shards também vêm do roteador"""
+    if "grafo" in tx:
+        return tx["grafo"]
+    return grafo_transferencias.medir(tx, agora, lote and lote.grafo)
+
+def registrar_janelas(tx: dict):
+    """
+    Registra uma tx já gravada nas janelas de velocidade e no grafo de
+    transferências do processo (ver confirmar_aceitas)
+    """
+    velocidade.registrar(tx)
+    if "grafo" not in tx:
+        grafo_transferencias.registrar(tx)
+
+def _total_turno(user_id: int, dt: datetime, con=None):
+    """
+    Total do turno via acumulador, lido do banco dentro de ORCAMENTO_TURNO_MS
+    quando não está em memória; em caso de erro registra e devolve None
+    (regra 01 degradada).
+    """
+    try:
+        return turnos.total(user_id, dt, con, confirmar=con is None,
+                            orcamento_ms=ORCAMENTO_TURNO_MS)
+    except Exception as e:
+        print(f"Erro ao obter total do turno: {str(e)}")
+        if con is None:
+            get_conn().rollback()
+        return None
+
+def registrar_aceitas(txs: list, con=None):
+    """
+    Soma em totais_turno o gasto das transações que foram de fato gravadas
+    (com "id") – a avaliação só lê os totais. Chame depois do INSERT:
+    com con, na transação de quem chamou (sem commit; um erro sobe para a
+    unidade de trabalho ser desfeita) e, após o commit, confirmar_aceitas(txs).
+    Sem con grava e confirma na hora.
+    """
+    if con is not None:
+        turnos.registrar(txs, con, confirmar=False)
+        return
+    try:
+        turnos.registrar(txs)
+    except Exception as e:
+        print(f"Erro ao atualizar total do turno: {str(e)}")
+        get_conn().rollback()
+
+def confirmar_aceitas(txs: list):
+    """
+    Após o commit que gravou as transações: entram nas janelas de velocidade
+    e no grafo do processo, e os totais de turno em memória são relidos da
+    tabela. Se o commit falhar nada em memória muda – basta o rollback.
+    """
+    for tx in txs:
+        registrar_janelas(tx)
+    turnos.esquecer([linha for linha in map(turnos.incremento, txs) if linha])
+
+class _Lote:
+    """
+    Transações já avaliadas de um lote que ainda não foram gravadas: contam
+    para as seguintes do mesmo lote sem mudar o estado do processo.
+    """
+
+    def __init__(self):
+        self.turnos = {}                            # (user_id, início do turno) -> gasto
+        self.velocidade = velocidade.Lote()
+        self.grafo = grafo_transferencias.Lote()
+
+    def registrar_janelas(self, tx: dict):
+        self.velocidade.registrar(tx)
+        if "grafo" not in tx:
+            grafo_transferencias.registrar(tx, self.grafo)
+
+def _acumular(tx: dict, dados: dict, lote: _Lote):
+    """
+    Considera a tx já avaliada nas próximas avaliações do mesmo lote.
+    O gasto no turno vai para lote.turnos, somado ao total lido da tabela –
+    quem grava o lote chama registrar_aceitas e, após o commit,
+    confirmar_aceitas.
+    """
+    tipo, valor, dt = tx.get("tipo_transacao"), float(tx["valor"]), tx["data_hora"]
+    lote.registrar_janelas(tx)
+    linha = turnos.incremento(tx)
+    if linha:
+        lote.turnos[linha[:2]] = lote.turnos.get(linha[:2], 0.0) + linha[3]
+    dados["historico"].append(dt)
+    if tipo == "Cash-In":
+        dados["cashins"].append((dt, valor))
+
+def _consulta_contexto(tx: dict, agora: datetime, com_limites: bool) -> tuple:
+    """
+    Monta as subconsultas escalares do contexto, agrupadas por regra –
+    só das regras que se aplicam ao tipo da transação.
+    Retorna (grupos, params) – cada grupo é (regra, expressões SELECT);
+    regra None = limites do usuário (sem orçamento).
+    """
+    dt, tipo = tx["data_hora"], tx.get("tipo_transacao")
+    params = {"uid": tx["user_id"], "dt": dt,
+              "ini_30min": agora - timedelta(minutes=config_regras.atual()["falhas_login_janela_min"]),
+              "ini_1h": agora - timedelta(hours=1),
+              "ini_7d": agora - timedelta(days=7),
+              "dt_7d": dt - timedelta(days=7),
+              "dt_1h": dt - timedelta(hours=1)}
+
+    tipos_velocidade = ",".join(f"'{t}'" for t in TIPOS_VELOCIDADE)
+    params["ini_5min"] = agora - velocidade.JANELA
+    params["ip"] = tx.get("ip")
+    # Contagens da regra 02 gravadas por qualquer processo (ver velocidade)
+    velocidade_banco = [f"""(SELECT COUNT(*) FROM transacoes
+              WHERE user_id = %(uid)s AND tipo_transacao IN ({tipos_velocidade})
+                AND data_hora >= %(ini_5min)s) AS tx_5min_banco"""]
+    if tx.get("ip"):
+        velocidade_banco.append(f"""(SELECT COUNT(DISTINCT t.user_id) FROM transacoes t
+              JOIN logs l ON l.user_id = t.user_id
+              WHERE t.data_hora >= %(ini_5min)s AND t.tipo_transacao IN ({tipos_velocidade})
+                AND l.ip = %(ip)s AND l.data_hora >= %(ini_5min)s) AS usuarios_ip_5min_banco""")
+
+    grupos = [
+        (regra_02_5_transacoes_5min, velocidade_banco),
+        (regra_03_tentativas_login, ["""(SELECT COUNT(*) FROM logs
+              WHERE user_id = %(uid)s AND resultado = 'fail'
+                AND data_hora >= %(ini_30min)s) AS falhas_login_30min"""]),
+        (regra_04_alteracao_senha, ["""(SELECT COUNT(*) FROM fatos_usuarios
+              WHERE user_id = %(uid)s AND acao = 'Alterar senha'
+                AND data_hora >= %(ini_7d)s) AS senhas_7d"""]),
+    ]
+    if _aplica(regra_05_troca_dados_saque, tipo):
+        grupos.append((regra_05_troca_dados_saque, ["""(SELECT COUNT(*) FROM fatos_usuarios
+              WHERE user_id = %(uid)s AND acao = 'editar_perfil'
+                AND campo IN ('email', 'telefone')
+                AND data_hora >= %(ini_1h)s) AS edicoes_sensiveis_1h"""]))
+    if com_limites:
+        grupos.append((None, [
+            "(SELECT limite_dia FROM limites_usuario WHERE user_id = %(uid)s) AS limite_dia",
+            "(SELECT limite_noite FROM limites_usuario WHERE user_id = %(uid)s) AS limite_noite",
+        ]))
+    if _aplica(regra_06_cashin_sem_historico, tipo):
+        grupos.append((regra_06_cashin_sem_historico, ["""(SELECT COUNT(*) FROM transacoes
+              WHERE user_id = %(uid)s
+                AND data_hora < %(dt)s AND data_hora >= %(dt_7d)s) AS historico_7d"""]))
+    if _aplica(regra_07_deposito_saque_rapido, tipo):
+        grupos.append((regra_07_deposito_saque_rapido, [f"""(SELECT {coluna} FROM transacoes
+              WHERE user_id = %(uid)s AND tipo_transacao = 'Cash-In'
+                AND data_hora >= %(dt_1h)s
+              ORDER BY data_hora DESC LIMIT 1) AS cashin_{coluna}"""
+                       for coluna in ("valor", "data_hora")]))
+
+    return grupos, params
+
+def _montar_contexto(tx: dict, r: dict, limites, agora: datetime, total_turno: float) -> dict:
+    """Converte a linha das subconsultas (r) no dict de contexto das regras"""
+    dt = tx["data_hora"]
+    ultimo_cashin = None
+    if r.get("cashin_data_hora") is not None:
+        ultimo_cashin = {"valor": float(r["cashin_valor"]),
+                         "minutos": int((dt - r["cashin_data_hora"]).total_seconds() / 60)}
+    if limites is None and "limite_dia" in r:
+        limites = limites_padrao()
+        if r["limite_dia"] is not None:
+            limites = (float(r["limite_dia"]), float(r["limite_noite"]))
+        _cache_limites.guardar(tx["user_id"], limites)
+    if limites is None:   # consulta dos limites falhou: regra 01 degradada (ver _apurar)
+        limites = (None, None)
+    return {
+        "limite_dia": limites[0],
+        "limite_noite": limites[1],
+        "turno": _janela_turno(dt)[0],
+        "total_turno": total_turno,
+        "tx_5min": velocidade.tx_usuario(tx["user_id"], agora,
+                                         banco=int(r.get("tx_5min_banco") or 0)),
+        "usuarios_ip_5min": _usuarios_ip(tx, agora, banco=int(r.get("usuarios_ip_5min_banco") or 0)),
+        **_grafo(tx, agora),
+        "falhas_login_30min": int(r.get("falhas_login_30min") or 0),
+        "senhas_7d": int(r.get("senhas_7d") or 0),
+        "edicoes_sensiveis_1h": int(r.get("edicoes_sensiveis_1h") or 0),
+        "historico_7d": int(r.get("historico_7d") or 0),
+        "ultimo_cashin": ultimo_cashin,
+    }
+
+def contexto_risco(tx: dict, paralelo: bool = False, con=None) -> dict:
+    """
+    Carrega o contexto de risco de UMA transação: um único SELECT de
+    subconsultas escalares, com a soma dos orçamentos das regras que atende.
+    As das regras 05–07 só entram quando o tipo da transação as torna
+    aplicáveis. Se ele falha ou estoura o orçamento, as subconsultas são
+    refeitas um SELECT por regra, cada um com o orçamento e o disjuntor só
+    da sua regra; com paralelo=True esses SELECTs por regra rodam desde o
+    início, ao mesmo tempo, em conexões do pool. Com con tudo é lido nessa
+    conexão.
+
+    Chaves do contexto:
+      limite_dia, limite_noite, turno, total_turno  – regra 01 (limites em cache,
+                                                       total em memória)
+      tx_5min, usuarios_ip_5min                      – regra 02 (em memória, no mínimo
+                                                       a contagem do banco)
+      fan_in_1h, fan_out_1h, volume_par_24h, ciclo   – regra 08 (em memória)
+      falhas_login_30min                             – regra 03
+      senhas_7d                                      – regra 04
+      edicoes_sensiveis_1h                           – regra 05
+      historico_7d                                   – regra 06
+      ultimo_cashin ({valor, minutos} ou None)       – regra 07
+      degradadas                                     – regras puladas: disjuntor
+                                                       aberto ou consulta falhou
+
+    Cada consulta tem o orçamento de tempo das regras que atende (ver
+    metadados e disjuntor); regras com o disjuntor aberto ficam de fora.
+    """
+    agora = datetime.now()
+    limites = _cache_limites.obter(tx["user_id"])
+    grupos, params = _consulta_contexto(tx, agora, limites is None)
+    grupos, degradadas = _grupos_liberados(grupos)
+
+    r = _consultar_contexto(grupos, params, paralelo, con, degradadas)
+    total_turno = _total_turno(tx["user_id"], tx["data_hora"], con)
+    if total_turno is None and regra_01_limites_turno.__name__ not in degradadas:
+        degradadas.append(regra_01_limites_turno.__name__)
+    ctx = _montar_contexto(tx, r, limites, agora, total_turno or 0.0)
+    ctx["degradadas"] = degradadas
+    return ctx
+
+def _consultar_contexto(grupos: list, params: dict, paralelo: bool, con, degradadas: list) -> dict:
+    """Linha do contexto de contexto_risco: SELECT único e, se preciso, um por regra"""
+    unico = None
+    if len(grupos) > 1 and (con is not None or not paralelo):
+        sql, regras = _select_unico(grupos)
+        linhas, segundos = _consultar_medido(sql, params, con)
+        if _unico_ok(regras, linhas, segundos, degradadas):
+            return linhas[0] if linhas else {}
+        unico = linhas
+
+    perdidas = []
+    r = {}
+    for linhas in _executar_tarefas(
+            [lambda con, sql=sql, regras=regras: _consultar_orcado(sql, params, regras, perdidas, con)
+             for sql, regras in _selects_orcados(grupos)], paralelo, con):
+        r.update(linhas[0] if linhas else {})
+    if unico:   # o único só estourou o orçamento: os dados dele valem
+        return unico[0]
+    degradadas.extend(d for d in perdidas if d not in degradadas)
+    return r
+
 # ------------------------------------------------------------------
 # MOTOR – lista de regras ativas
 # ------------------------------------------------------------------
+# A ordem de execução vem do custo de cada regra (ver metadados), não da
+# posição na lista; regras de outros tipos de transação nem são executadas.
 REGRAS_ATIVAS = [
     regra_01_limites_turno,
     regra_02_5_transacoes_5min,
@@ -237,42 +945,246 @@ REGRAS_ATIVAS = [
     regra_05_troca_dados_saque,
     regra_06_cashin_sem_historico,
     regra_07_deposito_saque_rapido,
+    regra_08_rede_laranjas,
 ]
 
-def avaliar_transacao(tx: dict):
+def _regras_aplicaveis(tx: dict, custo_max: int = None) -> list:
+    """REGRAS_ATIVAS que se aplicam ao tipo da transação, das mais baratas às mais caras"""
+    tipo = tx.get("tipo_transacao")
+    return sorted((r for r in REGRAS_ATIVAS
+                   if _aplica(r, tipo) and (custo_max is None or r.custo <= custo_max)),
+                  key=lambda r: r.custo)
+
+def _bloqueou(resultados: list) -> bool:
+    return any(regra.severidade >= SEVERIDADE_BLOQUEIO for regra, _ in resultados)
+
+def _executar_regras(tx: dict, ctx: dict, parar_no_bloqueio: bool = False,
+                     custo_max: int = None) -> list:
     """
-    Executa todas as REGRAS_ATIVAS.
-    tx precisa conter: user_id, valor, data_hora, tipo_transacao.
-    Retorna: (suspeita: bool, motivos: str)
+    Executa as regras aplicáveis (puras) em ordem de custo e devolve
+    [(regra, motivo)] das que dispararam. Com parar_no_bloqueio=True para no
+    primeiro disparo bloqueante (severidade >= SEVERIDADE_BLOQUEIO).
+    Regras em ctx["degradadas"] (sem contexto) não são executadas.
     """
+    ctx.setdefault("regras", config_regras.atual())   # uma versão da configuração por avaliação
+    degradadas = ctx.get("degradadas", ())
     resultados = []
-    for regra in REGRAS_ATIVAS:
+    for regra in _regras_aplicaveis(tx, custo_max):
+        if regra.__name__ in degradadas:
+            continue
+        inicio = perf_counter()
         try:
-            flag, motivo = regra(tx)
-            if flag:
-                resultados.append((regra.__name__, motivo))
+            flag, motivo = regra(tx, ctx)
         except Exception as e:
+            metricas.registrar_regra(regra.__name__, perf_counter() - inicio, erro=True)
             print(f"Erro na regra {regra.__name__}: {str(e)}")
-            conn.rollback()
-    
+            continue
+        metricas.registrar_regra(regra.__name__, perf_counter() - inicio, disparou=flag)
+        if flag:
+            resultados.append((regra, motivo))
+            if parar_no_bloqueio and regra.severidade >= SEVERIDADE_BLOQUEIO:
+                break
+    return resultados
+
+def _excedeu_limite(resultados: list) -> bool:
+    return any(regra is regra_01_limites_turno for regra, _ in resultados)
+
+class Veredicto(tuple):
+    """
+    (suspeita, motivos) – desempacota como a tupla de sempre – com as regras
+    puladas por orçamento/disjuntor em .degradadas (vazio = avaliação completa).
+    """
+    def __new__(cls, suspeita: bool, motivos: str, degradadas=()):
+        v = super().__new__(cls, (suspeita, motivos))
+        v.degradadas = tuple(degradadas)
+        return v
+
+    def __getnewargs__(self):
+        return self[0], self[1], self.degradadas
+
+    suspeita = property(lambda self: self[0])
+    motivos = property(lambda self: self[1])
+
+def _veredicto(resultados: list, degradadas=()) -> Veredicto:
+    """Consolida os disparos em (suspeita, motivos)"""
     if resultados:
-        # Ordenar por prioridade (regras mais críticas primeiro)
-        resultados.sort(key=lambda x: 0 if "limites_turno" in x[0] else 
-                                     1 if "5_transacoes" in x[0] else 2)
+        # Ordenar por severidade (regras mais críticas primeiro)
+        resultados.sort(key=lambda x: -x[0].severidade)
         motivos = "; ".join(m for _, m in resultados)
-        return True, motivos
-    return False, ""
+        return Veredicto(True, motivos, degradadas)
+    return Veredicto(False, "", degradadas)
+
+def _finalizar(tx: dict, ctx: dict, resultados: list, con=None, tentativas: list = None):
+    """
+    Audita a tentativa de exceder limite (única escrita) e devolve o
+    veredicto. Com tentativas (lista) a linha só é acrescentada a ela, para
+    quem chamou gravar (ver shards).
+    """
+    if _excedeu_limite(resultados):
+        if tentativas is not None:
+            tentativas.append((tx["user_id"], *_excesso_turno(tx, ctx), datetime.now()))
+        else:
+            try:
+                _registrar_tentativa_limite(tx["user_id"], *_excesso_turno(tx, ctx), con=con)
+            except Exception as e:
+                print(f"Erro ao registrar tentativa de limite: {str(e)}")
+                if con is None:
+                    get_conn().rollback()
+    return _veredicto(resultados, ctx.get("degradadas", ()))
+
+def _aplicar_regras(tx: dict, ctx: dict, parar_no_bloqueio: bool = False, con=None,
+                    tentativas: list = None):
+    """
+    Executa as REGRAS_ATIVAS aplicáveis sobre um contexto já carregado.
+    As regras são funções puras de (tx, ctx); a única escrita – a auditoria
+    de tentativa de exceder limite – é feita aqui, fora das regras.
+    """
+    return _finalizar(tx, ctx, _executar_regras(tx, ctx, parar_no_bloqueio), con, tentativas)
+
+def _contexto_memoria(tx: dict, agora: datetime, conferir: bool = True):
+    """
+    Contexto das regras de custo 0 (limite de turno e velocidade) se tudo o
+    que elas leem já estiver em memória; senão None. conferir: como em
+    CacheTTL.obter.
+    """
+    limites = _cache_limites.obter(tx["user_id"], conferir=conferir)
+    total_turno = turnos.em_memoria(tx["user_id"], tx["data_hora"])
+    if limites is None or total_turno is None:
+        return None
+    return {
+        "limite_dia": limites[0],
+        "limite_noite": limites[1],
+        "turno": _janela_turno(tx["data_hora"])[0],
+        "total_turno": total_turno,
+        "tx_5min": velocidade.tx_usuario(tx["user_id"], agora),
+        "usuarios_ip_5min": _usuarios_ip(tx, agora),
+        **_grafo(tx, agora),
+    }
+
+def _bloqueio_em_memoria(tx: dict, con=None):
+    """
+    Modo parar_no_bloqueio: roda antes as regras de custo 0 sobre o contexto
+    em memória. Se alguma bloquear, devolve o veredicto sem ir ao banco;
+    senão None.
+    """
+    ctx = _contexto_memoria(tx, datetime.now())
+    if ctx is None:
+        return None
+    resultados = _executar_regras(tx, ctx, parar_no_bloqueio=True, custo_max=0)
+    if not _bloqueou(resultados):
+        return None
+    return _finalizar(tx, ctx, resultados, con)
+
+def avaliar_lote(txs: list, paralelo: bool = False, parar_no_bloqueio: bool = False,
+                 con=None, anteriores: list = ()) -> list:
+    """
+    Avalia um lote de transações de uma só vez.
+    Cada tx precisa conter: user_id, valor, data_hora, tipo_transacao.
+    O contexto de todos os usuários é carregado com poucas consultas
+    agregadas; transações anteriores do mesmo lote contam como já aceitas
+    para as seguintes (limite de turno, velocidade e histórico); o gasto no
+    turno só vai para a tabela resumo por registrar_aceitas, ao gravá-las,
+    e as janelas de velocidade e o grafo só mudam em confirmar_aceitas.
+    Com paralelo=True as fontes do contexto são consultadas ao mesmo tempo,
+    cada uma em uma conexão do pool.
+    Com parar_no_bloqueio=True cada tx para no primeiro disparo bloqueante.
+    Txs já gravadas em `transacoes` devem trazer "id": assim não contam
+    duas vezes no próprio contexto (ver stream_transacoes).
+    anteriores: transações já avaliadas e gravadas por outro caminho que
+    ainda não estão nas janelas deste processo; contam nas janelas de
+    velocidade e no grafo como se viessem antes do lote.
+    con: unidade de trabalho, como em avaliar_transacao.
+    Retorna: lista de (suspeita: bool, motivos: str), na ordem de txs.
+    """
+    return _avaliar_lote(txs, paralelo, parar_no_bloqueio, con, anteriores)[0]
+
+def avaliar_lote_com_score(txs: list, paralelo: bool = False,
+                           parar_no_bloqueio: bool = False, con=None, anteriores: list = ()) -> tuple:
+    """
+    Como avaliar_lote, mais o score de risco 0–100 de cada transação,
+    calculado de uma vez sobre a matriz de features do lote (ver score).
+    Retorna: (lista de (suspeita, motivos), np.ndarray de scores).
+    """
+    veredictos, ctxs = _avaliar_lote(txs, paralelo, parar_no_bloqueio, con, anteriores)
+    return veredictos, score.pontuar(score.features_contextos(txs, ctxs))
+
+def _avaliar_lote(txs: list, paralelo: bool, parar_no_bloqueio: bool, con=None,
+                  anteriores: list = (), tentativas: list = None) -> tuple:
+    """
+    Veredictos e contextos de risco de cada tx do lote; com tentativas
+    (lista) as tentativas de exceder limite vão para ela em vez de gravadas
+    """
+    if not txs:
+        return [], []
+    _garantir_janelas()
+    with metricas.medir_avaliacao("lote"):
+        agora = datetime.now()
+        dados = _carregar_dados_lote(txs, agora, paralelo, con)
+
+        veredictos, ctxs, lote = [], [], _Lote()
+        for tx in anteriores:
+            lote.registrar_janelas(tx)
+        for tx in txs:
+            ctx = _contexto_tx(tx, dados[tx["user_id"]], agora, con, lote)
+            veredictos.append(_aplicar_regras(tx, ctx, parar_no_bloqueio, con, tentativas))
+            ctxs.append(ctx)
+            _acumular(tx, dados[tx["user_id"]], lote)
+    return veredictos, ctxs
+
+def avaliar_transacao(tx: dict, paralelo: bool = False, parar_no_bloqueio: bool = False,
+                      con=None):
+    """
+    Executa as REGRAS_ATIVAS que se aplicam ao tipo da transação, das mais
+    baratas às mais caras.
+    tx precisa conter: user_id, valor, data_hora, tipo_transacao.
+    O contexto vem de um SELECT por regra (ver contexto_risco) – com
+    paralelo=True ao mesmo tempo, em conexões do pool. A avaliação não muda
+    estado: quem grava a transação chama registrar_aceitas (gasto no turno,
+    na mesma transação) e, após o commit, confirmar_aceitas (janelas de
+    velocidade e grafo).
+    Com parar_no_bloqueio=True a avaliação termina no primeiro disparo
+    bloqueante: se o limite de turno ou a velocidade já bloqueiam com o
+    contexto em memória, o banco nem é consultado. Os motivos trazem só
+    os disparos até a parada.
+    Cada consulta de contexto respeita o orçamento de tempo das suas regras;
+    regras que estouram o orçamento seguidamente são puladas por um tempo
+    (ver disjuntor) e aparecem em Veredicto.degradadas.
+    con: unidade de trabalho – conexão (API do mysql-connector) de quem
+    chamou, ex.: a da sessão SQLAlchemy da requisição. Leituras e escritas
+    do motor (totais de turno, tentativa de limite) rodam na transação dela
+    e nada é confirmado aqui: o commit de quem chamou grava tudo junto.
+    Retorna: Veredicto (suspeita: bool, motivos: str)
+    """
+    _garantir_janelas()
+    with metricas.medir_avaliacao("transacao"):
+        resultado = _bloqueio_em_memoria(tx, con) if parar_no_bloqueio else None
+        if resultado is None:
+            resultado = _aplicar_regras(tx, contexto_risco(tx, paralelo, con), parar_no_bloqueio, con)
+    return resultado
+
+def registrar_fraude(tx_id: int, motivos: str, con=None):
+    """
+    Registra uma fraude detectada na tabela dedicada.
+    A linha entra na fila write-behind de `auditoria` – sem commit no
+    caminho da requisição; com a fila cheia é gravada na hora.
+    Com con (unidade de trabalho) é gravada na transação dessa conexão.
+    """
+    registrar_fraudes([(tx_id, motivos)], con)
 
-def registrar_fraude(tx_id: int, motivos: str):
+def registrar_fraudes(itens: list, con=None):
     """
-    Registra uma fraude detectada na tabela dedicada
+    Como registrar_fraude, para um lote [(tx_id, motivos), ...]: com con um
+    único executemany na transação dessa conexão; sem con pela fila, e as
+    que não couberem nela são gravadas juntas na hora.
     """
-    cursor.execute("""
-        INSERT INTO fraudes_detectadas
-        (transacao_id, motivos, data_deteccao)
-        VALUES (%s, %s, NOW())
-        ON DUPLICATE KEY UPDATE
-        motivos = VALUES(motivos),
-        data_deteccao = VALUES(data_deteccao)
-    """, (tx_id, motivos))
-    conn.commit()
\ No newline at end of file
+    agora = datetime.now()
+    linhas = [("fraudes_detectadas", (tx_id, motivos, agora)) for tx_id, motivos in itens]
+    if not linhas:
+        return
+    if con is not None:
+        auditoria.gravar_em(con, linhas)
+        return
+    for i, (tabela, linha) in enumerate(linhas):
+        if not auditoria.enfileirar(tabela, linha):
+            auditoria.gravar(linhas[i:])
+            break
@@ -0,0 +1,231 @@
+"""
+fraude_async.py – variante asyncio do motor de regras de fraude
+===============================================================
+
+Mesmas regras de `fraude.py` (funções puras de (tx, ctx)), mas o contexto
+e as escritas de auditoria usam o driver assíncrono aiomysql. Enquanto uma
+avaliação espera o MySQL o event loop atende outras, então um único worker
+uvicorn mantém muitas avaliações em andamento.
+
+Os acumuladores de turno (`turnos`) continuam síncronos: quando precisam do
+banco rodam em uma thread com conexão própria do pool (asyncio.to_thread).
+
+Usado por POST /transacoes/async (backend.py), que só leva a gravação ao
+threadpool; benchmarks/bench_sync_async.py compara as duas rotas.
+"""
+import asyncio
+from datetime import datetime
+from time import perf_counter
+
+import aiomysql
+
+import auditoria
+import fraude
+import metricas
+import turnos
+from db import POOL_TAMANHO, _DB_CFG
+
+MARGEM_SEG = 0.05   # folga do cliente além do orçamento das regras (aquisição do pool, rede)
+
+_pool = None
+_pool_lock = asyncio.Lock()
+
+
+async def get_pool_async():
+    """Pool aiomysql criado sob demanda (no event loop em uso)."""
+    global _pool
+    async with _pool_lock:
+        if _pool is None:
+            _pool = await aiomysql.create_pool(
+                host=_DB_CFG["host"],
+                user=_DB_CFG["user"],
+                password=_DB_CFG["password"],
+                db=_DB_CFG["database"],
+                charset=_DB_CFG["charset"],
+                autocommit=True,
+                minsize=1,
+                maxsize=POOL_TAMANHO,
+            )
+    return _pool
+
+
+async def fechar_pool_async():
+    """Fecha o pool (ex.: no shutdown da aplicação)."""
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        await _pool.wait_closed()
+        _pool = None
+
+
+async def _consultar_orcado_async(sql: str, params, regras: list, degradadas: list) -> list:
+    """
+    Consulta do contexto com o orçamento das regras (ver fraude._apurar):
+    além do MAX_EXECUTION_TIME no servidor, o cliente desiste após o
+    orçamento + MARGEM_SEG. Devolve None se falhou.
+    """
+    linhas, segundos = await _consultar_medido_async(sql, params, fraude._orcamento_ms(regras))
+    fraude._apurar(regras, linhas is not None, segundos, degradadas)
+    return linhas
+
+
+async def _consultar_medido_async(sql: str, params, ms: float) -> tuple:
+    """(linhas ou None se falhou, segundos) de uma consulta do contexto com orçamento ms"""
+    pool = await get_pool_async()
+    inicio = perf_counter()
+
+    async def _consulta():
+        async with pool.acquire() as con:
+            try:
+                async with con.cursor(aiomysql.DictCursor) as cur:
+                    await cur.execute(sql, params)
+                    return await cur.fetchall()
+            except asyncio.CancelledError:
+                con.close()   # conexão no meio de uma consulta não volta ao pool
+                raise
+
+    try:
+        with metricas.medir_sql("contexto_async"):
+            if ms is None:
+                linhas = await _consulta()
+            else:
+                linhas = await asyncio.wait_for(_consulta(), ms / 1000 + MARGEM_SEG)
+    except Exception as e:
+        print(f"Erro ao carregar contexto: {str(e) or type(e).__name__}")
+        linhas = None
+    return linhas, perf_counter() - inicio
+
+
+async def _consultar_contexto_async(grupos: list, params: dict, paralelo: bool,
+                                    degradadas: list) -> dict:
+    """Como fraude._consultar_contexto: SELECT único e, se preciso, um por regra"""
+    unico = None
+    if len(grupos) > 1 and not paralelo:
+        sql, regras = fraude._select_unico(grupos)
+        linhas, segundos = await _consultar_medido_async(sql, params, fraude._orcamento_ms(regras))
+        if fraude._unico_ok(regras, linhas, segundos, degradadas):
+            return linhas[0] if linhas else {}
+        unico = linhas
+
+    perdidas = []
+    consultas = [_consultar_orcado_async(sql, params, regras, perdidas)
+                 for sql, regras in fraude._selects_orcados(grupos)]
+    if paralelo:
+        resultados = await asyncio.gather(*consultas)
+    else:
+        resultados = [await c for c in consultas]
+    if unico:   # o único só estourou o orçamento: os dados dele valem
+        return unico[0]
+    r = {}
+    for linhas in resultados:
+        r.update(linhas[0] if linhas else {})
+    degradadas.extend(d for d in perdidas if d not in degradadas)
+    return r
+
+
+async def _executar_async(sql: str, params, fonte: str) -> None:
+    pool = await get_pool_async()
+    with metricas.medir_sql(fonte):
+        async with pool.acquire() as con:
+            async with con.cursor() as cur:
+                await cur.execute(sql, params)
+
+
+async def _auditar(tabela: str, linha: tuple) -> None:
+    """Enfileira sem esperar; com a fila cheia grava na hora pelo aiomysql"""
+    if not auditoria.enfileirar(tabela, linha, espera=0):
+        await _executar_async(auditoria.SQL[tabela], linha, tabela)
+
+
+def _total_turno_thread(user_id: int, dt: datetime):
+    """Total do turno em uma conexão do pool; em caso de erro registra e devolve None"""
+    try:
+        return fraude._com_conexao_do_pool(
+            lambda con: turnos.total(user_id, dt, con, orcamento_ms=fraude.ORCAMENTO_TURNO_MS))
+    except Exception as e:
+        print(f"Erro ao obter total do turno: {str(e)}")
+        return None
+
+
+async def conferir_limites_async() -> None:
+    """
+    Versão dos limites (ver fraude._versao_limites_banco) conferida em uma
+    thread: a leitura usa o pool do mysql-connector e pode esperar por ele.
+    """
+    if fraude._versao_limites_vencida():
+        await asyncio.to_thread(fraude._cache_limites.conferir_versao)
+
+
+async def contexto_risco_async(tx: dict, paralelo: bool = False) -> dict:
+    """
+    Versão assíncrona de fraude.contexto_risco.
+    Um único SELECT e, se ele falhar ou estourar o orçamento, um por grupo
+    de regras; paralelo=True dispara os SELECTs por grupo desde o início, ao
+    mesmo tempo com asyncio.gather (e o total do turno junto).
+    """
+    agora = datetime.now()
+    await conferir_limites_async()
+    limites = fraude._cache_limites.obter(tx["user_id"], conferir=False)
+    grupos, params = fraude._consulta_contexto(tx, agora, limites is None)
+    grupos, degradadas = fraude._grupos_liberados(grupos)
+    consultas = [_consultar_contexto_async(grupos, params, paralelo, degradadas)]
+
+    total = turnos.em_memoria(tx["user_id"], tx["data_hora"])
+    if total is None:
+        consultas.append(asyncio.to_thread(_total_turno_thread, tx["user_id"], tx["data_hora"]))
+    if paralelo:
+        resultados = await asyncio.gather(*consultas)
+    else:
+        resultados = [await c for c in consultas]
+    r = resultados[0]
+    if total is None:
+        total = resultados[1]
+    if total is None and fraude.regra_01_limites_turno.__name__ not in degradadas:
+        degradadas.append(fraude.regra_01_limites_turno.__name__)
+    ctx = fraude._montar_contexto(tx, r, limites, agora, total or 0.0)
+    ctx["degradadas"] = degradadas
+    return ctx
+
+
+async def _registrar_tentativa_limite_async(user_id: int, valor: float, limite: float, turno: str):
+    """Registra tentativa de exceder limite para auditoria (fila write-behind)"""
+    await _auditar("tentativas_limite", (user_id, valor, limite, turno, datetime.now()))
+
+
+async def avaliar_transacao_async(tx: dict, paralelo: bool = False,
+                                  parar_no_bloqueio: bool = False):
+    """
+    Executa as REGRAS_ATIVAS aplicáveis sem bloquear o event loop.
+    tx precisa conter: user_id, valor, data_hora, tipo_transacao.
+    parar_no_bloqueio: como em fraude.avaliar_transacao.
+    Consultas com orçamento de tempo e disjuntores como em fraude.contexto_risco.
+    Como lá, a avaliação não muda estado: quem grava a transação chama
+    fraude.registrar_aceitas e, após o commit, fraude.confirmar_aceitas.
+    Retorna: fraude.Veredicto (suspeita: bool, motivos: str)
+    """
+    fraude._garantir_janelas()   # bloqueia só na primeira chamada do processo
+    with metricas.medir_avaliacao("transacao_async"):
+        ctx = None
+        if parar_no_bloqueio:
+            await conferir_limites_async()
+            ctx = fraude._contexto_memoria(tx, datetime.now(), conferir=False)
+        resultados = []
+        if ctx is not None:
+            resultados = fraude._executar_regras(tx, ctx, parar_no_bloqueio=True, custo_max=0)
+        if not fraude._bloqueou(resultados):
+            ctx = await contexto_risco_async(tx, paralelo)
+            resultados = fraude._executar_regras(tx, ctx, parar_no_bloqueio)
+        if fraude._excedeu_limite(resultados):
+            try:
+                await _registrar_tentativa_limite_async(tx["user_id"], *fraude._excesso_turno(tx, ctx))
+            except Exception as e:
+                print(f"Erro ao registrar tentativa de limite: {str(e)}")
+
+        return fraude._veredicto(resultados, ctx.get("degradadas", ()))
+
+
+async def registrar_fraude_async(tx_id: int, motivos: str):
+    """
+    Registra uma fraude detectada na tabela dedicada (fila write-behind)
+    """
+    await _auditar("fraudes_detectadas", (tx_id, motivos, datetime.now()))
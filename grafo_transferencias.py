@@ -0,0 +1,347 @@
+"""
+grafo_transferencias.py – grafo incremental de transferências (regra #08)
+========================================================================
+
+O Perfil grava cada transferência entre contas como um par de linhas com o
+mesmo `codigo`: Transferência (quem paga) e Recebimento (quem recebe). Este
+módulo casa os pares conforme as transações chegam e mantém em memória:
+
+  - union-find dos usuários ligados por transferências (componentes);
+  - por aresta pagador → recebedor, o volume transferido nas últimas 24 h;
+  - por usuário, pagadores e recebedores distintos na última hora
+    (fan-in / fan-out rápido, com as janelas de velocidade).
+
+Cada transação custa O(1) amortizado; a busca de ciclo curto (A → B → A ou
+A → B → C → A) só roda quando o union-find diz que as duas pontas da nova
+aresta já estavam no mesmo componente, e percorre no máximo dois saltos
+das arestas ativas – sem SQL recursivo sobre `transacoes`.
+
+Na inicialização a estrutura é reconstruída com as últimas 24 h de
+`transacoes` (ver reconstruir).
+
+Obs.: o estado é do processo, como em velocidade.py. No modo shards o grafo
+fica no processo roteador (ver shards). Só entram transações já gravadas;
+dentro de um lote as anteriores contam por um Lote (ver medir). A linha de
+quem paga pode ser avaliada antes de gravada trazendo o "codigo" e o
+"destino_id" do par: a aresta prevista entra na medição (ver aresta).
+"""
+from collections import deque
+from datetime import datetime, timedelta
+from threading import Lock
+
+from velocidade import JanelaDistintos, _inserir_ordenado
+
+JANELA_FAN = timedelta(hours=1)        # fan-in / fan-out rápido
+JANELA_VOLUME = timedelta(hours=24)    # volume por aresta e arestas usadas na busca de ciclo
+JANELA_PAR = timedelta(minutes=5)      # espera máxima pela outra linha do par
+CICLO_MAX = 3                          # maior ciclo procurado (em arestas)
+
+TIPOS_ORIGEM = ("Transferência", "PIX")
+TIPOS_DESTINO = ("Recebimento",)
+
+
+class UniaoBusca:
+    """Union-find com compressão de caminho e união por tamanho"""
+
+    def __init__(self):
+        self._pai: dict = {}
+        self._tamanho: dict = {}
+
+    def achar(self, x):
+        pai = self._pai
+        if x not in pai:
+            return x
+        while pai[x] != x:
+            pai[x] = pai[pai[x]]
+            x = pai[x]
+        return x
+
+    def unir(self, a, b) -> None:
+        for x in (a, b):
+            if x not in self._pai:
+                self._pai[x], self._tamanho[x] = x, 1
+        ra, rb = self.achar(a), self.achar(b)
+        if ra == rb:
+            return
+        if self._tamanho[ra] < self._tamanho[rb]:
+            ra, rb = rb, ra
+        self._pai[rb] = ra
+        self._tamanho[ra] += self._tamanho.pop(rb)
+
+    def tamanho(self, x) -> int:
+        return self._tamanho.get(self.achar(x), 1)
+
+    def limpar(self) -> None:
+        self._pai.clear()
+        self._tamanho.clear()
+
+
+class GrafoTransferencias:
+    """Pares por codigo, componentes, volume por aresta e fan-in/fan-out"""
+
+    def __init__(self):
+        self.componentes = UniaoBusca()
+        self._pendentes: dict = {}       # codigo -> (tipo, user_id, instante, valor)
+        self._ordem = deque()            # (instante, codigo) para expirar os pendentes
+        self._arestas: dict = {}         # (origem, destino) -> deque[(instante, valor)]
+        self._volumes: dict = {}         # (origem, destino) -> soma da deque
+        self._saidas: dict = {}          # origem -> {destino} com aresta ativa
+        self._pagadores = JanelaDistintos(JANELA_FAN)     # destino -> origens
+        self._recebedores = JanelaDistintos(JANELA_FAN)   # origem -> destinos
+
+    # -- pares --------------------------------------------------------
+    def _expirar_pendentes(self, agora: datetime) -> None:
+        limite = agora - JANELA_PAR
+        while self._ordem and self._ordem[0][0] < limite:
+            _, codigo = self._ordem.popleft()
+            p = self._pendentes.get(codigo)
+            if p is not None and p[2] < limite:
+                del self._pendentes[codigo]
+
+    def par(self, tx: dict):
+        """(origem, destino) da aresta que tx completa, ou None"""
+        codigo, tipo = tx.get("codigo"), tx.get("tipo_transacao")
+        p = self._pendentes.get(codigo) if codigo else None
+        if p is None or p[1] == tx["user_id"]:
+            return None
+        if tipo in TIPOS_DESTINO and p[0] in TIPOS_ORIGEM:
+            return p[1], tx["user_id"]
+        if tipo in TIPOS_ORIGEM and p[0] in TIPOS_DESTINO:
+            return tx["user_id"], p[1]
+        return None
+
+    def aresta(self, tx: dict):
+        """
+        Aresta medida para tx: a do par que ela completa ou, para a linha de
+        quem paga avaliada antes de gravar, a prevista pelo "destino_id" da tx
+        (usuário que vai receber) – só para medir, registrar não a usa.
+        """
+        par = self.par(tx)
+        if par is not None:
+            return par
+        destino = tx.get("destino_id")
+        if (destino is not None and destino != tx["user_id"]
+                and tx.get("tipo_transacao") in TIPOS_ORIGEM):
+            return tx["user_id"], destino
+        return None
+
+    # -- arestas ------------------------------------------------------
+    def _expirar_aresta(self, aresta: tuple, agora: datetime) -> None:
+        d = self._arestas.get(aresta)
+        if d is None:
+            return
+        limite = agora - JANELA_VOLUME
+        while d and d[0][0] < limite:
+            self._volumes[aresta] -= d.popleft()[1]
+        if not d:
+            del self._arestas[aresta], self._volumes[aresta]
+            saidas = self._saidas[aresta[0]]
+            saidas.discard(aresta[1])
+            if not saidas:
+                del self._saidas[aresta[0]]
+
+    def volume(self, origem, destino, agora: datetime) -> float:
+        self._expirar_aresta((origem, destino), agora)
+        return self._volumes.get((origem, destino), 0.0)
+
+    def _vizinhos(self, origem, agora: datetime) -> list:
+        vizinhos = list(self._saidas.get(origem, ()))
+        for destino in vizinhos:
+            self._expirar_aresta((origem, destino), agora)
+        return list(self._saidas.get(origem, ()))
+
+    def ciclo(self, origem, destino, agora: datetime):
+        """
+        Ciclo de até CICLO_MAX arestas que a aresta origem → destino fecharia
+        ([origem, destino, …, origem]), ou None.
+        """
+        if self.componentes.achar(origem) != self.componentes.achar(destino):
+            return None
+        return self._buscar_ciclo(origem, destino, agora)
+
+    def _buscar_ciclo(self, origem, destino, agora: datetime):
+        caminhos = [[destino]]
+        for _ in range(CICLO_MAX - 1):
+            proximos = []
+            for caminho in caminhos:
+                for vizinho in self._vizinhos(caminho[-1], agora):
+                    if vizinho == origem:
+                        return [origem, *caminho, origem]
+                    if vizinho not in caminho:
+                        proximos.append(caminho + [vizinho])
+            caminhos = proximos
+        return None
+
+    def _adicionar_aresta(self, origem, destino, dt: datetime, valor: float) -> None:
+        aresta = (origem, destino)
+        _inserir_ordenado(self._arestas.setdefault(aresta, deque()), (dt, valor))
+        self._volumes[aresta] = self._volumes.get(aresta, 0.0) + valor
+        self._saidas.setdefault(origem, set()).add(destino)
+        self._pagadores.registrar(destino, origem, dt)
+        self._recebedores.registrar(origem, destino, dt)
+        self.componentes.unir(origem, destino)
+
+    # -- API ----------------------------------------------------------
+    def registrar(self, tx: dict) -> None:
+        """Guarda a linha à espera do par ou, se ela completa um par, cria a aresta"""
+        tipo = tx.get("tipo_transacao")
+        if not tx.get("codigo") or tipo not in TIPOS_ORIGEM + TIPOS_DESTINO:
+            return
+        dt = tx["data_hora"]
+        self._expirar_pendentes(dt)
+        par = self.par(tx)
+        if par is None:
+            self._pendentes[tx["codigo"]] = (tipo, tx["user_id"], dt, float(tx["valor"]))
+            self._ordem.append((dt, tx["codigo"]))
+            return
+        del self._pendentes[tx["codigo"]]
+        self._adicionar_aresta(*par, dt, float(tx["valor"]))
+
+    def medir(self, tx: dict, agora: datetime) -> dict:
+        """
+        Métricas do usuário de tx já contando a aresta que tx completa (ou
+        prevê, ver aresta):
+        fan_in_1h / fan_out_1h (contas distintas), volume_par_24h da aresta
+        e ciclo (lista de usuários) ou None.
+        """
+        usuario = tx["user_id"]
+        fan_in = self._pagadores.contar(usuario, agora)
+        fan_out = self._recebedores.contar(usuario, agora)
+        volume, ciclo = 0.0, None
+        par = self.aresta(tx) if tx.get("codigo") else None
+        if par is not None:
+            origem, destino = par
+            if usuario == destino and not self._pagadores.contem(destino, origem, agora):
+                fan_in += 1
+            if usuario == origem and not self._recebedores.contem(origem, destino, agora):
+                fan_out += 1
+            volume = self.volume(origem, destino, agora) + float(tx["valor"])
+            ciclo = self.ciclo(origem, destino, agora)
+        return {"fan_in_1h": fan_in, "fan_out_1h": fan_out,
+                "volume_par_24h": volume, "ciclo": ciclo}
+
+    def limpar(self) -> None:
+        self.__init__()
+
+
+class Lote(GrafoTransferencias):
+    """
+    Arestas de um lote avaliado mas ainda não confirmado, medidas junto com
+    o grafo `base` sem alterá-lo: pares fecham com pendentes de qualquer um
+    dos dois, fan-in/fan-out contam a união, volumes somam e a busca de
+    ciclo anda pelas arestas dos dois.
+    """
+
+    def __init__(self, base: GrafoTransferencias = None):
+        super().__init__()
+        self._base = base if base is not None else _grafo
+
+    def par(self, tx: dict):
+        return super().par(tx) or self._base.par(tx)
+
+    def registrar(self, tx: dict) -> None:
+        tipo = tx.get("tipo_transacao")
+        if not tx.get("codigo") or tipo not in TIPOS_ORIGEM + TIPOS_DESTINO:
+            return
+        dt = tx["data_hora"]
+        self._expirar_pendentes(dt)
+        par = self.par(tx)
+        if par is None:
+            self._pendentes[tx["codigo"]] = (tipo, tx["user_id"], dt, float(tx["valor"]))
+            self._ordem.append((dt, tx["codigo"]))
+            return
+        self._pendentes.pop(tx["codigo"], None)
+        self._adicionar_aresta(*par, dt, float(tx["valor"]))
+
+    def volume(self, origem, destino, agora: datetime) -> float:
+        return super().volume(origem, destino, agora) + self._base.volume(origem, destino, agora)
+
+    def _vizinhos(self, origem, agora: datetime) -> list:
+        return list(set(super()._vizinhos(origem, agora)) | set(self._base._vizinhos(origem, agora)))
+
+    def ciclo(self, origem, destino, agora: datetime):
+        # com arestas do lote os componentes dos dois não dizem nada juntos
+        if not self._saidas:
+            return self._base.ciclo(origem, destino, agora)
+        return self._buscar_ciclo(origem, destino, agora)
+
+    def _distintos(self, janela: str, chave, agora: datetime) -> int:
+        base = getattr(self._base, janela)
+        return base.contar(chave, agora) + sum(
+            1 for m in getattr(self, janela).membros(chave, agora) if not base.contem(chave, m, agora))
+
+    def _conhecida(self, janela: str, chave, membro, agora: datetime) -> bool:
+        return (getattr(self, janela).contem(chave, membro, agora)
+                or getattr(self._base, janela).contem(chave, membro, agora))
+
+    def medir(self, tx: dict, agora: datetime) -> dict:
+        usuario = tx["user_id"]
+        fan_in = self._distintos("_pagadores", usuario, agora)
+        fan_out = self._distintos("_recebedores", usuario, agora)
+        volume, ciclo = 0.0, None
+        par = self.aresta(tx) if tx.get("codigo") else None
+        if par is not None:
+            origem, destino = par
+            if usuario == destino and not self._conhecida("_pagadores", destino, origem, agora):
+                fan_in += 1
+            if usuario == origem and not self._conhecida("_recebedores", origem, destino, agora):
+                fan_out += 1
+            volume = self.volume(origem, destino, agora) + float(tx["valor"])
+            ciclo = self.ciclo(origem, destino, agora)
+        return {"fan_in_1h": fan_in, "fan_out_1h": fan_out,
+                "volume_par_24h": volume, "ciclo": ciclo}
+
+
+# ------------------------------------------------------------------
+# Estado do processo
+# ------------------------------------------------------------------
+_lock = Lock()
+_grafo = GrafoTransferencias()
+
+
+def registrar(tx: dict, lote: Lote = None) -> None:
+    """
+    Registra uma transação gravada (ignora as que não fazem parte de um par);
+    com lote, só no lote.
+    """
+    if not tx.get("codigo"):
+        return
+    with _lock:
+        (lote if lote is not None else _grafo).registrar(tx)
+
+
+def medir(tx: dict, agora: datetime, lote: Lote = None) -> dict:
+    with _lock:
+        return (lote if lote is not None else _grafo).medir(tx, agora)
+
+
+def componente(user_id) -> int:
+    """Quantidade de contas ligadas ao usuário por transferências"""
+    with _lock:
+        return _grafo.componentes.tamanho(user_id)
+
+
+def reconstruir(cursor, ate_id: int = None) -> None:
+    """
+    Recarrega o grafo com as linhas de par das últimas 24 h do banco.
+    `cursor` deve ser um cursor dictionary=True; ate_id como em
+    velocidade.reconstruir.
+    """
+    tipos = TIPOS_ORIGEM + TIPOS_DESTINO
+    ate = "AND id <= %s" if ate_id is not None else ""
+    extra = (ate_id,) if ate_id is not None else ()
+    cursor.execute(f"""
+        SELECT user_id, valor, tipo_transacao, codigo, data_hora
+        FROM transacoes
+        WHERE data_hora >= %s
+          AND codigo IS NOT NULL
+          AND tipo_transacao IN ({",".join(["%s"] * len(tipos))})
+          {ate}
+        ORDER BY data_hora, id
+    """, (datetime.now() - JANELA_VOLUME, *tipos, *extra))
+    linhas = cursor.fetchall()
+
+    with _lock:
+        _grafo.limpar()
+        for r in linhas:
+            _grafo.registrar(r)
@@ -0,0 +1,222 @@
+"""
+idempotencia.py – chaves de idempotência (header Idempotency-Key) da API
+=======================================================================
+
+Clientes repetem o POST quando a resposta demora; sem proteção cada
+repetição roda o motor de novo, grava uma transação duplicada e ainda
+conta na velocidade da regra 02. Com o header `Idempotency-Key` a primeira
+resposta fica guardada e as repetições a recebem de volta sem passar pelo
+motor nem gravar nada.
+
+    situacao, resposta = reservar(rota, chave, impressao(corpo), con)
+    NOVA          – siga com a requisição; no fim gravar() (na transação) e
+                    concluir() após o commit, ou liberar() se falhar
+    REPETIDA      – devolva `resposta`
+    DIVERGENTE    – a chave já foi usada com outro corpo
+    EM_ANDAMENTO  – a primeira requisição com a chave ainda não terminou
+
+As respostas ficam num CacheTTL do processo (IDEMPOTENCIA_MAX entradas,
+IDEMPOTENCIA_TTL_SEG). Com FORSAKENSCAN_IDEMPOTENCIA_DB=1 a reserva também
+é uma linha de chaves_idempotencia (sem resposta, com o token do worker),
+gravada e confirmada antes do motor rodar: a chave primária garante que só
+um worker processa a chave, e a resposta entra na mesma linha no commit da
+transação. Uma reserva com mais de IDEMPOTENCIA_RESERVA_SEG (worker que
+morreu no meio) pode ser retomada por outro.
+"""
+import hashlib
+import json
+import os
+import uuid
+from datetime import datetime, timedelta
+from threading import Lock
+
+from cache import CacheTTL
+
+IDEMPOTENCIA_TTL_SEG = float(os.environ.get("FORSAKENSCAN_IDEMPOTENCIA_TTL_SEG", 24 * 3600))
+IDEMPOTENCIA_MAX = int(os.environ.get("FORSAKENSCAN_IDEMPOTENCIA_MAX", 100_000))
+IDEMPOTENCIA_RESERVA_SEG = float(os.environ.get("FORSAKENSCAN_IDEMPOTENCIA_RESERVA_SEG", 60))
+PERSISTIR = os.environ.get("FORSAKENSCAN_IDEMPOTENCIA_DB", "0") == "1"
+
+NOVA, REPETIDA, DIVERGENTE, EM_ANDAMENTO = "nova", "repetida", "divergente", "em_andamento"
+
+_cache = CacheTTL(tamanho_max=IDEMPOTENCIA_MAX, ttl=IDEMPOTENCIA_TTL_SEG)
+_em_andamento = {}      # (rota, chave) -> token da reserva ainda não concluída
+_lock = Lock()
+
+
+def impressao(corpo: dict) -> str:
+    """sha256 do corpo da requisição (detecta a mesma chave com outro corpo)"""
+    texto = json.dumps(corpo, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+def consultar(rota: str, chave: str, con=None):
+    """(impressao, resposta) guardados para a chave, ou None"""
+    item = _cache.obter((rota, chave))
+    if item is not None or not PERSISTIR or con is None:
+        return item
+    cur = con.cursor(dictionary=True, buffered=True)
+    try:
+        cur.execute("""
+            SELECT impressao, resposta
+            FROM chaves_idempotencia
+            WHERE rota = %s AND chave = %s AND criado_em >= %s AND resposta IS NOT NULL
+        """, (rota, chave, datetime.now() - timedelta(seconds=IDEMPOTENCIA_TTL_SEG)))
+        r = cur.fetchone()
+    finally:
+        cur.close()
+    if r is None:
+        return None
+    item = (r["impressao"], json.loads(r["resposta"]))
+    _cache.guardar((rota, chave), item)
+    return item
+
+
+def reservar(rota: str, chave: str, impressao_corpo: str, con=None) -> tuple:
+    """
+    Situação da chave e a resposta guardada (só em REPETIDA). Em NOVA a
+    chave fica reservada até concluir() ou liberar().
+    Com con (e PERSISTIR) a reserva é a linha da tabela, confirmada em con
+    antes de voltar – use uma conexão fora da unidade de trabalho.
+    """
+    token = uuid.uuid4().hex
+    with _lock:
+        # sob o lock: concluir() guarda no cache antes de soltar a reserva
+        item = _cache.obter((rota, chave))
+        if item is not None:
+            return (REPETIDA, item[1]) if item[0] == impressao_corpo else (DIVERGENTE, None)
+        if (rota, chave) in _em_andamento:
+            return EM_ANDAMENTO, None
+        _em_andamento[(rota, chave)] = token
+    if not PERSISTIR or con is None:
+        return NOVA, None
+    try:
+        situacao, resposta = _reservar_na_tabela(rota, chave, impressao_corpo, token, con)
+    except BaseException:
+        liberar(rota, chave)
+        raise
+    if situacao != NOVA:
+        with _lock:
+            _em_andamento.pop((rota, chave), None)
+    return situacao, resposta
+
+
+def _reservar_na_tabela(rota: str, chave: str, impressao_corpo: str, token: str, con) -> tuple:
+    """
+    INSERT da linha de reserva (nada acontece se a chave já existe) e
+    retomada de reservas abandonadas ou chaves vencidas, com commit; a linha
+    confirmada diz quem ficou com a chave.
+    """
+    agora = datetime.now()
+    cur = con.cursor(dictionary=True, buffered=True)
+    try:
+        cur.execute("""
+            INSERT INTO chaves_idempotencia (rota, chave, impressao, resposta, reserva, criado_em)
+            VALUES (%s, %s, %s, NULL, %s, %s)
+            ON DUPLICATE KEY UPDATE rota = rota
+        """, (rota, chave, impressao_corpo, token, agora))
+        cur.execute("""
+            UPDATE chaves_idempotencia
+            SET impressao = %s, resposta = NULL, reserva = %s, criado_em = %s
+            WHERE rota = %s AND chave = %s
+              AND ((resposta IS NULL AND criado_em < %s) OR criado_em < %s)
+        """, (impressao_corpo, token, agora, rota, chave,
+              agora - timedelta(seconds=IDEMPOTENCIA_RESERVA_SEG),
+              agora - timedelta(seconds=IDEMPOTENCIA_TTL_SEG)))
+        con.commit()
+        cur.execute("""
+            SELECT impressao, resposta, reserva
+            FROM chaves_idempotencia
+            WHERE rota = %s AND chave = %s
+        """, (rota, chave))
+        r = cur.fetchone()
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        cur.close()
+    if r is None or r["reserva"] == token:
+        return NOVA, None
+    if r["resposta"] is None:
+        return EM_ANDAMENTO, None
+    item = (r["impressao"], json.loads(r["resposta"]))
+    _cache.guardar((rota, chave), item)
+    return (REPETIDA, item[1]) if item[0] == impressao_corpo else (DIVERGENTE, None)
+
+
+def gravar(rota: str, chave: str, impressao_corpo: str, resposta: dict, con) -> None:
+    """
+    Grava a resposta na linha reservada (se PERSISTIR) na transação de con,
+    sem commit. Se a reserva foi retomada por outro worker levanta
+    RuntimeError – a unidade de trabalho deve ser desfeita.
+    """
+    if not PERSISTIR:
+        return
+    with _lock:
+        token = _em_andamento.get((rota, chave))
+    cur = con.cursor()
+    try:
+        cur.execute("""
+            UPDATE chaves_idempotencia
+            SET impressao = %s, resposta = %s, reserva = NULL
+            WHERE rota = %s AND chave = %s AND reserva = %s
+        """, (impressao_corpo, json.dumps(resposta, default=str), rota, chave, token))
+        if cur.rowcount != 1:
+            raise RuntimeError(f"reserva da chave de idempotência perdida: {chave}")
+    finally:
+        cur.close()
+
+
+def concluir(rota: str, chave: str, impressao_corpo: str, resposta: dict) -> None:
+    """Após o commit (na mesma thread, sem await no meio): guarda a resposta no cache e solta a reserva"""
+    with _lock:
+        _cache.guardar((rota, chave), (impressao_corpo, resposta))
+        _em_andamento.pop((rota, chave), None)
+
+
+def liberar(rota: str, chave: str, con=None) -> None:
+    """
+    Solta a reserva sem guardar nada (a requisição falhou e pode ser
+    repetida). Com con (e PERSISTIR) apaga a linha de reserva e faz commit.
+    """
+    with _lock:
+        token = _em_andamento.pop((rota, chave), None)
+    if not PERSISTIR or con is None or token is None:
+        return
+    cur = con.cursor()
+    try:
+        cur.execute("""
+            DELETE FROM chaves_idempotencia
+            WHERE rota = %s AND chave = %s AND reserva = %s AND resposta IS NULL
+        """, (rota, chave, token))
+        con.commit()
+    except Exception as e:
+        print(f"Erro ao liberar chave de idempotência: {str(e)}")
+        con.rollback()
+    finally:
+        cur.close()
+
+
+def expurgar(con) -> int:
+    """Apaga da tabela as chaves com mais de IDEMPOTENCIA_TTL_SEG e faz commit"""
+    if not PERSISTIR:
+        return 0
+    cur = con.cursor()
+    try:
+        cur.execute("DELETE FROM chaves_idempotencia WHERE criado_em < %s",
+                    (datetime.now() - timedelta(seconds=IDEMPOTENCIA_TTL_SEG),))
+        apagadas = cur.rowcount
+        con.commit()
+    except Exception as e:
+        print(f"Erro ao expurgar chaves de idempotência: {str(e)}")
+        con.rollback()
+        apagadas = 0
+    finally:
+        cur.close()
+    return apagadas
+
+
+def estatisticas() -> dict:
+    with _lock:
+        em_andamento = len(_em_andamento)
+    return {**_cache.estatisticas(), "em_andamento": em_andamento, "persistir": PERSISTIR}
@@ -0,0 +1,181 @@
+"""
+metricas.py – instrumentação do motor de fraude
+===============================================
+
+Coleta, no próprio processo, o tempo de cada regra, de cada fonte SQL e de
+cada avaliação completa, além de contagens de disparos e erros. Os tempos
+vão para histogramas de buckets fixos (em ms): registrar uma observação é
+uma busca binária e alguns incrementos sob um lock, então a coleta pode
+ficar ligada em produção.
+
+API:
+    instantaneo()            – dict com todas as métricas (usado em GET /metricas/)
+    medir_espera_pool(nome)  – tempo para obter uma conexão de um pool
+    zerar()                  – descarta o que foi coletado
+    HABILITADO               – False desliga a coleta
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+
+HABILITADO = True
+
+# Limites superiores dos buckets, em milissegundos (o último bucket é +inf)
+LIMITES_MS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+              1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class Histograma:
+    """Histograma de latências com buckets fixos e percentis aproximados"""
+
+    def __init__(self):
+        self.contagens = [0] * (len(LIMITES_MS) + 1)
+        self.total = 0
+        self.soma_ms = 0.0
+        self.max_ms = 0.0
+
+    def observar(self, ms: float) -> None:
+        self.contagens[bisect_left(LIMITES_MS, ms)] += 1
+        self.total += 1
+        self.soma_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def percentil(self, q: float) -> float:
+        """Limite superior do bucket que contém o percentil q (0–1)"""
+        if not self.total:
+            return 0.0
+        alvo, acumulado = q * self.total, 0
+        for i, n in enumerate(self.contagens):
+            acumulado += n
+            if acumulado >= alvo:
+                return min(LIMITES_MS[i], self.max_ms) if i < len(LIMITES_MS) else self.max_ms
+        return self.max_ms
+
+    def resumo(self) -> dict:
+        rotulos = [f"<={b}" for b in LIMITES_MS] + ["+inf"]
+        return {
+            "contagem": self.total,
+            "media_ms": self.soma_ms / self.total if self.total else 0.0,
+            "max_ms": self.max_ms,
+            "p50_ms": self.percentil(0.50),
+            "p95_ms": self.percentil(0.95),
+            "p99_ms": self.percentil(0.99),
+            "buckets_ms": dict(zip(rotulos, self.contagens)),
+        }
+
+
+# ------------------------------------------------------------------
+# Estado do processo
+# ------------------------------------------------------------------
+_lock = Lock()
+_regras: dict = {}       # nome -> {"tempo", "disparos", "erros"}
+_sql: dict = {}          # fonte -> {"tempo", "erros"}
+_avaliacoes: dict = {}   # tipo  -> Histograma
+_pools: dict = {}        # pool  -> {"espera", "esgotado"}
+
+
+def registrar_regra(nome: str, seg: float, disparou: bool = False, erro: bool = False) -> None:
+    if not HABILITADO:
+        return
+    with _lock:
+        m = _regras.get(nome)
+        if m is None:
+            m = _regras[nome] = {"tempo": Histograma(), "disparos": 0, "erros": 0}
+        m["tempo"].observar(seg * 1000)
+        m["disparos"] += disparou
+        m["erros"] += erro
+
+
+def registrar_sql(fonte: str, seg: float, erro: bool = False) -> None:
+    if not HABILITADO:
+        return
+    with _lock:
+        m = _sql.get(fonte)
+        if m is None:
+            m = _sql[fonte] = {"tempo": Histograma(), "erros": 0}
+        m["tempo"].observar(seg * 1000)
+        m["erros"] += erro
+
+
+def registrar_avaliacao(tipo: str, seg: float) -> None:
+    if not HABILITADO:
+        return
+    with _lock:
+        h = _avaliacoes.get(tipo)
+        if h is None:
+            h = _avaliacoes[tipo] = Histograma()
+        h.observar(seg * 1000)
+
+
+def registrar_espera_pool(pool: str, seg: float, esgotado: bool = False) -> None:
+    if not HABILITADO:
+        return
+    with _lock:
+        m = _pools.get(pool)
+        if m is None:
+            m = _pools[pool] = {"espera": Histograma(), "esgotado": 0}
+        m["espera"].observar(seg * 1000)
+        m["esgotado"] += esgotado
+
+
+@contextmanager
+def medir_sql(fonte: str):
+    """Mede o bloco como uma ida ao banco da fonte; exceções contam como erro"""
+    inicio = perf_counter()
+    try:
+        yield
+    except Exception:
+        registrar_sql(fonte, perf_counter() - inicio, erro=True)
+        raise
+    registrar_sql(fonte, perf_counter() - inicio)
+
+
+@contextmanager
+def medir_espera_pool(pool: str):
+    """Mede a retirada de uma conexão do pool; exceção (timeout) conta como esgotado"""
+    inicio = perf_counter()
+    try:
+        yield
+    except Exception:
+        registrar_espera_pool(pool, perf_counter() - inicio, esgotado=True)
+        raise
+    registrar_espera_pool(pool, perf_counter() - inicio)
+
+
+@contextmanager
+def medir_avaliacao(tipo: str):
+    """Mede uma avaliação completa (contexto + regras + escritas)"""
+    inicio = perf_counter()
+    try:
+        yield
+    finally:
+        registrar_avaliacao(tipo, perf_counter() - inicio)
+
+
+def instantaneo() -> dict:
+    """Cópia das métricas coletadas até agora"""
+    with _lock:
+        regras = {}
+        for nome, m in sorted(_regras.items()):
+            execucoes = m["tempo"].total
+            regras[nome] = {**m["tempo"].resumo(),
+                            "disparos": m["disparos"],
+                            "erros": m["erros"],
+                            "taxa_disparo": m["disparos"] / execucoes if execucoes else 0.0}
+        sql = {fonte: {**m["tempo"].resumo(), "erros": m["erros"]}
+               for fonte, m in sorted(_sql.items())}
+        avaliacoes = {tipo: h.resumo() for tipo, h in sorted(_avaliacoes.items())}
+        pools = {pool: {**m["espera"].resumo(), "esgotado": m["esgotado"]}
+                 for pool, m in sorted(_pools.items())}
+    return {"habilitado": HABILITADO, "avaliacoes": avaliacoes, "regras": regras, "sql": sql,
+            "pools": pools}
+
+
+def zerar() -> None:
+    with _lock:
+        _regras.clear()
+        _sql.clear()
+        _avaliacoes.clear()
+        _pools.clear()
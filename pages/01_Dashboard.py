@@ -13,7 +13,10 @@ if not hasattr(st, "rerun"):
 
 
 
+from backtest import backtest, carregar_historico, ranking_usuarios
 from db import get_conn, get_cursor
+import features_usuario
+from score import FEATURES as FEATURES_SCORE
 
 # ────────────────────────────────────────
 # Config
@@ -725,96 +728,93 @@ with st.expander("🕵️ Radar de Risco - Usuários Suspeitos", expanded=False)
             key="radar_periodo_suspeitos"
         )
     with col_r2:
-        min_suspeitas = st.number_input(
-            "Mínimo de transações suspeitas",
-            min_value=1,
-            value=3,
-            step=1,
-            help="Filtra apenas usuários com N ou mais transações suspeitas"
+        score_min = st.number_input(
+            "Score de risco mínimo (0–100)",
+            min_value=0,
+            max_value=100,
+            value=30,
+            step=5,
+            help="Filtra apenas usuários cuja transação de maior risco atingiu este score"
         )
 
-    # 2. Consulta para identificar usuários suspeitos
+    # 2. Ranking de usuários pelo score de risco
     if st.button("Buscar usuários suspeitos", key="btn_buscar_suspeitos"):
         
-        # Consulta para encontrar usuários com transações suspeitas
-        sql_suspeitos = """
-            SELECT 
-                u.id,
-                u.cpf,
-                COUNT(*) AS qtd_suspeitas,
-                SUM(t.valor) AS valor_total_suspeitas
-            FROM transacoes t
-            JOIN usuarios u ON u.id = t.user_id
-            WHERE t.suspeita = 1
-              AND t.data_hora >= CURDATE() - INTERVAL %s DAY
-            GROUP BY u.id, u.cpf
-            HAVING COUNT(*) >= %s
-            ORDER BY qtd_suspeitas DESC
-        """
-        
-        df_suspeitos = pd.read_sql(sql_suspeitos, conn, params=(dias_risk, min_suspeitas))
+        # Score de cada transação do período, calculado de forma vetorizada
+        # (backtest.py / score.py) – uma consulta por tabela, sem COUNT(*) por usuário
+        inicio_risk = (pd.Timestamp.today().normalize() - pd.Timedelta(days=int(dias_risk))).to_pydatetime()
+        with st.spinner("Calculando score de risco …"):
+            df_scores = backtest(carregar_historico(inicio_risk, con=conn))
+            df_suspeitos = ranking_usuarios(df_scores)
+        df_suspeitos = df_suspeitos[df_suspeitos["score_max"] >= score_min].merge(
+            df_tx[["user_id", "cpf"]].drop_duplicates("user_id"), on="user_id"
+        )
         
         if df_suspeitos.empty:
-            st.warning(f"Nenhum usuário com {min_suspeitas} ou mais transações suspeitas nos últimos {dias_risk} dias.")
+            st.warning(f"Nenhum usuário com score de risco ≥ {score_min} nos últimos {dias_risk} dias.")
             st.stop()
         
-        # 3. Seleção do usuário para análise detalhada
+        st.dataframe(
+            df_suspeitos[["cpf", "score_max", "score_medio", "qtd_suspeitas", "valor_total_suspeitas"]]
+            .rename(columns={"score_max": "Score máx.", "score_medio": "Score médio",
+                             "qtd_suspeitas": "Suspeitas", "valor_total_suspeitas": "Valor suspeitas (R$)"}),
+            use_container_width=True
+        )
+        
+        # 3. Seleção do usuário para análise detalhada (ordem do ranking)
         usuario_selecionado = st.selectbox(
             "Selecione um usuário para análise detalhada",
             df_suspeitos["cpf"].tolist(),
             key="select_suspeito"
         )
         
-        user_id = int(df_suspeitos.loc[df_suspeitos["cpf"] == usuario_selecionado, "id"].iloc[0])
+        linha_usuario = df_suspeitos.loc[df_suspeitos["cpf"] == usuario_selecionado].iloc[0]
+        user_id = int(linha_usuario["user_id"])
         
-        # 4. Métricas para o radar de risco
+        # 4. Métricas para o radar de risco – componentes do score (0–1),
+        #    maior valor de cada um no período
         with st.spinner("Calculando métricas de risco..."):
             
-            # 4.1 Alterações de perfil
-            sql_perfil = """
-                SELECT COUNT(*) AS cnt
-                FROM fatos_usuarios
-                WHERE user_id = %s
-                  AND (campo IN ('email','telefone') OR acao LIKE 'Alterar%')
-                  AND data_hora >= CURDATE() - INTERVAL %s DAY
+            # 4.1 Agregados do usuário (features_usuario) e saldo pendente – uma linha;
+            #     com a tabela defasada (stream parado), das tabelas de origem
+            sql_feat = """
+                SELECT COALESCE(f.total_compras, 0)    AS total_compras,
+                       COALESCE(f.tentativas_limite, 0) AS tentativas_limite,
+                       COALESCE(f.edicoes_perfil, 0)   AS edicoes_perfil,
+                       COALESCE(u.saldo_pendente, 0)   AS saldo
+                FROM usuarios u
+                LEFT JOIN features_usuario f ON f.user_id = u.id
+                WHERE u.id = %s
             """
-            qtd_perfil = pd.read_sql(sql_perfil, conn, params=(user_id, dias_risk))["cnt"].iloc[0]
-            
-            # 4.2 Total de compras
-            sql_comp = """
-                SELECT COALESCE(SUM(COALESCE(valor_total, valor_unit * COALESCE(qtd,1))),0) AS total
-                FROM compras_online
-                WHERE user_id = %s
-                  AND data_hora >= CURDATE() - INTERVAL %s DAY
-            """
-            total_comp = pd.read_sql(sql_comp, conn, params=(user_id, dias_risk))["total"].iloc[0]
-            
-            # 4.3 Saldo pendente
-            sql_saldo = "SELECT COALESCE(saldo_pendente,0) AS saldo FROM usuarios WHERE id = %s"
-            saldo_pend = pd.read_sql(sql_saldo, conn, params=(user_id,))["saldo"].iloc[0]
-            
-            # 4.4 Transações suspeitas
-            qtd_suspeitas = int(df_suspeitos.loc[df_suspeitos["cpf"] == usuario_selecionado, "qtd_suspeitas"])
-            
-            # 4.5 Valor total de transações suspeitas
-            valor_suspeitas = float(df_suspeitos.loc[df_suspeitos["cpf"] == usuario_selecionado, "valor_total_suspeitas"])
+            cur_feat = get_cursor(dictionary=True, buffered=True)
+            try:
+                if not features_usuario.atualizada(cur_feat):
+                    sql_feat = """
+                        SELECT (SELECT COALESCE(SUM(COALESCE(valor_total, valor_unit * COALESCE(qtd, 1))), 0)
+                                FROM compras_online WHERE user_id = u.id)       AS total_compras,
+                               (SELECT COUNT(*) FROM tentativas_limite
+                                WHERE user_id = u.id)                           AS tentativas_limite,
+                               (SELECT COUNT(*) FROM fatos_usuarios
+                                WHERE user_id = u.id AND acao = 'editar_perfil') AS edicoes_perfil,
+                               COALESCE(u.saldo_pendente, 0)                    AS saldo
+                        FROM usuarios u
+                        WHERE u.id = %s
+                    """
+            finally:
+                cur_feat.close()
+            feat = pd.read_sql(sql_feat, conn, params=(user_id,)).iloc[0]
             
             # 5. Montagem do DataFrame para o radar
+            rotulos = {
+                "velocidade": "Velocidade (5 min)",
+                "razao_limite": "Uso do limite do turno",
+                "edicoes_perfil": "Alterações de perfil",
+                "falhas_login": "Falhas de login",
+                "cashin_saque": "Cash-In → Saque rápido",
+            }
             df_radar = pd.DataFrame({
-                "theta": [
-                    "Alterações de perfil", 
-                    "Total compras (R$)", 
-                    "Saldo pendente (R$)",
-                    "Transações suspeitas",
-                    "Valor suspeitas (R$)"
-                ],
-                "r": [
-                    qtd_perfil, 
-                    total_comp, 
-                    saldo_pend,
-                    qtd_suspeitas,
-                    valor_suspeitas
-                ]
+                "theta": [rotulos[f] for f in FEATURES_SCORE],
+                "r": [float(linha_usuario[f]) for f in FEATURES_SCORE],
             })
             
             # 6. Radar Chart
@@ -826,20 +826,31 @@ with st.expander("🕵️ Radar de Risco - Usuários Suspeitos", expanded=False)
                 line_close=True,
                 markers=True,
                 color_discrete_sequence=px.colors.qualitative.Set2,
-                title=f"Radar de risco para {usuario_selecionado} (últimos {dias_risk}d)",
+                title=f"Radar de risco para {usuario_selecionado} – score {linha_usuario['score_max']:.0f} (últimos {dias_risk}d)",
             )
             fig_radar.update_traces(fill="toself")
             fig_radar.update_layout(
-                legend_title_text="Métrica",
+                legend_title_text="Componente",
                 polar=dict(
-                    radialaxis=dict(visible=True, tickangle=45)
+                    radialaxis=dict(visible=True, range=[0, 1], tickangle=45)
                 )
             )
             st.plotly_chart(fig_radar, use_container_width=True)
             
             # 7. Tabela com valores detalhados
             st.markdown("**Valores das métricas**")
-            df_display = df_radar.set_index("theta").rename(columns={"r": "Valor"})
+            df_display = pd.concat([
+                df_radar.set_index("theta")["r"],
+                pd.Series({
+                    "Score máximo": linha_usuario["score_max"],
+                    "Transações suspeitas": linha_usuario["qtd_suspeitas"],
+                    "Valor suspeitas (R$)": linha_usuario["valor_total_suspeitas"],
+                    "Total compras – histórico (R$)": feat["total_compras"],
+                    "Tentativas de exceder limite – histórico": feat["tentativas_limite"],
+                    "Edições de perfil – histórico": feat["edicoes_perfil"],
+                    "Saldo pendente (R$)": feat["saldo"],
+                }),
+            ]).to_frame("Valor")
             st.dataframe(df_display, use_container_width=True)
             
             # 8. Lista de transações suspeitas
@@ -78,6 +78,7 @@ with aba_limites:
             # Corrigido: Criar cursor antes de usar
             cursor = conn.cursor()
             try:
+                from fraude import invalidar_limites, publicar_limites
                 cursor.execute("""
                     INSERT INTO limites_usuario (user_id, limite_dia, limite_noite)
                     VALUES (%s, %s, %s)
@@ -85,7 +86,9 @@ with aba_limites:
                     limite_dia = VALUES(limite_dia),
                     limite_noite = VALUES(limite_noite)
                 """, (user_id, limite_dia, limite_noite))
+                publicar_limites(cursor)
                 conn.commit()
+                invalidar_limites(user_id)
                 st.success("Limites atualizados com sucesso!")
             except Exception as e:
                 conn.rollback()
@@ -927,44 +930,73 @@ with aba_risco:
     """)
 
     # 1) Consulta consolidada ----------------------------------------------------------
+    #    Agregados por usuário já materializados (features_usuario.py); com a
+    #    tabela defasada (stream parado) são calculados das tabelas de origem
+    import features_usuario
     sql_risco = """
-    WITH fraudes AS (
-        SELECT user_id, COUNT(*) AS qtd_fraudes, SUM(valor) AS valor_fraudes
-        FROM transacoes
-        WHERE suspeita = 1
-        GROUP BY user_id
-    ),
-    tentativas AS (
-        SELECT user_id, COUNT(*) AS tentativas_limite
-        FROM tentativas_limite
-        GROUP BY user_id
-    ),
-    hist AS (
-        SELECT user_id,
-               SUM(acao='BLOQUEIO')     AS bloqueios,
-               SUM(acao='DESBLOQUEIO')  AS desbloqueios
-        FROM historico_bloqueios
-        GROUP BY user_id
-    )
     SELECT u.id                AS user_id,
            u.username, u.nome, u.banco, u.cidade, u.estado,
-           COALESCE(f.qtd_fraudes, 0)        AS fraudes,
-           COALESCE(f.valor_fraudes, 0)      AS valor_fraudes,
-           COALESCE(t.tentativas_limite, 0)  AS tentativas_limite,
-           COALESCE(h.bloqueios, 0)          AS bloqueios,
-           COALESCE(h.desbloqueios, 0)       AS desbloqueios,
+           COALESCE(f.qtd_suspeitas, 0)      AS fraudes,
+           COALESCE(f.valor_suspeitas, 0)    AS valor_fraudes,
+           COALESCE(f.tentativas_limite, 0)  AS tentativas_limite,
+           COALESCE(f.bloqueios, 0)          AS bloqueios,
+           COALESCE(f.desbloqueios, 0)       AS desbloqueios,
            u.conta_bloqueada,
            u.saldo_pendente
     FROM usuarios u
-    LEFT JOIN fraudes     f ON f.user_id = u.id
-    LEFT JOIN tentativas  t ON t.user_id = u.id
-    LEFT JOIN hist        h ON h.user_id = u.id
-    WHERE f.qtd_fraudes IS NOT NULL
-       OR t.tentativas_limite IS NOT NULL
+    LEFT JOIN features_usuario f ON f.user_id = u.id
+    WHERE f.qtd_suspeitas > 0
+       OR f.tentativas_limite > 0
        OR u.saldo_pendente IS NOT NULL
-    ORDER BY f.qtd_fraudes DESC, t.tentativas_limite DESC
+    ORDER BY fraudes DESC, tentativas_limite DESC
     LIMIT 50;
     """
+    cur_feat = get_cursor(dictionary=True, buffered=True)
+    try:
+        defasada = not features_usuario.atualizada(cur_feat)
+    finally:
+        cur_feat.close()
+    if defasada:
+        st.caption("ℹ️ features_usuario defasada (stream_transacoes.py parado?) – "
+                   "agregados calculados das tabelas de origem.")
+        sql_risco = """
+        WITH fraudes AS (
+            SELECT user_id, COUNT(*) AS qtd_fraudes, SUM(valor) AS valor_fraudes
+            FROM transacoes
+            WHERE suspeita = 1
+            GROUP BY user_id
+        ),
+        tentativas AS (
+            SELECT user_id, COUNT(*) AS tentativas_limite
+            FROM tentativas_limite
+            GROUP BY user_id
+        ),
+        hist AS (
+            SELECT user_id,
+                   SUM(acao='BLOQUEIO')     AS bloqueios,
+                   SUM(acao='DESBLOQUEIO')  AS desbloqueios
+            FROM historico_bloqueios
+            GROUP BY user_id
+        )
+        SELECT u.id                AS user_id,
+               u.username, u.nome, u.banco, u.cidade, u.estado,
+               COALESCE(f.qtd_fraudes, 0)        AS fraudes,
+               COALESCE(f.valor_fraudes, 0)      AS valor_fraudes,
+               COALESCE(t.tentativas_limite, 0)  AS tentativas_limite,
+               COALESCE(h.bloqueios, 0)          AS bloqueios,
+               COALESCE(h.desbloqueios, 0)       AS desbloqueios,
+               u.conta_bloqueada,
+               u.saldo_pendente
+        FROM usuarios u
+        LEFT JOIN fraudes     f ON f.user_id = u.id
+        LEFT JOIN tentativas  t ON t.user_id = u.id
+        LEFT JOIN hist        h ON h.user_id = u.id
+        WHERE f.qtd_fraudes IS NOT NULL
+           OR t.tentativas_limite IS NOT NULL
+           OR u.saldo_pendente IS NOT NULL
+        ORDER BY fraudes DESC, tentativas_limite DESC
+        LIMIT 50;
+        """
 
     df_risco = pd.read_sql(sql_risco, conn)
 
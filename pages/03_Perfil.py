@@ -12,7 +12,7 @@ conn   = get_conn()
                  # <- NOVO
 cursor = get_cursor(dictionary=True, buffered=True)     # <- NOVO
 
-from fraude import avaliar_transacao
+from fraude import avaliar_transacao, confirmar_aceitas, registrar_aceitas
 
 
 # ------------------------------------------------------------------
@@ -194,11 +194,11 @@ with tab_transf:
             if pwd != cursor.fetchone()["senha"]:
                 st.error("Senha incorreta."); st.stop()
                 
-            tx = {"user_id": user_id, "valor": valor, "data_hora": datetime.now()}
-            suspeita, motivo = avaliar_transacao(tx)
-
             # Boleto depósito
             if forma == "Boleto depósito":
+                tx = {"user_id": user_id, "valor": valor, "data_hora": datetime.now(),
+                      "tipo_transacao": "Cash-In"}
+                suspeita, motivo = avaliar_transacao(tx)
                 codigo = barcode44(); venc = prox_uteis(3)
                 try:
                     cursor.execute("""
@@ -247,6 +247,13 @@ with tab_transf:
             cod = uuid4().hex[:10]
             banco_rem = "Conta Corrente"
 
+            # avaliada com o codigo e o destinatário do par, para o grafo de
+            # transferências medir a aresta que ela vai criar (regra 08)
+            tx = {"user_id": user_id, "valor": valor, "data_hora": datetime.now(),
+                  "tipo_transacao": "Transferência" if dest else "Pagamento",
+                  "codigo": cod, "destino_id": dest["id"] if dest else None}
+            suspeita, motivo = avaliar_transacao(tx)
+
             try:
                 cursor.execute("""
                 INSERT INTO transacoes
@@ -256,12 +263,15 @@ with tab_transf:
                     (%s,%s,%s,%s,%s,NOW(),'On-line',%s,%s,%s,%s)
                 """,(
                     user_id, valor,
-                    "Transferência" if dest else "Pagamento",
+                    tx["tipo_transacao"],
                     forma, cod,
                     banco_rem,
                     dest["banco"] if dest else "Estabelecimento",
                     suspeita, motivo
                 ))
+                # o gasto entra no total do turno no mesmo commit da transação
+                aceitas = [{**tx, "id": cursor.lastrowid}]
+                registrar_aceitas(aceitas, conn)
 
                 if dest:
                     cursor.execute("""
@@ -276,8 +286,12 @@ with tab_transf:
                         banco_rem, dest["banco"],
                         suspeita, motivo
                     ))
+                    aceitas.append({"id": cursor.lastrowid, "user_id": dest["id"], "valor": valor,
+                                    "tipo_transacao": "Recebimento", "codigo": cod,
+                                    "data_hora": tx["data_hora"]})
                 
                 conn.commit()
+                confirmar_aceitas(aceitas)
                 registrar_fato("Pagamento", f"{forma} {fmt_moeda(valor)}")
                 
                 # Mostrar comprovante
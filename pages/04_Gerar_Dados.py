@@ -112,8 +112,12 @@ def gerar_usuarios(qtd: int = 3_000) -> None:
         lim_noite = round(lim_dia / 2, 2)
         data_lim.append((uid, round(renda * 3, 2), lim_dia, lim_noite))
 
+    from fraude import invalidar_limites, publicar_limites
     cur.executemany(insert_lim, data_lim)
+    publicar_limites(cur)
     conn.commit()
+
+    invalidar_limites()
     st.success("✅ Usuários e limites gerados com sucesso!")
 
 # ─────────────────────────  2) TRANSAÇÕES + COMPRAS  ─────────────────────────
@@ -0,0 +1,86 @@
+"""
+score.py – score numérico de risco (0–100) ao lado das regras booleanas
+=======================================================================
+
+Cada transação vira um vetor de features com os mesmos dados que as regras
+já leem no contexto de risco:
+
+  velocidade     – transações do usuário nos 5 min anteriores (regra 02)
+  razao_limite   – (total do turno + valor) / limite do turno (regra 01)
+  edicoes_perfil – e-mail/telefone alterados em 1 h + senhas em 7 dias (04/05)
+  falhas_login   – logins falhos em 30 min (regra 03)
+  cashin_saque   – saque/transferência logo após um Cash-In de valor
+                   parecido: (1 − minutos/60) × min(valor/depósito, 1) (07)
+
+Cada feature é dividida pela sua ESCALA (o ponto em que a regra
+correspondente dispara) e limitada a [0, 1]; o score é a média ponderada
+por PESOS × 100. Tudo em NumPy: um lote inteiro é pontuado com uma única
+operação de matriz (n × len(FEATURES)) · PESOS.
+
+Usado por fraude.avaliar_lote_com_score (ao vivo) e pelo backtest.py
+(histórico – ranking de usuários no Dashboard).
+"""
+import numpy as np
+
+FEATURES = ("velocidade", "razao_limite", "edicoes_perfil", "falhas_login", "cashin_saque")
+ESCALAS = np.array([4.0, 1.0, 3.0, 3.0, 1.0])        # valor em que a feature satura
+PESOS = np.array([0.25, 0.30, 0.15, 0.15, 0.15])      # soma 1
+
+CASHIN_JANELA_MIN = 60   # depois disso o Cash-In anterior não pesa mais
+
+
+def features(tx_5min, valor, total_turno, limite, edicoes, falhas,
+             cashin_minutos, cashin_valor, saque) -> np.ndarray:
+    """
+    Matriz (n × len(FEATURES)) a partir de colunas já alinhadas por transação.
+    cashin_minutos/cashin_valor: NaN quando não há Cash-In na última hora;
+    saque: máscara booleana de Saque/Transferência.
+    """
+    valor = np.asarray(valor, dtype=float)
+    limite = np.asarray(limite, dtype=float)
+    minutos = np.asarray(cashin_minutos, dtype=float)
+    deposito = np.asarray(cashin_valor, dtype=float)
+
+    razao = (np.asarray(total_turno, dtype=float) + valor) / np.where(limite > 0, limite, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        proximidade = np.clip(1 - minutos / CASHIN_JANELA_MIN, 0, 1)
+        parecido = np.clip(valor / deposito, 0, 1)
+    cashin_saque = np.where(np.asarray(saque, dtype=bool) & ~np.isnan(minutos),
+                            proximidade * parecido, 0.0)
+    return np.nan_to_num(np.column_stack([
+        np.asarray(tx_5min, dtype=float),
+        razao,
+        np.asarray(edicoes, dtype=float),
+        np.asarray(falhas, dtype=float),
+        cashin_saque,
+    ]), nan=0.0)
+
+
+def componentes(f: np.ndarray) -> np.ndarray:
+    """Features normalizadas pela ESCALA e limitadas a [0, 1]"""
+    return np.clip(f / ESCALAS, 0.0, 1.0)
+
+
+def pontuar(f: np.ndarray) -> np.ndarray:
+    """Score 0–100 de cada linha da matriz de features"""
+    return 100.0 * componentes(f) @ PESOS
+
+
+def features_contextos(txs: list, ctxs: list) -> np.ndarray:
+    """Matriz de features de transações do motor e seus contextos de risco"""
+    n = len(txs)
+    tx_5min, valor, total, limite, edicoes, falhas = (np.empty(n) for _ in range(6))
+    minutos, deposito = np.full(n, np.nan), np.full(n, np.nan)
+    saque = np.zeros(n, dtype=bool)
+    for i, (tx, ctx) in enumerate(zip(txs, ctxs)):
+        tx_5min[i] = ctx["tx_5min"]
+        valor[i] = float(tx["valor"])
+        total[i] = ctx["total_turno"]
+        limite[i] = (ctx["limite_dia"] if ctx["turno"] == "dia" else ctx["limite_noite"]) or np.nan
+        edicoes[i] = ctx["edicoes_sensiveis_1h"] + ctx["senhas_7d"]
+        falhas[i] = ctx["falhas_login_30min"]
+        saque[i] = tx.get("tipo_transacao") in ("Saque", "Transferência")
+        if ctx["ultimo_cashin"]:
+            minutos[i] = ctx["ultimo_cashin"]["minutos"]
+            deposito[i] = ctx["ultimo_cashin"]["valor"]
+    return features(tx_5min, valor, total, limite, edicoes, falhas, minutos, deposito, saque)
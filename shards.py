@@ -0,0 +1,222 @@
+"""
+shards.py – avaliação de fraude em vários processos, particionada por user_id
+=============================================================================
+
+O estado do motor (janelas de velocidade, totais de turno, cache de limites)
+é por usuário e vive em globais de fraude/turnos/velocidade. Em vez de
+compartilhá-lo entre threads, este módulo sobe N processos (shards) e manda
+cada transação ao shard hash(user_id) % N: cada processo guarda em memória
+só os usuários do seu shard – sem cache duplicado nem lock entre processos –
+e a vazão do motor cresce com os núcleos.
+
+    import shards
+    shards.iniciar(4)
+    veredictos = shards.avaliar_lote(txs)     # mesma ordem de txs
+    shards.encerrar()
+
+Cada shard é um ProcessPoolExecutor de um único processo (spawn), então as
+transações de um usuário sempre caem no mesmo processo, na ordem de envio.
+Os shards abrem as próprias conexões com o backend do processo roteador
+(FORSAKENSCAN_DB; um SQLite ":memory:" não pode ser compartilhado).
+
+As regras que cruzam usuários – usuários distintos por IP (regra 02) e o
+grafo de transferências (regra 08) – ficam no processo roteador, que
+manda as contagens prontas junto com a tx (fraude._usuarios_ip /
+fraude._grafo); cada shard só reconstrói a janela por usuário dos seus
+usuários. Como em fraude, avaliar não muda estado: quem grava as
+transações chama confirmar_aceitas após o commit. As tentativas de
+exceder limite de um lote voltam ao roteador, que as grava na transação
+de quem chamou (con), como fraude.avaliar_lote.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+from threading import Lock
+
+import numpy as np
+
+import auditoria
+import fraude
+import grafo_transferencias
+import score
+import turnos
+import velocidade
+from db import armazenamento
+
+N_SHARDS = int(os.environ.get("FORSAKENSCAN_SHARDS", 0)) or os.cpu_count() or 1
+
+_shards = []
+_lock = Lock()
+
+
+# ------------------------------------------------------------------
+# Lado do shard – funções executadas dentro de cada processo
+# ------------------------------------------------------------------
+def _iniciar_processo(banco: str, ate_id: int, indice: int, n: int) -> None:
+    os.environ["FORSAKENSCAN_DB"] = banco
+    fraude.iniciar_janelas(ate_id, shard=(indice, n))
+
+def _avaliar_lote(txs: list, paralelo: bool, parar_no_bloqueio: bool, com_score: bool,
+                  anteriores: list) -> tuple:
+    """(veredictos, scores ou None, linhas de tentativas_limite a gravar pelo roteador)"""
+    tentativas = []
+    veredictos, ctxs = fraude._avaliar_lote(txs, paralelo, parar_no_bloqueio,
+                                            anteriores=anteriores, tentativas=tentativas)
+    scores = score.pontuar(score.features_contextos(txs, ctxs)).tolist() if com_score else None
+    return veredictos, scores, tentativas
+
+def _avaliar_transacao(tx: dict, paralelo: bool, parar_no_bloqueio: bool):
+    return fraude.avaliar_transacao(tx, paralelo, parar_no_bloqueio)
+
+def _confirmar_aceitas(txs: list) -> None:
+    # como fraude.confirmar_aceitas, sem o grafo (fica no roteador)
+    for tx in txs:
+        velocidade.registrar(tx)
+    turnos.esquecer([linha for linha in map(turnos.incremento, txs) if linha])
+
+def _metricas() -> dict:
+    return {"pid": os.getpid(), **fraude.metricas_motor()}
+
+def _descarregar() -> None:
+    auditoria.descarregar()
+
+
+# ------------------------------------------------------------------
+# Lado do roteador
+# ------------------------------------------------------------------
+def _banco() -> str:
+    """FORSAKENSCAN_DB equivalente ao backend ativo deste processo"""
+    atual = armazenamento()
+    if atual.nome != "sqlite":
+        return os.environ.get("FORSAKENSCAN_DB", "mysql")
+    if atual.caminho == ":memory:":
+        raise ValueError("shards precisam de um banco compartilhado: use FORSAKENSCAN_DB=sqlite:/caminho.db")
+    return f"sqlite:{atual.caminho}"
+
+def iniciar(n: int = None, ate_id: int = None) -> int:
+    """
+    Sobe n processos (padrão N_SHARDS) e reconstrói as janelas de velocidade
+    – em cada shard só as dos seus usuários – e, no roteador, também a por
+    IP e o grafo (só até ate_id, se informado – ver fraude.iniciar_janelas).
+    Devolve a quantidade de shards.
+    """
+    encerrar()
+    n = n or N_SHARDS
+    banco = _banco()
+    contexto = get_context("spawn")
+    novos = [ProcessPoolExecutor(max_workers=1, mp_context=contexto,
+                                 initializer=_iniciar_processo, initargs=(banco, ate_id, i, n))
+             for i in range(n)]
+    for shard in novos:
+        shard.submit(int).result()   # espera o processo subir e reconstruir as janelas
+    fraude.iniciar_janelas(ate_id)
+    with _lock:
+        _shards[:] = novos
+    return n
+
+def encerrar() -> None:
+    """Descarrega a auditoria de cada shard e encerra os processos"""
+    with _lock:
+        antigos, _shards[:] = list(_shards), []
+    for shard in antigos:
+        try:
+            shard.submit(_descarregar).result()
+        except Exception as e:
+            print(f"Erro ao descarregar auditoria do shard: {str(e)}")
+        shard.shutdown()
+
+def shard_de(user_id, n: int = None) -> int:
+    """Índice do shard do usuário entre n (padrão: os shards iniciados)"""
+    n = n or len(_shards)
+    if not n:
+        raise RuntimeError("shards não iniciados: chame shards.iniciar()")
+    return hash(user_id) % n
+
+def _com_contagens(txs: list, anteriores: list = ()) -> list:
+    """
+    Cópias das txs com a contagem de usuários por IP e as métricas do grafo
+    de transferências do roteador; as anteriores e cada tx contam para as
+    seguintes só dentro do lote, como em fraude.avaliar_lote.
+    """
+    agora = datetime.now()
+    janelas, grafo = velocidade.Lote(), grafo_transferencias.Lote()
+    for tx in anteriores:
+        janelas.registrar(tx)
+        grafo_transferencias.registrar(tx, grafo)
+    copias = []
+    for tx in txs:
+        copias.append({**tx, "usuarios_ip_5min": velocidade.usuarios_ip(tx.get("ip"), agora, janelas),
+                       "grafo": grafo_transferencias.medir(tx, agora, grafo)})
+        janelas.registrar(tx)
+        grafo_transferencias.registrar(tx, grafo)
+    return copias
+
+def _particionar(txs: list) -> dict:
+    """{shard: [(posição em txs, tx), ...]} preservando a ordem de cada shard"""
+    partes = {}
+    for i, tx in enumerate(txs):
+        partes.setdefault(shard_de(tx["user_id"]), []).append((i, tx))
+    return partes
+
+def _avaliar_particionado(txs: list, paralelo: bool, parar_no_bloqueio: bool,
+                          com_score: bool, anteriores: list = (), con=None) -> tuple:
+    veredictos, scores, tentativas = [None] * len(txs), [0.0] * len(txs), []
+    anteriores_de = _particionar(anteriores)
+    futuros = [(itens, _shards[s].submit(_avaliar_lote, [tx for _, tx in itens],
+                                         paralelo, parar_no_bloqueio, com_score,
+                                         [tx for _, tx in anteriores_de.get(s, ())]))
+               for s, itens in _particionar(_com_contagens(txs, anteriores)).items()]
+    for itens, futuro in futuros:
+        parte, parte_scores, parte_tentativas = futuro.result()
+        tentativas.extend(parte_tentativas)
+        for j, (i, _) in enumerate(itens):
+            veredictos[i] = parte[j]
+            if com_score:
+                scores[i] = parte_scores[j]
+    fraude._gravar_tentativas(tentativas, con)
+    return veredictos, scores
+
+def avaliar_lote(txs: list, paralelo: bool = False, parar_no_bloqueio: bool = False,
+                 anteriores: list = (), con=None) -> list:
+    """
+    Como fraude.avaliar_lote, com cada usuário avaliado no seu shard; os
+    shards trabalham ao mesmo tempo. Retorna os veredictos na ordem de txs.
+    con: só as tentativas de exceder limite são gravadas nela (sem commit);
+    o contexto os shards leem nas próprias conexões.
+    """
+    if not txs:
+        return []
+    return _avaliar_particionado(txs, paralelo, parar_no_bloqueio, False, anteriores, con)[0]
+
+def avaliar_lote_com_score(txs: list, paralelo: bool = False, parar_no_bloqueio: bool = False,
+                           anteriores: list = (), con=None) -> tuple:
+    """Como fraude.avaliar_lote_com_score: (veredictos, np.ndarray de scores)"""
+    if not txs:
+        return [], np.array([])
+    veredictos, scores = _avaliar_particionado(txs, paralelo, parar_no_bloqueio, True,
+                                               anteriores, con)
+    return veredictos, np.array(scores)
+
+def avaliar_transacao(tx: dict, paralelo: bool = False, parar_no_bloqueio: bool = False):
+    """Como fraude.avaliar_transacao, no shard do usuário"""
+    copia = _com_contagens([tx])[0]
+    shard = _shards[shard_de(copia["user_id"])]
+    return shard.submit(_avaliar_transacao, copia, paralelo, parar_no_bloqueio).result()
+
+def confirmar_aceitas(txs: list) -> None:
+    """
+    Após o commit de quem gravou as txs: entram nas janelas e no grafo do
+    roteador e nas janelas (e totais de turno relidos) do shard de cada
+    usuário – também as avaliadas por outro caminho, ex.: a API.
+    """
+    if not txs:
+        return
+    for tx in txs:
+        fraude.registrar_janelas(tx)
+    for s, itens in _particionar(txs).items():
+        _shards[s].submit(_confirmar_aceitas, [tx for _, tx in itens]).result()
+
+def metricas() -> list:
+    """metricas_motor() de cada shard, com o pid do processo"""
+    return [shard.submit(_metricas).result() for shard in list(_shards)]
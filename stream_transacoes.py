@@ -0,0 +1,198 @@
+"""
+stream_transacoes.py – avaliação contínua das transações gravadas fora da API
+=============================================================================
+
+As páginas Streamlit (03_Perfil, 04_Gerar_Dados) gravam direto em
+`transacoes`. Este worker acompanha a tabela pelo `id` (auto-incremento,
+sempre crescente) em micro-lotes:
+
+  1. lê as linhas com id maior que a posição salva em `posicao_stream` e
+     as que apareceram em lacunas de lotes anteriores (ver ler_lote);
+  2. as ainda não avaliadas (motivo_suspeita IS NULL – a API e o Perfil
+     sempre gravam o motivo, vazio quando limpa) passam por
+     fraude.avaliar_lote; as demais só entram nas janelas de velocidade e
+     no grafo de transferências;
+  3. grava suspeita/motivo_suspeita, as fraudes em `fraudes_detectadas`,
+     o gasto nos totais de turno, os agregados de features_usuario, as
+     lacunas e a nova posição no mesmo commit.
+
+A cada volta também soma em features_usuario as linhas novas das tabelas
+de auditoria (ver features_usuario.acompanhar).
+
+Na primeira execução a posição começa no maior id atual (reavaliar o
+histórico é papel do backtest.py); --desde-inicio processa tudo.
+
+Uma linha cujo INSERT é confirmado depois de outra com id maior já
+processada – normal com a API gravando em paralelo, já que a unidade de
+trabalho mantém o INSERT aberto até o commit – deixa um buraco abaixo da
+posição: o id vai para lacunas_stream e é procurado de novo a cada volta
+por até features_usuario.LACUNA_SEG (depois disso, foi rollback).
+
+Com --shards N cada micro-lote é avaliado em N processos, particionado por
+user_id (ver shards).
+
+Uso:
+    python stream_transacoes.py [--lote 1000] [--intervalo 0.5] [--desde-inicio] [--shards N]
+"""
+import argparse
+from time import monotonic, sleep
+
+import auditoria
+import features_usuario
+import fraude
+import shards
+from db import get_conn
+
+CONSUMIDOR = "motor_fraude"
+LOTE = 1000
+INTERVALO_SEG = 0.5
+
+
+def ler_posicao(cur, desde_inicio: bool = False) -> int:
+    """Último id processado; cria a posição na primeira execução"""
+    cur.execute("SELECT ultimo_id FROM posicao_stream WHERE consumidor = %s", (CONSUMIDOR,))
+    r = cur.fetchone()
+    if r:
+        return r["ultimo_id"]
+    ultimo = 0
+    if not desde_inicio:
+        cur.execute("SELECT COALESCE(MAX(id), 0) AS ultimo FROM transacoes")
+        ultimo = cur.fetchone()["ultimo"]
+    cur.execute("INSERT INTO posicao_stream (consumidor, ultimo_id) VALUES (%s, %s)",
+                (CONSUMIDOR, ultimo))
+    get_conn().commit()
+    return ultimo
+
+
+COLUNAS = "id, user_id, valor, tipo_transacao, codigo, data_hora, motivo_suspeita"
+
+
+def ler_lote(cur, ultimo: int, lote: int = LOTE) -> list:
+    """
+    Linhas do próximo micro-lote, em ordem de id: as que apareceram em
+    lacunas (ids abaixo de `ultimo` que faltavam quando a posição passou
+    por eles) e até `lote` com id maior que `ultimo`.
+    """
+    ids = features_usuario.recuperar_lacunas(cur, CONSUMIDOR, "transacoes")
+    recuperadas = []
+    if ids:
+        cur.execute(f"""
+            SELECT {COLUNAS}
+            FROM transacoes
+            WHERE id IN ({",".join(["%s"] * len(ids))})
+            ORDER BY id
+        """, tuple(ids))
+        recuperadas = cur.fetchall()
+    cur.execute(f"""
+        SELECT {COLUNAS}
+        FROM transacoes
+        WHERE id > %s
+        ORDER BY id
+        LIMIT %s
+    """, (ultimo, lote))
+    return recuperadas + cur.fetchall()
+
+
+def processar_lote(cur, linhas: list, ultimo: int, com_shards: bool = False) -> int:
+    """
+    Avalia as linhas pendentes do lote e grava os veredictos, as fraudes, o
+    gasto nos totais de turno, os agregados de features_usuario, as lacunas
+    e a nova posição em um único commit – se algo falhar, o lote é refeito
+    do zero sem contar nada duas vezes. `ultimo` é a posição antes do lote:
+    linhas com id até ela vieram de lacunas. Retorna a quantidade de suspeitas.
+    """
+    conn = get_conn()
+    pendentes = [r for r in linhas if r["motivo_suspeita"] is None]
+    avaliadas = [r for r in linhas if r["motivo_suspeita"] is not None]
+    if com_shards:
+        veredictos = shards.avaliar_lote(pendentes, anteriores=avaliadas, con=conn)
+    else:
+        veredictos = fraude.avaliar_lote(pendentes, con=conn, anteriores=avaliadas)
+
+    limpas = [r["id"] for r, (suspeita, _) in zip(pendentes, veredictos) if not suspeita]
+    suspeitas = [(motivo[:255], r["id"])
+                 for r, (suspeita, motivo) in zip(pendentes, veredictos) if suspeita]
+    if limpas:
+        cur.execute(f"""
+            UPDATE transacoes SET motivo_suspeita = ''
+            WHERE id IN ({",".join(["%s"] * len(limpas))})
+        """, tuple(limpas))
+    if suspeitas:
+        cur.executemany("""
+            UPDATE transacoes SET suspeita = 1, motivo_suspeita = %s
+            WHERE id = %s
+        """, suspeitas)
+        fraude.registrar_fraudes([(tx_id, motivo) for motivo, tx_id in suspeitas], conn)
+    fraude.registrar_aceitas(pendentes, conn)
+    features_usuario.somar_ids(cur, "transacoes", [r["id"] for r in linhas])
+    features_usuario.esquecer_lacunas(cur, CONSUMIDOR, [r["id"] for r in linhas if r["id"] <= ultimo])
+    novas = [r["id"] for r in linhas if r["id"] > ultimo]
+    if novas:
+        features_usuario.gravar_lacunas(cur, CONSUMIDOR, ultimo, novas[-1], novas)
+        cur.execute("UPDATE posicao_stream SET ultimo_id = %s, atualizado_em = NOW() WHERE consumidor = %s",
+                    (novas[-1], CONSUMIDOR))
+    conn.commit()
+    (shards if com_shards else fraude).confirmar_aceitas(linhas)
+    return len(suspeitas)
+
+
+def executar(lote: int = LOTE, intervalo: float = INTERVALO_SEG, desde_inicio: bool = False,
+             n_shards: int = 0):
+    """Laço principal: lê, avalia e avança a posição até Ctrl+C"""
+    conn = get_conn()
+    cur = conn.cursor(dictionary=True, buffered=True)
+    ultimo = ler_posicao(cur, desde_inicio)
+    features_usuario.garantir(cur, ultimo)
+    if n_shards:
+        shards.iniciar(n_shards, ate_id=ultimo)
+    else:
+        fraude.iniciar_janelas(ate_id=ultimo)
+    print(f"Stream iniciado após o id {ultimo}" + (f" ({n_shards} shards)" if n_shards else ""))
+
+    total, inicio = 0, monotonic()
+    try:
+        while True:
+            conn.commit()   # encerra o snapshot (REPEATABLE READ) para enxergar linhas novas
+            try:
+                features_usuario.acompanhar(cur)
+            except Exception as e:
+                print(f"Erro ao atualizar features_usuario: {str(e)}")
+                conn.rollback()
+            try:
+                linhas = ler_lote(cur, ultimo, lote)
+                if not linhas:
+                    conn.commit()   # lacunas expiradas
+                    sleep(intervalo)
+                    continue
+                suspeitas = processar_lote(cur, linhas, ultimo, bool(n_shards))
+            except Exception as e:
+                print(f"Erro ao processar lote após o id {ultimo}: {str(e)}")
+                conn.rollback()
+                sleep(intervalo)
+                continue
+            ultimo = max(ultimo, linhas[-1]["id"])
+            total += len(linhas)
+            print(f"{len(linhas)} transações até o id {ultimo} ({suspeitas} suspeitas) – "
+                  f"{total / (monotonic() - inicio):,.0f}/s")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shards.encerrar()
+        auditoria.descarregar()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Avaliação contínua de transacoes pelo id")
+    ap.add_argument("--lote", type=int, default=LOTE, help="linhas por micro-lote")
+    ap.add_argument("--intervalo", type=float, default=INTERVALO_SEG,
+                    help="espera (s) quando não há linhas novas")
+    ap.add_argument("--desde-inicio", action="store_true",
+                    help="na primeira execução processa a tabela toda")
+    ap.add_argument("--shards", type=int, default=0,
+                    help="processos de avaliação, particionados por user_id (0 = no próprio processo)")
+    args = ap.parse_args()
+    executar(args.lote, args.intervalo, args.desde_inicio, args.shards)
+
+
+if __name__ == "__main__":
+    main()
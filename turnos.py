@@ -0,0 +1,230 @@
+"""
+turnos.py – acumuladores incrementais de gasto por turno (regra #01)
+====================================================================
+
+Mantém o total gasto por (usuário, turno) em memória, apoiado na tabela
+resumo `totais_turno`. O turno é identificado pelo seu instante de início,
+então a virada às 06:00 (H_INI_DIA) e às 23:00 (H_INI_NOITE) abre uma chave
+nova automaticamente – a regra #01 vira uma busca por chave em vez de um
+`SUM` sobre `transacoes`.
+
+Na primeira consulta de um turno o total vem da tabela resumo; se ela ainda
+não tiver a linha (ex.: transações inseridas pelo gerador), o total é
+calculado uma única vez a partir de `transacoes` e gravado na tabela.
+
+A tabela resumo é a fonte da verdade, incrementada atomicamente por todos
+os processos (workers da API, stream, Perfil) – e só por quem grava a
+transação, na mesma transação do INSERT (ver registrar). O total em
+memória vale por TTL_SEG: depois disso é relido da tabela pela chave
+primária, então cada processo enxerga os incrementos dos outros com no
+máximo esse atraso; os do próprio processo descartam a entrada após o
+commit (ver esquecer).
+"""
+import os
+from datetime import datetime, time, timedelta
+from threading import Lock
+from time import monotonic
+
+import metricas
+from db import com_orcamento, get_conn
+
+H_INI_DIA, H_FIM_DIA = time(6, 0), time(22,59,59)
+H_INI_NOITE, H_FIM_NOITE = time(23, 0), time(5,59,59)
+
+TIPOS_TURNO = ("Compra", "Pagamento", "Transferência", "Saque", "PIX")
+
+TTL_SEG = float(os.environ.get("FORSAKENSCAN_TURNOS_TTL_SEG", 1.0))   # validade do total em memória
+
+
+def turno(dt: datetime) -> str:
+    """Determina se é turno dia ou noite (dia = [H_INI_DIA, H_INI_NOITE), com os microssegundos)"""
+    return "dia" if H_INI_DIA <= dt.time() < H_INI_NOITE else "noite"
+
+
+def janela_turno(dt: datetime) -> tuple:
+    """Devolve (turno, início, fim) do turno que contém dt; fim é exclusivo"""
+    dia = dt.date()
+    if turno(dt) == "dia":
+        return ("dia", datetime.combine(dia, H_INI_DIA),
+                datetime.combine(dia, H_INI_NOITE))
+    if dt.time() >= H_INI_NOITE:
+        inicio = datetime.combine(dia, H_INI_NOITE)
+    else:
+        inicio = datetime.combine(dia - timedelta(days=1), H_INI_NOITE)
+    return "noite", inicio, datetime.combine(inicio.date() + timedelta(days=1), H_INI_DIA)
+
+
+# ------------------------------------------------------------------
+# Estado do processo: {user_id: {início_do_turno: (total, lido_em)}}
+# ------------------------------------------------------------------
+_lock = Lock()
+_totais: dict = {}
+
+
+def _guardar(user_id: int, inicio: datetime, total: float) -> None:
+    """Guarda o total lido agora e descarta turnos com mais de um dia"""
+    turnos_usr = _totais.setdefault(user_id, {})
+    turnos_usr[inicio] = (total, monotonic())
+    for antigo in [i for i in turnos_usr if i < inicio - timedelta(days=1)]:
+        del turnos_usr[antigo]
+
+
+def _vigente(user_id: int, inicio: datetime):
+    """Total em memória ainda dentro do TTL; senão None"""
+    item = _totais.get(user_id, {}).get(inicio)
+    if item is None or monotonic() - item[1] > TTL_SEG:
+        return None
+    return item[0]
+
+
+def carregar(pares, con=None, excluir_ids=(), confirmar: bool = True,
+             orcamento_ms: float = None) -> None:
+    """
+    Garante em memória os totais dos pares (user_id, início_do_turno).
+    Os ausentes ou vencidos (TTL_SEG) são lidos da tabela resumo e, se nem lá existirem,
+    agregados de `transacoes` – uma consulta por fonte para todos os pares.
+    con: conexão exclusiva (threads); por padrão usa a conexão global.
+    excluir_ids: transações já gravadas mas ainda não avaliadas, que não
+    entram na agregação (serão somadas ao serem registradas).
+    confirmar=False: não faz commit – a escrita fica na transação de con
+    (unidade de trabalho de quem chamou).
+    orcamento_ms: limite de cada SELECT no servidor (MAX_EXECUTION_TIME).
+    """
+    with _lock:
+        faltando = {(u, i) for u, i in pares if _vigente(u, i) is None}
+    if not faltando:
+        return
+
+    conn = con or get_conn()
+    cur = conn.cursor(dictionary=True, buffered=True)
+    try:
+        with metricas.medir_sql("totais_turno"):
+            linhas = sorted(faltando)
+            cur.execute(com_orcamento(f"""
+                SELECT user_id, inicio_turno, total
+                FROM totais_turno
+                WHERE (user_id, inicio_turno) IN ({",".join(["(%s,%s)"] * len(linhas))})
+            """, orcamento_ms), tuple(v for par in linhas for v in par))
+            encontrados = {(r["user_id"], r["inicio_turno"]): float(r["total"])
+                           for r in cur.fetchall()}
+
+            calcular = [par for par in linhas if par not in encontrados]
+            if calcular:
+                user_ids = sorted({u for u, _ in calcular})
+                janelas = {janela_turno(i)[1:] for _, i in calcular}
+                excluir = sorted(excluir_ids)
+                sem_ids = f"AND id NOT IN ({','.join(['%s'] * len(excluir))})" if excluir else ""
+                cur.execute(com_orcamento(f"""
+                    SELECT user_id, valor, data_hora
+                    FROM transacoes
+                    WHERE user_id IN ({",".join(["%s"] * len(user_ids))})
+                      AND data_hora >= %s
+                      AND data_hora < %s
+                      AND tipo_transacao IN ({",".join(["%s"] * len(TIPOS_TURNO))})
+                      {sem_ids}
+                """, orcamento_ms), (*user_ids, min(i for i, _ in janelas), max(f for _, f in janelas),
+                      *TIPOS_TURNO, *excluir))
+                somas = dict.fromkeys(calcular, 0.0)
+                for r in cur.fetchall():
+                    par = (r["user_id"], janela_turno(r["data_hora"])[1])
+                    if par in somas:
+                        somas[par] += float(r["valor"])
+                cur.executemany("""
+                    INSERT INTO totais_turno (user_id, inicio_turno, turno, total)
+                    VALUES (%s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE total = total
+                """, [(u, i, turno(i), t) for (u, i), t in somas.items()])
+                if confirmar:
+                    conn.commit()
+                encontrados.update(somas)
+    finally:
+        cur.close()
+
+    with _lock:
+        for (u, i), total in encontrados.items():
+            _guardar(u, i, total)
+
+
+def em_memoria(user_id: int, dt: datetime):
+    """Total do turno que contém dt se estiver em memória e dentro do TTL; senão None"""
+    with _lock:
+        return _vigente(user_id, janela_turno(dt)[1])
+
+
+def total(user_id: int, dt: datetime, con=None, confirmar: bool = True,
+          orcamento_ms: float = None) -> float:
+    """Total já gasto pelo usuário no turno que contém dt"""
+    inicio = janela_turno(dt)[1]
+    carregar([(user_id, inicio)], con, confirmar=confirmar, orcamento_ms=orcamento_ms)
+    with _lock:
+        item = _totais.get(user_id, {}).get(inicio)
+    return item[0] if item else 0.0
+
+
+def incremento(tx: dict):
+    """
+    Linha (user_id, início, turno, valor) que a transação soma na tabela
+    resumo (ver gravar) ou None se o tipo não conta para o limite.
+    """
+    if tx.get("tipo_transacao") not in TIPOS_TURNO:
+        return None
+    turno_tx, inicio, _ = janela_turno(tx["data_hora"])
+    return tx["user_id"], inicio, turno_tx, float(tx["valor"])
+
+
+def gravar(linhas: list, con=None, confirmar: bool = True) -> None:
+    """Incrementa a tabela resumo com linhas de incremento(), um upsert por (usuário, turno)"""
+    por_turno = {}
+    for user_id, inicio, turno_tx, valor in linhas:
+        chave = (user_id, inicio, turno_tx)
+        por_turno[chave] = por_turno.get(chave, 0.0) + valor
+    if not por_turno:
+        return
+
+    conn = con or get_conn()
+    cur = conn.cursor()
+    try:
+        with metricas.medir_sql("totais_turno_upsert"):
+            cur.executemany("""
+                INSERT INTO totais_turno (user_id, inicio_turno, turno, total)
+                VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE total = total + VALUES(total)
+            """, [(*chave, valor) for chave, valor in por_turno.items()])
+            if confirmar:
+                conn.commit()
+    finally:
+        cur.close()
+
+
+def registrar(txs: list, con=None, confirmar: bool = True) -> None:
+    """
+    Soma na tabela resumo as transações já gravadas em `transacoes` (com
+    "id"). Chame na transação do INSERT: com confirmar=False nada é
+    confirmado aqui e, após o commit de quem chamou, esquecer() descarta os
+    totais em memória. Turnos ainda sem linha na tabela são antes agregados
+    de `transacoes` sem essas transações.
+    """
+    linhas = [l for l in map(incremento, txs) if l]
+    if not linhas:
+        return
+    carregar({(u, i) for u, i, _, _ in linhas}, con,
+             [tx["id"] for tx in txs if tx.get("id") is not None], confirmar=confirmar)
+    gravar(linhas, con, confirmar)
+    if confirmar:
+        esquecer(linhas)
+
+
+def esquecer(linhas) -> None:
+    """
+    Descarta da memória os turnos das linhas (user_id, início, …) – após um
+    incremento confirmado, o próximo uso relê o total pela chave primária.
+    """
+    with _lock:
+        for user_id, inicio, *_ in linhas:
+            _totais.get(user_id, {}).pop(inicio, None)
+
+
+def limpar() -> None:
+    """Esquece os totais em memória (serão recarregados da tabela resumo)"""
+    with _lock:
+        _totais.clear()
@@ -0,0 +1,217 @@
+"""
+velocidade.py – janelas deslizantes em memória para a regra #02
+===============================================================
+
+Mantém, por usuário e por IP, os instantes das transações aceitas nos
+últimos minutos (deques de timestamps com expiração automática). O motor
+registra cada transação avaliada e a regra #02 consulta as contagens em
+O(1) amortizado, sem `COUNT(*)` nem `transacoes JOIN logs` por transação.
+
+Na inicialização a estrutura é reconstruída a partir dos últimos 5 minutos
+de `transacoes`/`logs` (ver reconstruir).
+
+Só entram transações já gravadas (fraude.confirmar_aceitas, após o commit).
+Dentro de um lote, as anteriores ainda não confirmadas contam para as
+seguintes por um Lote, sem tocar o estado do processo.
+
+Obs.: o estado é do processo. Com vários workers uvicorn cada um enxerga
+apenas as transações que ele próprio confirmou desde a reconstrução – nem
+as dos outros workers, nem as do Perfil e do gerador. Por isso o motor lê
+também as contagens do banco na consulta de contexto que já faz (sem ida
+extra ao banco) e as passa em `banco`: vale a maior das duas, mais as do
+lote (ver tx_usuario e usuarios_ip).
+"""
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from threading import Lock
+
+JANELA = timedelta(minutes=5)
+TIPOS_VELOCIDADE = ("Compra", "Pagamento", "Transferência")
+
+
+def _inserir_ordenado(d: deque, item: tuple) -> None:
+    """Anexa item ao deque mantendo a ordem por instante (chegadas fora de ordem são raras)"""
+    if not d or item[0] >= d[-1][0]:
+        d.append(item)
+        return
+    i = len(d)
+    while i > 0 and d[i - 1][0] > item[0]:
+        i -= 1
+    d.insert(i, item)
+
+
+class JanelaContagem:
+    """Quantidade de eventos por chave dentro da janela"""
+
+    def __init__(self, duracao: timedelta = JANELA):
+        self.duracao = duracao
+        self._eventos: dict = {}
+
+    def _expirar(self, chave, agora: datetime) -> None:
+        d = self._eventos.get(chave)
+        if d is None:
+            return
+        limite = agora - self.duracao
+        while d and d[0][0] < limite:
+            d.popleft()
+        if not d:
+            del self._eventos[chave]
+
+    def registrar(self, chave, dt: datetime) -> None:
+        _inserir_ordenado(self._eventos.setdefault(chave, deque()), (dt,))
+
+    def contar(self, chave, agora: datetime) -> int:
+        self._expirar(chave, agora)
+        return len(self._eventos.get(chave, ()))
+
+    def limpar(self) -> None:
+        self._eventos.clear()
+
+
+class JanelaDistintos:
+    """Quantidade de membros distintos por chave dentro da janela"""
+
+    def __init__(self, duracao: timedelta = JANELA):
+        self.duracao = duracao
+        self._eventos: dict = {}
+        self._membros: dict = {}
+
+    def _expirar(self, chave, agora: datetime) -> None:
+        d = self._eventos.get(chave)
+        if d is None:
+            return
+        membros = self._membros[chave]
+        limite = agora - self.duracao
+        while d and d[0][0] < limite:
+            _, membro = d.popleft()
+            membros[membro] -= 1
+            if not membros[membro]:
+                del membros[membro]
+        if not d:
+            del self._eventos[chave]
+            del self._membros[chave]
+
+    def registrar(self, chave, membro, dt: datetime) -> None:
+        _inserir_ordenado(self._eventos.setdefault(chave, deque()), (dt, membro))
+        self._membros.setdefault(chave, Counter())[membro] += 1
+
+    def contar(self, chave, agora: datetime) -> int:
+        self._expirar(chave, agora)
+        return len(self._membros.get(chave, ()))
+
+    def contem(self, chave, membro, agora: datetime) -> bool:
+        self._expirar(chave, agora)
+        return membro in self._membros.get(chave, ())
+
+    def membros(self, chave, agora: datetime) -> list:
+        self._expirar(chave, agora)
+        return list(self._membros.get(chave, ()))
+
+    def limpar(self) -> None:
+        self._eventos.clear()
+        self._membros.clear()
+
+
+# ------------------------------------------------------------------
+# Estado do processo
+# ------------------------------------------------------------------
+_lock = Lock()
+_por_usuario = JanelaContagem()
+_por_ip = JanelaDistintos()
+
+
+def registrar(tx: dict) -> None:
+    """Registra uma transação aceita (ignora tipos que a regra #02 não conta)"""
+    if tx.get("tipo_transacao") not in TIPOS_VELOCIDADE:
+        return
+    with _lock:
+        _por_usuario.registrar(tx["user_id"], tx["data_hora"])
+        if tx.get("ip"):
+            _por_ip.registrar(tx["ip"], tx["user_id"], tx["data_hora"])
+
+
+class Lote:
+    """
+    Transações de um lote já avaliadas mas ainda não confirmadas: contam nas
+    janelas para as próximas avaliações do próprio lote (tx_usuario e
+    usuarios_ip com lote=…); o estado do processo não muda.
+    """
+
+    def __init__(self):
+        self._por_usuario = JanelaContagem()
+        self._por_ip = JanelaDistintos()
+
+    def registrar(self, tx: dict) -> None:
+        if tx.get("tipo_transacao") not in TIPOS_VELOCIDADE:
+            return
+        self._por_usuario.registrar(tx["user_id"], tx["data_hora"])
+        if tx.get("ip"):
+            self._por_ip.registrar(tx["ip"], tx["user_id"], tx["data_hora"])
+
+
+def tx_usuario(user_id: int, agora: datetime, lote: Lote = None, banco: int = 0) -> int:
+    """
+    Transações do usuário dentro da janela (mais as do lote, se informado).
+    banco: contagem das gravadas lida do banco (todos os processos) – vale
+    a maior entre ela e a da janela do processo.
+    """
+    extra = lote._por_usuario.contar(user_id, agora) if lote is not None else 0
+    with _lock:
+        return max(_por_usuario.contar(user_id, agora), banco) + extra
+
+
+def usuarios_ip(ip, agora: datetime, lote: Lote = None, banco: int = 0) -> int:
+    """Usuários distintos que transacionaram a partir do IP dentro da janela (banco: como em tx_usuario)"""
+    if not ip:
+        return 0
+    membros = lote._por_ip.membros(ip, agora) if lote is not None else ()
+    with _lock:
+        return max(_por_ip.contar(ip, agora), banco) + sum(
+            1 for m in membros if not _por_ip.contem(ip, m, agora))
+
+
+def reconstruir(cursor, ate_id: int = None, do_usuario=None, por_ip: bool = True) -> None:
+    """
+    Recarrega as janelas com os últimos 5 minutos do banco.
+    `cursor` deve ser um cursor dictionary=True.
+    ate_id: considera só transações com id <= ate_id (as seguintes serão
+    registradas quando forem avaliadas – ver stream_transacoes).
+    do_usuario: função user_id -> bool; só esses usuários entram na janela
+    por usuário (None = todos). por_ip=False deixa a janela por IP vazia
+    (ex.: nos shards, onde ela fica no roteador).
+    """
+    inicio = datetime.now() - JANELA
+    marcadores = ",".join(["%s"] * len(TIPOS_VELOCIDADE))
+    ate = "AND t.id <= %s" if ate_id is not None else ""
+    extra = (ate_id,) if ate_id is not None else ()
+    cursor.execute(f"""
+        SELECT t.user_id, t.data_hora
+        FROM transacoes t
+        WHERE t.data_hora >= %s
+          AND t.tipo_transacao IN ({marcadores})
+          {ate}
+        ORDER BY t.data_hora
+    """, (inicio, *TIPOS_VELOCIDADE, *extra))
+    por_usuario = [r for r in cursor.fetchall() if do_usuario is None or do_usuario(r["user_id"])]
+    linhas_ip = []
+    if por_ip:
+        cursor.execute(f"""
+            SELECT DISTINCT l.ip, t.user_id, t.data_hora
+            FROM transacoes t
+            JOIN logs l ON l.user_id = t.user_id
+            WHERE t.data_hora >= %s
+              AND t.tipo_transacao IN ({marcadores})
+              AND l.ip IS NOT NULL
+              AND l.data_hora >= %s
+              {ate}
+            ORDER BY t.data_hora
+        """, (inicio, *TIPOS_VELOCIDADE, inicio, *extra))
+        linhas_ip = cursor.fetchall()
+
+    with _lock:
+        _por_usuario.limpar()
+        _por_ip.limpar()
+        for r in por_usuario:
+            _por_usuario.registrar(r["user_id"], r["data_hora"])
+        for r in linhas_ip:
+            _por_ip.registrar(r["ip"], r["user_id"], r["data_hora"])